@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import json
+import os
+import tempfile
+from typing import Any
+
+
+def atomic_write_json(path: str, data: Any, indent: int | None = None) -> None:
+    """Writes data to path as JSON, so that a crash at any point leaves
+    either the old file or the new one behind, never half of one.
+
+    The data goes to a temporary file of its own next to path (so writers
+    never share one), is flushed to disk, and only then renamed over path.
+    Raises OSError (or TypeError, for data JSON can't hold) if that fails;
+    the temporary file is cleaned up either way.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".tmp", dir=directory)
+
+    try:
+        with os.fdopen(fd, "w") as temp_file:
+            json.dump(data, temp_file, indent=indent)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
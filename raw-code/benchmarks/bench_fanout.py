@@ -0,0 +1,81 @@
+"""Measures what every extra Discord instance costs when one process fans
+its presence out to all of them (see multi_pipe): per-update latency, memory
+and renders/API calls, for 1 to 8 fake Discord IPC sockets. Linux/macOS
+only; no config.json or network needed:
+
+    python benchmarks/bench_fanout.py
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import custom_presence
+from config import parse_config
+from custom_presence import EnhancedRPC
+from fake_discord import FakeDiscord
+from harness import bench_config
+from outbound import UpdateCoalescer
+
+PIPES = (1, 2, 4, 8)
+UPDATES = 300
+
+
+def measure(pipes: int) -> None:
+    directory = tempfile.mkdtemp(prefix="bench-fanout-")
+    os.environ["XDG_RUNTIME_DIR"] = directory
+    discords = [FakeDiscord(directory, pipe).start() for pipe in range(pipes)]
+
+    weather_calls = []
+    custom_presence.configure(parse_config(bench_config(directory, weather_cache={"source": "current"})))
+    custom_presence.WEATHER_CACHE.fetcher = lambda city: weather_calls.append(city) or {
+        "temp": {"feels_like": 10.0, "temp_min": 9.0, "temp_nax": 13.0, "temp": 11.0},
+        "weather": {"description": "light rain", "main": "Rain"},
+        "meta": {"city": city, "country": "CA"}
+    }
+    custom_presence.get_current_weather("Toronto")
+    EnhancedRPC.tooltip_helper()  # warm-up
+    custom_presence.make_transport("warm-up")  # imports the transport, so that doesn't count as the client's memory
+
+    try:
+        # What the client (and a session per pipe) keeps around
+        tracemalloc.start()
+        client = EnhancedRPC()
+        client.connect()
+        footprint, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # No rate limit, so every update is a real write
+        client.outbound = UpdateCoalescer(capacity=UPDATES)
+
+        timings = []
+        for i in range(UPDATES):
+            start = time.perf_counter()
+            client.update(details=f"Update {i}")
+            timings.append(time.perf_counter() - start)
+
+        for session in client.transport.sessions.values():
+            session.flush()
+
+        frames = [discord.frames for discord in discords]
+        client.close()
+    finally:
+        for discord in discords:
+            discord.stop()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    print(f"{pipes} pipe(s): median update {statistics.median(timings) * 1e6:6.1f} us, "
+          f"client holds {footprint / 1024:5.1f} KiB, {len(weather_calls)} weather call(s), "
+          f"frames per pipe {min(frames)}-{max(frames)}")
+
+
+if __name__ == "__main__":
+    for count in PIPES:
+        measure(count)
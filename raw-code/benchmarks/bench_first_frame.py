@@ -0,0 +1,119 @@
+"""Measures time to first frame: how long after launching daemon.py the first
+SET_ACTIVITY reaches Discord (a local fake), from a fresh interpreter. Runs
+once with a warm weather cache (as after a restart) and once with a cold one.
+
+Each run gets a throwaway working directory with its own config.json, so no
+real credentials are needed; nothing is logged in to Spotify either, which
+doesn't matter since the first frame is always the default presence. Also
+prints the slowest imports of daemon.py, from python -X importtime.
+
+Linux/macOS only. Takes the raw-code directory to measure, this one by
+default, so an older checkout can be compared against:
+
+    python benchmarks/bench_first_frame.py [path/to/raw-code]
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fake_discord import FakeDiscord
+from harness import bench_config
+
+RAW_CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUNDS = 5
+TIMEOUT = 15.0
+
+WEATHER = {
+    "temp": {"feels_like": 10.2, "temp_min": 9.0, "temp_nax": 13.1, "temp": 11.6},
+    "weather": {"description": "light rain", "main": "Rain"},
+    "meta": {"city": "Toronto", "country": "CA"}
+}
+
+
+def make_workdir(warm: bool) -> str:
+    """Returns a fresh working directory with a config.json, and a freshly
+    fetched weather cache if warm."""
+    directory = tempfile.mkdtemp(prefix="bench-first-frame-")
+
+    with open(os.path.join(directory, "config.json"), "w") as config_file:
+        json.dump(bench_config(directory, weather_cache={"source": "current"}), config_file)
+
+    if warm:
+        with open(os.path.join(directory, "weather_cache.json"), "w") as cache_file:
+            json.dump({"Toronto": {"fetched_at": time.time(), "source": "current", "value": WEATHER}}, cache_file)
+
+    return directory
+
+
+def first_frame(raw_code: str, warm: bool) -> float:
+    """Launches daemon.py and returns the seconds until its first activity
+    shows up on the fake Discord."""
+    directory = make_workdir(warm)
+
+    with FakeDiscord() as discord:
+        env = {**os.environ, "XDG_RUNTIME_DIR": discord.directory}
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, os.path.join(raw_code, "daemon.py")], cwd=directory,
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        try:
+            while not discord.activities:
+                if time.perf_counter() - started > TIMEOUT or process.poll() is not None:
+                    raise RuntimeError("no frame from daemon.py")
+                time.sleep(0.001)
+
+            return time.perf_counter() - started
+        finally:
+            process.send_signal(signal.SIGTERM)
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+def slowest_imports(raw_code: str, count: int = 8) -> list[tuple[int, str]]:
+    """Returns the slowest top-level imports of daemon.py (cumulative
+    microseconds, module), from python -X importtime."""
+    directory = make_workdir(warm=True)
+    env = {**os.environ, "PYTHONPATH": raw_code}
+
+    try:
+        stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", "import daemon"], cwd=directory,
+                                env=env, capture_output=True, text=True, check=True).stderr
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Nesting is shown by indentation; keep what daemon.py imports
+        # directly, with everything under it
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("     "):
+            imports.append((int(cumulative), name.strip()))
+
+    return sorted(imports, reverse=True)[:count]
+
+
+if __name__ == "__main__":
+    raw_code = os.path.abspath(sys.argv[1]) if len(sys.argv) > 1 else RAW_CODE
+
+    for warm in (True, False):
+        timings = [first_frame(raw_code, warm) for _ in range(ROUNDS)]
+        print(f"{'warm' if warm else 'cold'} weather cache: median {statistics.median(timings) * 1000:7.1f} ms, "
+              f"max {max(timings) * 1000:7.1f} ms to first frame")
+
+    print("slowest imports of daemon.py:")
+    for microseconds, name in slowest_imports(raw_code):
+        print(f"  {microseconds / 1000:7.1f} ms  {name}")
@@ -0,0 +1,69 @@
+"""Compares per-update latency and memory allocations of pypresence's
+Presence with the native IPCPresence transport, against a local fake
+Discord IPC socket. Linux/macOS only:
+
+    python benchmarks/bench_ipc.py
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_discord import FakeDiscord
+
+UPDATES = 500
+
+
+def run_updates(client, wait) -> tuple[list[float], float]:
+    """Sends UPDATES distinct activities. Returns the latency of each call,
+    and the total time until every one of them was answered (wait is called
+    after the last update, so pipelined writes are counted)."""
+    timings = []
+    start_all = time.perf_counter()
+
+    for i in range(UPDATES):
+        start = time.perf_counter()
+        client.update(state=f"It is {i}", details="12°C, Light Rain", start=1700000000,
+                      large_image="image", large_text="Sunday, October 18th")
+        timings.append(time.perf_counter() - start)
+
+    wait()
+    return timings, time.perf_counter() - start_all
+
+
+def measure(name: str, client, wait) -> None:
+    client.connect()
+    run_updates(client, wait)  # warm-up
+
+    tracemalloc.start()
+    timings, total = run_updates(client, wait)
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+    client.close()
+
+    print(f"{name:>10}: median call {statistics.median(timings) * 1e6:7.1f} us, "
+          f"all answered after {total * 1000:7.1f} ms, peak {peak / 1024:7.1f} KiB, "
+          f"{blocks} live blocks after run")
+
+
+if __name__ == "__main__":
+    from pypresence import Presence
+    from discord_ipc import IPCPresence
+
+    with FakeDiscord() as discord:
+        os.environ["XDG_RUNTIME_DIR"] = discord.directory
+
+        measure("pypresence", Presence("1"), lambda: None)
+
+        native = IPCPresence("1")
+        measure("native", native, native.flush)
+
+        print(f"{discord.frames} frames received by the fake Discord")
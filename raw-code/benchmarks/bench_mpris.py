@@ -0,0 +1,59 @@
+"""Measures how quickly a track change reaches MPRISSource: from the player
+emitting PropertiesChanged to on_change firing, and to poll() returning the
+new track. Runs against a fake player on a private dbus-daemon (Linux, needs
+dbus-daemon and jeepney). Run from the raw-code directory:
+
+    python benchmarks/bench_mpris.py
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_mpris import FakePlayer, PrivateBus
+from playback_sources import MPRISSource
+
+ROUNDS = 200
+
+
+def main() -> None:
+    with PrivateBus() as bus:
+        source = MPRISSource("spotify", bus=bus.address)
+        changed = threading.Event()
+        source.on_change = changed.set
+
+        with FakePlayer(bus.address) as player:
+            # Wait for NameOwnerChanged to come through
+            changed.wait(5)
+            assert source.available, "MPRISSource never saw the player"
+
+            signal_latency, poll_latency = [], []
+
+            for n in range(ROUNDS):
+                changed.clear()
+                start = time.perf_counter()
+                player.play(f"{n:022d}", f"Track {n}", ["Artist"])
+
+                changed.wait(5)
+                signalled = time.perf_counter()
+                track = source.poll()
+                polled = time.perf_counter()
+
+                assert track is not None and track.id == f"{n:022d}", track
+                signal_latency.append(signalled - start)
+                poll_latency.append(polled - start)
+
+        source.close()
+
+    for name, samples in (("signal", signal_latency), ("signal + poll", poll_latency)):
+        print(f"{name:>14}: median {statistics.median(samples) * 1000:.3f} ms, "
+              f"max {max(samples) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
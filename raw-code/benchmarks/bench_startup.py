@@ -0,0 +1,72 @@
+"""Compares the startup time and resident memory of the tray mode with the
+headless daemon. Each mode is started in a fresh interpreter, up to the
+point where it would start running the engine: the tray mode imports
+event_loop, PyQt6 and win11toast (Windows only, skipped elsewhere) and
+builds its QApplication and tray icon; the daemon only imports daemon.py.
+
+Needs a config.json in the working directory, like the app itself. Qt is run
+with the offscreen platform, so no display is needed. Run from the raw-code
+directory:
+
+    python benchmarks/bench_startup.py
+"""
+from __future__ import annotations
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+RAW_CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROUNDS = 5
+
+_MEASURE = """
+import json, resource, sys, threading, time
+started = time.perf_counter()
+{body}
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                  "qt_loaded": any(name.startswith("PyQt6") for name in sys.modules)}}))
+"""
+
+MODES = {
+    "tray": """
+try:
+    import win11toast
+except ImportError:
+    # Windows only; measure the Qt part anyway
+    import types
+    sys.modules["win11toast"] = types.SimpleNamespace(toast=print)
+import event_loop
+from PyQt6.QtWidgets import QApplication
+app = QApplication([])
+tray = event_loop.tray_icon_application_builder(app, threading.Event())
+""",
+    "daemon": """
+import daemon
+"""
+}
+
+
+def measure(body: str) -> dict:
+    env = {**os.environ, "PYTHONPATH": RAW_CODE, "QT_QPA_PLATFORM": "offscreen"}
+    output = subprocess.run([sys.executable, "-c", _MEASURE.format(body=body)], env=env,
+                            capture_output=True, text=True, check=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    for name, body in MODES.items():
+        try:
+            runs = [measure(body) for _ in range(ROUNDS)]
+        except subprocess.CalledProcessError as e:
+            print(f"{name:>6}: failed to start ({e.stderr.strip().splitlines()[-1]})")
+            continue
+
+        seconds = statistics.median(run["seconds"] for run in runs)
+        rss = statistics.median(run["max_rss_kb"] for run in runs) / 1024
+
+        print(f"{name:>6}: {seconds * 1000:7.1f} ms to start, {rss:6.1f} MB peak RSS, "
+              f"Qt loaded: {runs[0]['qt_loaded']}")
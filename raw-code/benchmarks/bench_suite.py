@@ -0,0 +1,234 @@
+"""The regression benchmark: replays a trace of what Spotify and OpenWeather
+answered over a session (see traces) through the whole presence engine, on
+a VirtualClock, against local stand-ins for all three upstreams: the fake
+Discord IPC socket and an HTTP stub serving the trace (see http_stub). Runs
+offline, on Linux/macOS, with no config.json or accounts needed.
+
+Reports the per-update latency (render and IPC write), the render cost of
+tooltip_helper and currently_playing_helper, the IPC frames and API calls
+per hour, and the peak RSS. With --check, compares them against
+benchmarks/baselines.json and exits with 1 on a regression. Run from the
+raw-code directory:
+
+    python benchmarks/bench_suite.py run [--trace PATH] [--hours H] [--check | --update-baseline]
+    python benchmarks/bench_suite.py record MINUTES [--out PATH]    # next to a config.json; real accounts
+    python benchmarks/bench_suite.py synthesize [--out PATH]
+
+Timings depend on the machine: after moving to another one, record a new
+baseline there with --update-baseline.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import custom_presence
+from custom_presence import EnhancedRPC, SpotifyRPC
+from harness import Simulation
+from http_stub import TraceServer
+from providers import DefaultProvider, ProviderRegistry, SpotifyProvider
+from track_state import TrackState
+from traces import TraceRecorder, load_trace, save_trace, synthesize_day
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_TRACE = os.path.join(BENCHMARKS, "traces", "sample_day.json")
+BASELINES = os.path.join(BENCHMARKS, "baselines.json")
+
+RENDER_NUMBER = 20000
+
+# How far each metric may move from its baseline before it counts as a
+# regression: timings are noisy, counts are deterministic on a VirtualClock.
+# "max" metrics only regress upwards; "band" ones in both directions (fewer
+# frames than expected is as much a bug as more).
+TOLERANCES = {
+    "update_p50_ms": ("max", 1.0),
+    "update_p95_ms": ("max", 1.0),
+    "tooltip_helper_us": ("max", 1.0),
+    "currently_playing_helper_us": ("max", 1.0),
+    "ipc_frames_per_hour": ("band", 0.05),
+    "spotify_calls_per_hour": ("band", 0.05),
+    "weather_calls_per_hour": ("band", 0.25),
+    "peak_rss_mb": ("max", 0.25)
+}
+
+
+def write_token(path: str) -> None:
+    """A token spotipy takes as valid (it checks expiry against the real
+    time) for long enough that nothing ever refreshes it."""
+    with open(path, "w") as token_file:
+        json.dump({"access_token": "bench", "token_type": "Bearer", "expires_in": 3600, "refresh_token": "bench",
+                   "scope": "user-read-currently-playing", "expires_at": int(time.time()) + 10 * 365 * 86400},
+                  token_file)
+
+
+def replay(trace: dict, hours: float | None = None, latency_scale: float = 0.0) -> dict[str, float]:
+    """Runs the engine through the given trace (all of it by default) and
+    returns the per-update latencies and what it sent and fetched."""
+    hours = trace["duration"] / 3600 if hours is None else hours
+
+    with (Simulation(trace["started_at"], metadata={"playback_source": "web_api"}, state={"enabled": False})
+          as simulation, TraceServer(trace, simulation.clock.time, latency_scale) as server):
+        write_token(simulation.config["spotify_api"]["token_cache"])
+        server.redirect(custom_presence.get_http_session())
+
+        engine = simulation.build(ProviderRegistry(DefaultProvider(), SpotifyProvider(SpotifyRPC())))
+
+        # Every update: rendering the presence and writing it out
+        timings = []
+        show = engine.connections.show
+
+        def timed_show(client) -> None:
+            start = time.perf_counter()
+            try:
+                show(client)
+            finally:
+                timings.append(time.perf_counter() - start)
+
+        engine.connections.show = timed_show
+        results = simulation.run(hours)
+
+    timings.sort()
+    return {
+        "updates": len(timings),
+        "update_p50_ms": statistics.median(timings) * 1000 if timings else 0.0,
+        "update_p95_ms": timings[int(len(timings) * 0.95)] * 1000 if timings else 0.0,
+        "ipc_frames_per_hour": results["ipc_frames"] / hours,
+        "spotify_calls_per_hour": server.calls.get("spotify", 0) / hours,
+        "weather_calls_per_hour": (server.calls.get("forecast", 0) + server.calls.get("weather", 0)) / hours
+    }
+
+
+def bench_render() -> dict[str, float]:
+    """Per-call cost of rendering each presence's text, from a fixed
+    snapshot. Runs against whatever config is loaded (see replay)."""
+    fields = custom_presence.take_snapshot().fields()
+    spotify = SpotifyRPC()
+    track = TrackState(id="0" * 22, name="Track 0", artists=("Scripted Artist",),
+                       progress=60000, duration=183000, is_playing=True)
+
+    spotify.currently_playing_helper(fields, track)  # warm-up (track cache)
+
+    tooltip = timeit.timeit(lambda: EnhancedRPC.tooltip_helper(fields), number=RENDER_NUMBER)
+    playing = timeit.timeit(lambda: spotify.currently_playing_helper(fields, track), number=RENDER_NUMBER)
+
+    return {"tooltip_helper_us": tooltip / RENDER_NUMBER * 1e6,
+            "currently_playing_helper_us": playing / RENDER_NUMBER * 1e6}
+
+
+def regressions(results: dict[str, float], baselines: dict[str, float]) -> list[str]:
+    """Returns a line for every metric that moved past its tolerance."""
+    found = []
+
+    for name, (kind, tolerance) in TOLERANCES.items():
+        if name not in baselines or name not in results:
+            continue
+
+        baseline, value = baselines[name], results[name]
+        limit = baseline * (1 + tolerance)
+        if value > limit or (kind == "band" and value < baseline * (1 - tolerance)):
+            found.append(f"{name}: {value:,.2f} against a baseline of {baseline:,.2f} (±{tolerance:.0%})")
+
+    return found
+
+
+def run(args: argparse.Namespace) -> int:
+    trace = load_trace(args.trace)
+    results = replay(trace, args.hours, args.latency_scale)
+    results.update(bench_render())
+    results["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print()
+    for name, value in results.items():
+        print(f"{name:>28}: {value:,.2f}" if isinstance(value, float) else f"{name:>28}: {value:,}")
+
+    if args.update_baseline:
+        with open(BASELINES, "w") as baseline_file:
+            json.dump({name: round(results[name], 3) for name in TOLERANCES}, baseline_file, indent=4)
+            baseline_file.write("\n")
+        print(f"\n\33[97mBaseline saved to {BASELINES}")
+        return 0
+
+    if args.check:
+        with open(BASELINES, "r") as baseline_file:
+            found = regressions(results, json.load(baseline_file))
+
+        if found:
+            print("\nRegressions:")
+            for line in found:
+                print(f"  {line}")
+            return 1
+
+        print("\n\33[97mNo regressions.")
+
+    return 0
+
+
+def record(args: argparse.Namespace) -> int:
+    """Runs the real presence (config.json, Spotify, OpenWeather, Discord)
+    for a while, recording what the APIs answer."""
+    from event_loop import presence_event_loop
+
+    custom_presence.configure()
+    recorder = TraceRecorder()
+    recorder.install(custom_presence.get_http_session())
+
+    stop_event = threading.Event()
+    timer = threading.Timer(args.minutes * 60, stop_event.set)
+    timer.start()
+    try:
+        presence_event_loop(stop_event)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        timer.cancel()
+
+    trace = recorder.trace()
+    save_trace(trace, args.out)
+    print(f"\33[97mRecorded {len(trace['events'])} event(s) over {trace['duration'] / 60:.1f} minutes to {args.out}")
+    return 0
+
+
+def synthesize(args: argparse.Namespace) -> int:
+    trace = synthesize_day()
+    save_trace(trace, args.out)
+    print(f"\33[97mSynthesized {len(trace['events'])} event(s) to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record/replay benchmark of the presence engine.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay a trace and report (or check) the results")
+    run_parser.add_argument("--trace", default=SAMPLE_TRACE)
+    run_parser.add_argument("--hours", type=float, default=None, help="replay only this much of the trace")
+    run_parser.add_argument("--latency-scale", type=float, default=0.0,
+                            help="wait out the recorded API latencies, scaled by this (real time!)")
+    baseline = run_parser.add_mutually_exclusive_group()
+    baseline.add_argument("--check", action="store_true", help="exit with 1 on a regression")
+    baseline.add_argument("--update-baseline", action="store_true")
+    run_parser.set_defaults(func=run)
+
+    record_parser = commands.add_parser("record", help="record a trace from the real APIs")
+    record_parser.add_argument("minutes", type=float)
+    # Recordings hold the listener's real track history: kept out of the repo
+    record_parser.add_argument("--out", default=os.path.join(tempfile.gettempdir(),
+                                                             f"presence-trace-{int(time.time())}.json"))
+    record_parser.set_defaults(func=record)
+
+    synthesize_parser = commands.add_parser("synthesize", help="write the sample day trace")
+    synthesize_parser.add_argument("--out", default=SAMPLE_TRACE)
+    synthesize_parser.set_defaults(func=synthesize)
+
+    arguments = parser.parse_args()
+    sys.exit(arguments.func(arguments))
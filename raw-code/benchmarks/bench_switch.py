@@ -0,0 +1,100 @@
+"""Measures how long it takes to switch between the default and Spotify
+presence, against a local fake Discord IPC socket.
+
+Compares the old approach (connect the new client, close the old one) with
+the warm-standby ConnectionManager. Linux/macOS only. Run from the raw-code
+directory, next to a config.json:
+
+    python benchmarks/bench_switch.py
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_discord import FakeDiscord
+
+ROUNDS = 50
+
+
+class _Client:
+    """Bare presence client, so only the IPC cost gets measured."""
+
+    def __init__(self, client_id: str) -> None:
+        from pypresence import Presence
+
+        self._presence = Presence(client_id)
+        self.current_state = {}
+
+    def connect(self) -> None:
+        self._presence.connect()
+
+    def update(self) -> None:
+        self._presence.update(state="bench", details=str(time.time()))
+
+    def clear(self, pid: int) -> None:
+        self._presence.clear(pid)
+
+    def close(self) -> None:
+        self._presence.close()
+
+    def check(self) -> None:
+        pass
+
+    def invalidate(self) -> None:
+        pass
+
+
+def bench_reconnect(first: _Client, second: _Client) -> list[float]:
+    timings = []
+    first.connect()
+    first.update()
+    current, other = first, second
+
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        other.connect()
+        other.update()
+        current.close()
+        timings.append(time.perf_counter() - start)
+        current, other = other, current
+
+    current.close()
+    return timings
+
+
+def bench_warm_standby(first: _Client, second: _Client) -> list[float]:
+    from connection_manager import ConnectionManager
+
+    manager = ConnectionManager(first, second)
+    manager.warm_up()
+    manager.show(first)
+
+    timings = []
+    current, other = first, second
+    for _ in range(ROUNDS):
+        manager.show(other)
+        timings.append(manager.last_switch_latency)
+        current, other = other, current
+
+    manager.close_all()
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    timings = sorted(timings)
+    print(f"{name:>14}: median {statistics.median(timings) * 1000:7.2f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)] * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    with FakeDiscord() as discord:
+        os.environ["XDG_RUNTIME_DIR"] = discord.directory
+
+        report("reconnect", bench_reconnect(_Client("1"), _Client("2")))
+        report("warm standby", bench_warm_standby(_Client("1"), _Client("2")))
+        print(f"{discord.handshakes} handshakes, {discord.frames} frames in total")
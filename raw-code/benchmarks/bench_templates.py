@@ -0,0 +1,120 @@
+"""Micro-benchmark of rendering the default presence's text: the old
+get_date_time + f-string path against a per-tick snapshot and the compiled
+templates. Run from the raw-code directory, next to a config.json:
+
+    python benchmarks/bench_templates.py
+"""
+from __future__ import annotations
+
+import os
+import sys
+import timeit
+from datetime import datetime, UTC
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import custom_presence
+from clock import now
+from custom_presence import CLOCK
+from templates import Snapshot, get_ordinal_suffix
+
+NUMBER = 20000
+
+WEATHER = {
+    "temp": {"feels_like": 10.2, "temp_min": 9.0, "temp_nax": 13.1, "temp": 11.6},
+    "weather": {"description": "light rain", "main": "Rain"},
+    "meta": {"city": "Toronto", "country": "CA"}
+}
+
+
+# What the presence used to render the time from
+def get_date_time(curr_time: int = -1, leading: bool = True, military_time: bool = False) -> dict[
+        str, dict[str, str | None] | dict[str, str] | dict[str, int]]:
+    """Returns current date and time in the style of HH:MM:AM/PM.
+    Takes time in epoch, with current time as default if none given.
+
+    Takes leading bool for whether leading zeros should be included or not.
+    Takes military_time bool for 24hr/12hr time.
+    """
+    curr_time = now() if curr_time < 0 else curr_time
+    time_obj = datetime.fromtimestamp(curr_time)
+
+    # Time in day
+    hour = time_obj.strftime('%I') if not military_time else time_obj.strftime('%H')
+    if not leading:
+        hour = hour.lstrip('0')
+    minute = time_obj.strftime('%M')
+    am_pm = None if military_time else time_obj.strftime('%p')
+
+    # Day in year
+    weekday = time_obj.strftime("%A")
+    day = time_obj.strftime("%d")
+    month = time_obj.strftime("%B")
+    year = time_obj.strftime("%Y")
+
+    # Metadata
+    time_zone = datetime.fromtimestamp(3138004800).hour - datetime.fromtimestamp(3138004800, UTC).hour
+
+    # Hotfix to ensure that all timezones East of GMT have an additional "+" to
+    # follow general convention.
+    if time_zone >= 0:
+        time_zone = f"+{time_zone}"
+
+    # This is to ensure that the time_zone variable keeps one consistent type.
+    time_zone = str(time_zone)
+
+    # Formatting dict
+    time_dict = {
+        "exact": {
+            "hour": hour,
+            "minute": minute,
+            "am_pm": am_pm
+        },
+        "broad": {
+            "weekday": weekday,
+            "day": day,
+            "month": month,
+            "year": year
+        },
+        "meta": {
+            "timezone": time_zone
+        }
+    }
+
+    return time_dict
+
+
+def old_path() -> tuple[str, str, str]:
+    """The rendering done by EnhancedRPC.update before templates existed."""
+    current_time = get_date_time()["exact"]
+    state = (f"It is {current_time["hour"].lstrip("0")}:{current_time["minute"]} {current_time["am_pm"]} "
+             f"(UTC {get_date_time()["meta"]["timezone"]})")
+
+    details = (f"{round(WEATHER["temp"]["temp"])}°C, "
+               f"{' '.join(word.capitalize() for word in WEATHER["weather"]["description"].split(' '))}")
+
+    broad_time = get_date_time()["broad"]
+    large_text = f"{broad_time["weekday"]}, {broad_time["month"]} {broad_time["day"].lstrip('0') +
+                                                                   get_ordinal_suffix(int(broad_time["day"]))}"
+
+    return state, details, large_text
+
+
+def new_path() -> tuple[str, str, str]:
+    fields = Snapshot(CLOCK.snapshot(), WEATHER).fields()
+    templates = custom_presence.DEFAULT_PRESENCE_TEMPLATES
+
+    return (templates.render("state", fields),
+            templates.render("details", fields),
+            templates.render("large_text", fields))
+
+
+if __name__ == "__main__":
+    custom_presence.configure()
+
+    print(f"old: {old_path()}")
+    print(f"new: {new_path()}")
+
+    for name, func in (("old", old_path), ("new", new_path)):
+        seconds = timeit.timeit(func, number=NUMBER)
+        print(f"{name}: {seconds / NUMBER * 1e6:6.2f} us per render")
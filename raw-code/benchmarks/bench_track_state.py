@@ -0,0 +1,109 @@
+"""Compares the memory held between polls by the raw currently_playing payload
+(what SpotifyRPC used to keep in self.values, plus the copy made on every
+render) with the parsed TrackState, using tracemalloc. Exits with 1 if a
+TrackState holds on to more than MAX_RETAINED bytes. Run from the raw-code
+directory:
+
+    python benchmarks/bench_track_state.py
+"""
+from __future__ import annotations
+
+import copy
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from track_state import TrackState
+
+POLLS = 200
+
+# What a TrackState may hold on to between polls, in bytes; it's about 400
+MAX_RETAINED = 1024
+
+
+def fake_response(n: int) -> dict:
+    """A currently_playing payload shaped (and roughly sized) like a real
+    one, for track n."""
+    artists = [{"external_urls": {"spotify": f"https://open.spotify.com/artist/{a:022d}"},
+                "href": f"https://api.spotify.com/v1/artists/{a:022d}",
+                "id": f"{a:022d}", "name": f"Artist {a}", "type": "artist",
+                "uri": f"spotify:artist:{a:022d}"} for a in range(n, n + 2)]
+    images = [{"height": size, "width": size, "url": f"https://i.scdn.co/image/{n:040d}{size}"}
+              for size in (640, 300, 64)]
+
+    return json.loads(json.dumps({
+        "timestamp": 1700000000000 + n,
+        "context": {"external_urls": {"spotify": "https://open.spotify.com/playlist/x"},
+                    "href": "https://api.spotify.com/v1/playlists/x", "type": "playlist",
+                    "uri": "spotify:playlist:x"},
+        "progress_ms": 1000 * n,
+        "item": {
+            "album": {"album_type": "album", "artists": artists, "images": images,
+                      "id": f"{n:022d}", "name": f"Album {n}", "release_date": "2020-01-01",
+                      "total_tracks": 12, "type": "album", "uri": f"spotify:album:{n:022d}"},
+            "artists": artists,
+            "disc_number": 1,
+            "duration_ms": 200000,
+            "explicit": False,
+            "external_ids": {"isrc": f"US{n:010d}"},
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{n:022d}"},
+            "href": f"https://api.spotify.com/v1/tracks/{n:022d}",
+            "id": f"{n:022d}",
+            "is_local": False,
+            "is_playable": True,
+            "name": f"Track {n}",
+            "popularity": 50,
+            "preview_url": f"https://p.scdn.co/mp3-preview/{n:040d}",
+            "track_number": 3,
+            "type": "track",
+            "uri": f"spotify:track:{n:022d}"
+        },
+        "currently_playing_type": "track",
+        "actions": {"disallows": {"resuming": True}},
+        "is_playing": True
+    }))
+
+
+def retained(keep) -> float:
+    """Runs POLLS polls through keep(), and returns how many bytes the kept
+    result holds on to once the response itself is gone, on average."""
+    keep(fake_response(0))  # Warm up any caches first
+    tracemalloc.start()
+    total = 0
+
+    for n in range(POLLS):
+        before, _ = tracemalloc.get_traced_memory()
+        values = fake_response(n)
+
+        held = keep(values)
+        del values
+        gc.collect()
+
+        after, _ = tracemalloc.get_traced_memory()
+        total += after - before
+        del held
+
+    tracemalloc.stop()
+
+    return total / POLLS
+
+
+def old_path(values: dict) -> tuple[dict, dict]:
+    """The raw payload, and the copy currently_playing_helper made of it."""
+    return values, copy.copy(values)
+
+
+if __name__ == "__main__":
+    old = retained(old_path)
+    new = retained(TrackState.from_response)
+
+    print(f"raw payload: {old:7.0f} bytes held between polls")
+    print(f"TrackState:  {new:7.0f} bytes held between polls ({old / max(new, 1):.0f}x less)")
+
+    if new > MAX_RETAINED:
+        print(f"TrackState holds more than {MAX_RETAINED} bytes between polls")
+        sys.exit(1)
@@ -0,0 +1,76 @@
+"""Counts the OpenWeather calls made over a simulated day, caching the
+current weather (every 30 minutes) against caching a forecast timeline, and
+times serving the weather from the timeline. Uses the engine's refresh rule
+(refresh once less than WEATHER_REFRESH_MARGIN is left) on a fake clock, so
+it runs instantly and offline:
+
+    python benchmarks/bench_weather_timeline.py
+"""
+from __future__ import annotations
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import WEATHER_CACHE_DEFAULTS
+from weather_cache import WeatherCache
+from weather_timeline import FORECAST_POINTS, FORECAST_STEP, parse_forecast, weather_at
+
+DAY = 24 * 3600
+TICK = 5
+WEATHER_REFRESH_MARGIN = 300  # see presence_engine
+START = 1_790_000_000
+NUMBER = 100000
+
+
+def current(city: str, at: float) -> dict:
+    return {
+        "temp": {"feels_like": 10.0, "temp_min": 9.0, "temp_nax": 13.0, "temp": 11.0},
+        "weather": {"description": "light rain", "main": "Rain"},
+        "meta": {"city": city, "country": "CA"}
+    }
+
+
+def forecast(city: str, at: float) -> dict:
+    first = (int(at) // FORECAST_STEP + 1) * FORECAST_STEP
+    return parse_forecast({
+        "list": [{"dt": first + i * FORECAST_STEP,
+                  "main": {"feels_like": 8.0 + i, "temp_min": 8.0 + i, "temp_max": 12.0 + i, "temp": 10.0 + i},
+                  "weather": [{"description": "light rain", "main": "Rain"}]}
+                 for i in range(FORECAST_POINTS)],
+        "city": {"name": city, "country": "CA"}
+    })
+
+
+def simulate(fetch, ttl: float, max_staleness: float) -> tuple[int, int]:
+    """Returns (fetches, ticks without weather) over a day of ticks."""
+    now = [float(START)]
+    cache = WeatherCache(lambda city: fetch(city, now[0]), path=None, ttl=ttl, max_staleness=max_staleness,
+                         clock=lambda: now[0])
+    missing = 0
+
+    while now[0] < START + DAY:
+        if cache.expires_in("Toronto") <= WEATHER_REFRESH_MARGIN:
+            cache.refresh("Toronto")
+        if weather_at(cache.get("Toronto"), now[0]) is None:
+            missing += 1
+        now[0] += TICK
+
+    return cache.fetches, missing
+
+
+if __name__ == "__main__":
+    defaults = WEATHER_CACHE_DEFAULTS
+    runs = {
+        "current": simulate(current, defaults["ttl"], defaults["max_staleness"]),
+        "forecast": simulate(forecast, defaults["forecast_ttl"], defaults["forecast_max_staleness"])
+    }
+
+    for name, (fetches, missing) in runs.items():
+        print(f"{name:>8}: {fetches:3d} API calls per day, {missing} ticks without weather")
+
+    timeline = forecast("Toronto", START)
+    seconds = timeit.timeit(lambda: weather_at(timeline, START + 4000), number=NUMBER)
+    print(f"timeline lookup: {seconds / NUMBER * 1e6:.2f} us")
@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import threading
+
+
+class FakeDiscord:
+    """A local stand-in for the Discord client's IPC socket (Linux/macOS).
+
+    Listens on {directory}/discord-ipc-{pipe}, answers the handshake with a
+    READY dispatch, and acknowledges every command by echoing its nonce back,
+    like the real client does. Point XDG_RUNTIME_DIR at directory and
+    pypresence (or any other client) will pick it up.
+
+    Runs its own event loop on a background thread; use it as a context
+    manager.
+    """
+
+    directory: str
+    pipe: int
+    latency: float
+
+    frames: int
+    handshakes: int
+    activities: dict[str, dict | None]
+
+    def __init__(self, directory: str | None = None, pipe: int = 0, latency: float = 0.0) -> None:
+        """Creates a new fake. Takes the directory to put the socket in (a
+        fresh temporary one by default), and an artificial response latency
+        in seconds."""
+        self.directory = tempfile.mkdtemp(prefix="fake-discord-") if directory is None else directory
+        self.pipe = pipe
+        self.latency = latency
+
+        self.frames = 0
+        self.handshakes = 0
+        self.activities = {}
+
+        self._loop = asyncio.new_event_loop()
+        self._server = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True, name="FakeDiscord")
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.directory, f"discord-ipc-{self.pipe}")
+
+    def start(self) -> FakeDiscord:
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._start_server(), self._loop).result()
+        return self
+
+    def stop(self) -> None:
+        async def _close():
+            self._server.close()
+            # Drop every client, like Discord quitting would
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(_close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def __enter__(self) -> FakeDiscord:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    async def _start_server(self) -> None:
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        client_id = None
+        self._writers.add(writer)
+
+        try:
+            while True:
+                op, length = struct.unpack("<II", await reader.readexactly(8))
+                payload = json.loads(await reader.readexactly(length))
+                self.frames += 1
+
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                if op == 0:
+                    client_id = str(payload["client_id"])
+                    self.handshakes += 1
+                    self._send(writer, 1, {"cmd": "DISPATCH", "evt": "READY", "nonce": None,
+                                           "data": {"v": 1, "user": {"id": "0", "username": "fake"}}})
+
+                elif op == 1:
+                    activity = payload.get("args", {}).get("activity")
+                    if len((activity or {}).get("details") or "") > 128:
+                        # What Discord answers for a field over its limit
+                        self._send(writer, 1, {"cmd": payload.get("cmd"), "evt": "ERROR", "nonce": payload.get("nonce"),
+                                               "data": {"code": 4000, "message": "child \"details\" fails because "
+                                                                                 "[length must be less than or equal to 128 characters long]"}})
+                    else:
+                        if payload.get("cmd") == "SET_ACTIVITY":
+                            self.activities[client_id] = activity
+                        self._send(writer, 1, {"cmd": payload.get("cmd"), "evt": None, "data": activity,
+                                               "nonce": payload.get("nonce")})
+
+                elif op == 2:
+                    break
+
+                elif op == 3:
+                    self._send(writer, 4, payload)
+
+                await writer.drain()
+
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+
+        finally:
+            self.activities.pop(client_id, None)
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _send(writer: asyncio.StreamWriter, op: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        writer.write(struct.pack("<II", op, len(data)) + data)
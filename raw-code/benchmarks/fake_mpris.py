@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import queue
+import subprocess
+import threading
+
+from jeepney import (DBusAddress, HeaderFields, MatchRule, MessageType, message_bus, new_error,
+                     new_method_return, new_signal)
+from jeepney.io.threading import DBusRouter, Proxy, open_dbus_connection
+
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+PLAYER_INTERFACE = "org.mpris.MediaPlayer2.Player"
+
+
+class PrivateBus:
+    """A throwaway dbus-daemon, so nothing touches the real session bus.
+    Needs dbus-daemon on the PATH. Use it as a context manager; address is
+    what MPRISSource (or DBUS_SESSION_BUS_ADDRESS) should point at."""
+
+    address: str | None
+
+    def __init__(self) -> None:
+        self.address = None
+        self._process = None
+
+    def __enter__(self) -> PrivateBus:
+        self._process = subprocess.Popen(["dbus-daemon", "--session", "--nofork", "--print-address=1"],
+                                         stdout=subprocess.PIPE, text=True)
+        self.address = self._process.stdout.readline().strip()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._process.terminate()
+        self._process.wait()
+
+
+class FakePlayer:
+    """A minimal MPRIS player, in the style of the Spotify desktop client.
+
+    Owns org.mpris.MediaPlayer2.{name} on the given bus, answers Get/GetAll
+    on org.mpris.MediaPlayer2.Player, and emits PropertiesChanged whenever
+    play() or pause() changes something.
+    """
+
+    bus_name: str
+    status: str
+    metadata: dict
+    position: int
+
+    def __init__(self, address: str, name: str = "spotify") -> None:
+        self.bus_name = f"org.mpris.MediaPlayer2.{name}"
+        self.status = "Stopped"
+        self.metadata = {}
+        self.position = 0
+
+        self._connection = open_dbus_connection(address)
+        self._router = DBusRouter(self._connection)
+        self._calls = queue.Queue()
+        self._filter = self._router.filter(MatchRule(type="method_call", path=MPRIS_PATH), queue=self._calls)
+        self._thread = threading.Thread(target=self._serve, daemon=True, name="FakePlayer")
+
+    def __enter__(self) -> FakePlayer:
+        self._thread.start()
+        Proxy(message_bus, self._router, timeout=5).RequestName(self.bus_name)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._calls.put(None)
+        self._filter.close()
+        self._router.close()
+        self._connection.close()
+
+    def play(self, track_id: str, title: str, artists: list[str], length_ms: int = 200000,
+             position_ms: int = 0, art_url: str | None = None) -> None:
+        """Starts playing the given track."""
+        self.metadata = {
+            "mpris:trackid": ("o", f"/com/spotify/track/{track_id}"),
+            "mpris:length": ("t", length_ms * 1000),
+            "xesam:title": ("s", title),
+            "xesam:artist": ("as", artists)
+        }
+        if art_url is not None:
+            self.metadata["mpris:artUrl"] = ("s", art_url)
+
+        self.position = position_ms * 1000
+        self.status = "Playing"
+        self._changed("Metadata", "PlaybackStatus")
+
+    def pause(self) -> None:
+        self.status = "Paused"
+        self._changed("PlaybackStatus")
+
+    def _properties(self) -> dict:
+        return {
+            "PlaybackStatus": ("s", self.status),
+            "Metadata": ("a{sv}", self.metadata),
+            "Position": ("x", self.position)
+        }
+
+    def _changed(self, *names: str) -> None:
+        properties = self._properties()
+        emitter = DBusAddress(MPRIS_PATH, interface="org.freedesktop.DBus.Properties")
+        self._router.send(new_signal(emitter, "PropertiesChanged", "sa{sv}as",
+                                     (PLAYER_INTERFACE, {name: properties[name] for name in names}, [])))
+
+    def _serve(self) -> None:
+        while True:
+            call = self._calls.get()
+            if call is None:
+                return
+
+            if call.header.message_type is not MessageType.method_call:
+                continue
+
+            member = call.header.fields.get(HeaderFields.member)
+            if member == "GetAll":
+                reply = new_method_return(call, "a{sv}", (self._properties(),))
+            elif member == "Get":
+                reply = new_method_return(call, "v", (self._properties()[call.body[1]],))
+            else:
+                reply = new_error(call, "org.freedesktop.DBus.Error.UnknownMethod")
+
+            self._router.send(reply)
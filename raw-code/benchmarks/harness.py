@@ -0,0 +1,148 @@
+"""What the benchmarks share: the config they run on (bench_config), and a
+harness that runs the whole presence engine on a VirtualClock against the
+fake Discord IPC socket (Simulation). Linux/macOS only.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import custom_presence
+from clock import VirtualClock, set_clock
+from config import parse_config
+from fake_discord import FakeDiscord
+from presence_engine import PresenceEngine
+from providers import ProviderRegistry
+
+
+def bench_config(directory: str, **overrides) -> dict:
+    """Returns the config.json every benchmark runs on: made up ids and keys,
+    and every file the presence writes kept inside directory. Sections given
+    as keyword arguments are merged over the defaults; anything else
+    replaces them."""
+    config = {
+        "spotify_api": {"client_id": "bench", "client_secret": "bench", "redirect_uri": "http://127.0.0.1:8888/callback",
+                        "token_cache": os.path.join(directory, "token_cache.json")},
+        "general_api_keys": {"weather_api_key": "bench", "default_rpc_id": "111", "spotify_rpc_id": "222"},
+        "metadata": {"default_image_list": ["default"], "spotify_image_list": ["spotify"], "city": "Toronto"},
+        "weather_cache": {"path": os.path.join(directory, "weather_cache.json")},
+        "state": {"path": os.path.join(directory, "presence_state.json")},
+        "ipc_transport": "native"
+    }
+
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(config.get(key), dict):
+            config[key] = {**config[key], **value}
+        else:
+            config[key] = value
+
+    return config
+
+
+class Simulation:
+    """Runs the engine for a while on a VirtualClock, against the fake
+    Discord IPC socket, with custom_presence configured from bench_config
+    (in a fresh temporary directory, removed afterwards). Time only passes
+    when the engine has nothing to do, so a simulated day takes seconds.
+
+    Use it as a context manager: configure everything that needs the config
+    inside it, then build the engine and run it.
+
+        with Simulation(start) as simulation:
+            simulation.build(providers)
+            results = simulation.run(hours=24)
+    """
+
+    clock: VirtualClock
+    directory: str
+    config: dict
+    discord: FakeDiscord
+    engine: PresenceEngine | None
+
+    def __init__(self, start: float | None = None, **overrides) -> None:
+        """Creates a new simulation, starting at the given time (epoch
+        seconds; now by default). Takes bench_config overrides."""
+        self.clock = VirtualClock(start)
+        self.directory = tempfile.mkdtemp(prefix="bench-simulation-")
+        self.config = bench_config(self.directory, **overrides)
+        self.discord = FakeDiscord()
+        self.engine = None
+
+        self._previous_clock = None
+        self._previous_runtime_dir = None
+        self._stop_event = threading.Event()
+
+    def __enter__(self) -> Simulation:
+        self._previous_clock = set_clock(self.clock)
+        self._previous_runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+        try:
+            self.discord.start()
+            os.environ["XDG_RUNTIME_DIR"] = self.discord.directory
+            custom_presence.configure(parse_config(self.config))
+        except BaseException:
+            self._restore()
+            raise
+
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        # A weather refresh may still be running in the background: keep it
+        # from saving into the directory once it's gone
+        if custom_presence.WEATHER_CACHE is not None:
+            custom_presence.WEATHER_CACHE.path = None
+
+        try:
+            self.discord.stop()
+        finally:
+            self._restore()
+
+    def _restore(self) -> None:
+        """Puts back the clock and XDG_RUNTIME_DIR, and removes the
+        temporary directory."""
+        set_clock(self._previous_clock)
+
+        if self._previous_runtime_dir is None:
+            os.environ.pop("XDG_RUNTIME_DIR", None)
+        else:
+            os.environ["XDG_RUNTIME_DIR"] = self._previous_runtime_dir
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def build(self, providers: ProviderRegistry) -> PresenceEngine:
+        """Creates the engine, over the given providers."""
+        self.engine = PresenceEngine(self._stop_event, providers)
+        return self.engine
+
+    def run(self, hours: float) -> dict[str, float]:
+        """Runs the engine for the given number of simulated hours, then
+        stops it. Returns what it cost and what it sent."""
+        start = self.clock.time()
+
+        async def run() -> None:
+            task = asyncio.create_task(self.engine.run())
+            await asyncio.sleep(hours * 3600)
+            self._stop_event.set()
+            await task
+
+        started, cpu_started = time.perf_counter(), time.process_time()
+        asyncio.run(run(), loop_factory=self.clock.new_event_loop)
+
+        clients = self.engine.providers.clients
+        return {
+            "simulated_hours": (self.clock.time() - start) / 3600,
+            "wall_seconds": time.perf_counter() - started,
+            "cpu_seconds": time.process_time() - cpu_started,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            "ipc_frames": self.discord.frames,
+            "updates_sent": sum(client.outbound.sent for client in clients),
+            "updates_suppressed": sum(client.outbound.suppressed for client in clients),
+            "presence_switches": self.engine.connections.switches
+        }
@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import bisect
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit
+
+from requests.adapters import HTTPAdapter
+
+from traces import endpoint_kind, progressed
+
+# The upstreams the stub stands in for
+UPSTREAMS = ("https://api.spotify.com", "https://api.openweathermap.org")
+
+
+class TraceServer:
+    """A local stand-in for the Spotify Web API and OpenWeather, answering
+    from a trace (see traces).
+
+    Every request is answered with the latest recorded answer of its kind at
+    the current point in the trace, going by the clock it is given, with
+    playback moved on since. Optionally waits out the recorded latency
+    (scaled by latency_scale) before answering. Counts the calls of each
+    kind.
+
+    Runs on a background thread; use it as a context manager. Point a
+    session at it with redirect.
+    """
+
+    trace: dict
+    clock: Callable[[], float]
+    latency_scale: float
+
+    calls: dict[str, int]
+
+    def __init__(self, trace: dict, clock: Callable[[], float] = time.time, latency_scale: float = 0.0) -> None:
+        self.trace = trace
+        self.clock = clock
+        self.latency_scale = latency_scale
+
+        self.calls = {}
+
+        self._events: dict[str, list[dict]] = {}
+        for event in trace["events"]:
+            self._events.setdefault(event["kind"], []).append(event)
+        self._times = {kind: [event["t"] for event in events] for kind, events in self._events.items()}
+        self._lock = threading.Lock()
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True, name="TraceServer")
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> TraceServer:
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self) -> TraceServer:
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def answer(self, kind: str) -> dict | None:
+        """Returns the event that answers a request of the given kind right
+        now (progressed, for Spotify), or None if there is none yet."""
+        t = self.clock() - self.trace["started_at"]
+        index = bisect.bisect_right(self._times.get(kind, []), t) - 1
+        if index < 0:
+            return None
+
+        event = self._events[kind][index]
+        return {**event, "body": progressed(event, t)} if kind == "spotify" else event
+
+    def redirect(self, session) -> None:
+        """Sends the given requests session's Spotify and OpenWeather calls
+        here instead, keeping its retry policy."""
+        for upstream in UPSTREAMS:
+            adapter = session.get_adapter(upstream)
+            session.mount(upstream, RedirectAdapter(self.url, max_retries=adapter.max_retries))
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as two writes; with Nagle on, every
+            # keep-alive request would wait out a delayed ACK
+            disable_nagle_algorithm = True
+
+            def do_GET(self) -> None:
+                kind = endpoint_kind(self.path)
+                if kind is None:
+                    self._send(404, {"error": {"status": 404, "message": "not in the trace"}})
+                    return
+
+                with server._lock:
+                    server.calls[kind] = server.calls.get(kind, 0) + 1
+
+                event = server.answer(kind)
+                if event is None:
+                    self._send(204 if kind == "spotify" else 503, None)
+                    return
+
+                if server.latency_scale:
+                    time.sleep(event["latency"] * server.latency_scale)
+                self._send(event["status"], event["body"])
+
+            def _send(self, status: int, body: dict | None) -> None:
+                payload = b"" if body is None or status == 204 else json.dumps(body).encode()
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
+
+
+class RedirectAdapter(HTTPAdapter):
+    """Sends every request to the given base URL instead, keeping its path
+    and query."""
+
+    def __init__(self, base_url: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.base = urlsplit(base_url)
+
+    def send(self, request, **kwargs):
+        url = urlsplit(request.url)
+        request.url = urlunsplit((self.base.scheme, self.base.netloc, url.path, url.query, ""))
+        return super().send(request, **kwargs)
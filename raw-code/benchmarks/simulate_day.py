@@ -0,0 +1,133 @@
+"""Runs the whole presence engine through a simulated day on a VirtualClock,
+against scripted stand-ins: a Spotify listening schedule, a forecast
+provider and the fake Discord IPC socket. A day takes as long as the work
+done in it, which is seconds rather than hours.
+
+Reports the API calls made, the IPC frames sent, and the CPU time, wall
+time and peak memory it took. Linux/macOS only; no config.json, network or
+Spotify account needed. Run from the raw-code directory:
+
+    python benchmarks/simulate_day.py [hours]
+"""
+from __future__ import annotations
+
+import math
+import os
+import sys
+from datetime import datetime
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import custom_presence
+from clock import VirtualClock
+from custom_presence import SpotifyRPC
+from harness import Simulation
+from playback_sources import PlaybackSource
+from providers import DefaultProvider, ProviderRegistry, SpotifyProvider
+from track_state import TrackState
+from weather_timeline import FORECAST_POINTS, FORECAST_STEP, parse_forecast
+
+# When the scripted listener has Spotify playing, in hours of the day
+LISTENING = ((9.0, 12.0), (14.0, 17.5), (20.0, 23.0))
+TRACK_LENGTHS = (183, 215, 242, 197, 264, 171, 229)  # seconds, played in a loop
+
+
+class ScriptedPlayback(PlaybackSource):
+    """Plays through a fixed playlist during the LISTENING hours, going by the
+    clock it is given. Counts its polls, each of which would have been a Web
+    API call."""
+
+    name = "Scripted Spotify"
+
+    polls: int
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.polls = 0
+
+    def poll(self) -> TrackState | None:
+        self.polls += 1
+
+        moment = datetime.fromtimestamp(self.clock.time())
+        hour = moment.hour + moment.minute / 60 + moment.second / 3600
+        session = next(((start, end) for start, end in LISTENING if start <= hour < end), None)
+        if session is None:
+            return None
+
+        # Where in the looping playlist the session has got to
+        elapsed = (hour - session[0]) * 3600
+        cycle = sum(TRACK_LENGTHS)
+        position, number = elapsed % cycle, int(elapsed // cycle) * len(TRACK_LENGTHS)
+        for length in TRACK_LENGTHS:
+            if position < length:
+                break
+            position -= length
+            number += 1
+
+        return TrackState(id=f"{number:022d}", name=f"Track {number}", artists=("Scripted Artist",),
+                          progress=int(position * 1000), duration=length * 1000, is_playing=True)
+
+
+def forecast_response(city: str, at: float) -> dict:
+    """Returns what OpenWeather's forecast endpoint would answer at the given
+    time: a smooth daily temperature curve, coldest at midnight."""
+    first = (int(at) // FORECAST_STEP + 1) * FORECAST_STEP
+
+    def temp(moment: int) -> float:
+        return 12 + 6 * math.sin((moment % 86400) / 86400 * 2 * math.pi - math.pi / 2)
+
+    return {
+        "list": [{"dt": first + i * FORECAST_STEP,
+                  "main": {"feels_like": temp(first + i * FORECAST_STEP) - 2,
+                           "temp_min": temp(first + i * FORECAST_STEP) - 1,
+                           "temp_max": temp(first + i * FORECAST_STEP) + 1,
+                           "temp": temp(first + i * FORECAST_STEP)},
+                  "weather": [{"description": "scattered clouds", "main": "Clouds"}]}
+                 for i in range(FORECAST_POINTS)],
+        "city": {"name": city, "country": "CA"}
+    }
+
+
+class ScriptedWeather:
+    """Answers forecast fetches like OpenWeather would (see
+    forecast_response), parsed into a timeline (see weather_timeline).
+    Counts its fetches."""
+
+    fetches: int
+
+    def __init__(self, clock: VirtualClock) -> None:
+        self.clock = clock
+        self.fetches = 0
+
+    def fetch(self, city: str) -> dict:
+        self.fetches += 1
+        return parse_forecast(forecast_response(city, self.clock.time()))
+
+
+def simulate(hours: float = 24) -> dict[str, float]:
+    """Runs the engine for the given number of simulated hours, starting at
+    midnight, and returns what it cost."""
+    start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+    with Simulation(start) as simulation:
+        playback, weather = ScriptedPlayback(simulation.clock), ScriptedWeather(simulation.clock)
+
+        cache = custom_presence.WEATHER_CACHE
+        cache.fetcher = partial(custom_presence.WEATHER_BREAKER.call, weather.fetch)
+
+        spotify = SpotifyRPC()
+        spotify.sources, spotify.ready = [playback], True
+
+        simulation.build(ProviderRegistry(DefaultProvider(), SpotifyProvider(spotify)))
+        results = simulation.run(hours)
+
+    return {**results, "spotify_api_calls": playback.polls, "weather_api_calls": weather.fetches}
+
+
+if __name__ == "__main__":
+    results = simulate(float(sys.argv[1]) if len(sys.argv) > 1 else 24)
+
+    print()
+    for name, value in results.items():
+        print(f"{name:>20}: {value:,.1f}" if isinstance(value, float) else f"{name:>20}: {value:,}")
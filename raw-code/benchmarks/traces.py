@@ -0,0 +1,187 @@
+"""Traces of what the upstream APIs answered over a session, for replaying
+against the HTTP stub (see http_stub and bench_suite).
+
+A trace is a JSON file:
+
+    {"version": 1, "started_at": <epoch seconds>, "duration": <seconds>,
+     "events": [{"t": <seconds since start>, "kind": "spotify" | "forecast" | "weather",
+                 "status": 200, "latency": <seconds>, "body": {...} | null}, ...]}
+
+Only the fields the presence reads are kept out of Spotify's answers, and no
+query string (API keys) or header is ever recorded. Consecutive Spotify
+answers that only differ by the playback moving on are compacted into one;
+replaying moves the progress on again.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from clock import now
+from simulate_day import LISTENING, TRACK_LENGTHS, forecast_response
+from weather_timeline import FORECAST_STEP
+
+TRACE_VERSION = 1
+
+# Which upstream endpoint each event kind stands for
+ENDPOINTS = {
+    "/v1/me/player/currently-playing": "spotify",
+    "/data/2.5/forecast": "forecast",
+    "/data/2.5/weather": "weather"
+}
+
+# A seek (or a recording gap) shows up as the progress being off by more than this
+SEEK_TOLERANCE_MS = 3000
+
+
+def endpoint_kind(url: str) -> str | None:
+    """Returns the event kind for a request to the given URL, or None if it
+    isn't one that gets recorded."""
+    return ENDPOINTS.get(urlsplit(url).path)
+
+
+def trim_spotify(body: dict | None) -> dict | None:
+    """Keeps only what TrackState.from_response reads out of a
+    currently_playing answer."""
+    if not isinstance(body, dict) or not isinstance(body.get("item"), dict):
+        return body
+
+    item = body["item"]
+    return {
+        "is_playing": body.get("is_playing"),
+        "progress_ms": body.get("progress_ms"),
+        "currently_playing_type": body.get("currently_playing_type"),
+        "item": {
+            "id": item.get("id"),
+            "name": item.get("name"),
+            "duration_ms": item.get("duration_ms"),
+            "artists": [{"name": artist.get("name")} for artist in item.get("artists", [])],
+            "album": {"images": (item.get("album") or {}).get("images", [])[:1]}
+        }
+    }
+
+
+def progressed(event: dict, t: float) -> dict | None:
+    """Returns the Spotify answer of the given event as it would be t seconds
+    into the trace: the progress moved on if it was playing (up to the end of
+    the track)."""
+    body = event["body"]
+    if not isinstance(body, dict) or not body.get("is_playing") or not isinstance(body.get("item"), dict):
+        return body
+
+    progress = body["progress_ms"] + int((t - event["t"]) * 1000)
+    return {**body, "progress_ms": min(progress, body["item"]["duration_ms"])}
+
+
+def compact(events: list[dict]) -> list[dict]:
+    """Drops every Spotify event that replaying the previous one would
+    reproduce anyway (same track, same state, progress where expected)."""
+    kept, last = [], None
+
+    for event in events:
+        if event["kind"] != "spotify":
+            kept.append(event)
+            continue
+
+        if last is not None and event["status"] == last["status"]:
+            expected = progressed(last, event["t"])
+            body = event["body"]
+            if body is None and expected is None:
+                continue
+            if (isinstance(body, dict) and isinstance(expected, dict)
+                    and body.get("is_playing") == expected.get("is_playing")
+                    and (body.get("item") or {}).get("id") == (expected.get("item") or {}).get("id")
+                    and abs((body.get("progress_ms") or 0) - (expected.get("progress_ms") or 0)) <= SEEK_TOLERANCE_MS):
+                continue
+
+        last = event
+        kept.append(event)
+
+    return kept
+
+
+def load_trace(path: str) -> dict:
+    with open(path, "r") as trace_file:
+        trace = json.load(trace_file)
+
+    if trace.get("version") != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} trace")
+
+    trace["events"].sort(key=lambda event: event["t"])
+    return trace
+
+
+def save_trace(trace: dict, path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as trace_file:
+        json.dump(trace, trace_file, separators=(",", ":"))
+
+
+class TraceRecorder:
+    """Records every Spotify and OpenWeather answer that goes through a
+    requests session, as a response hook. Install it on the shared session
+    (custom_presence.get_http_session()) and run the presence as usual."""
+
+    started_at: float
+    events: list[dict]
+
+    def __init__(self) -> None:
+        self.started_at = now()
+        self.events = []
+
+    def install(self, session) -> None:
+        session.hooks["response"].append(self.on_response)
+
+    def on_response(self, response, *args, **kwargs) -> None:
+        kind = endpoint_kind(response.url)
+        if kind is None:
+            return
+
+        try:
+            body = response.json() if response.content else None
+        except ValueError:
+            body = None
+
+        self.events.append({
+            "t": round(now() - self.started_at, 3),
+            "kind": kind,
+            "status": response.status_code,
+            "latency": round(response.elapsed.total_seconds(), 4),
+            "body": trim_spotify(body) if kind == "spotify" else body
+        })
+
+    def trace(self) -> dict:
+        return {"version": TRACE_VERSION, "started_at": self.started_at,
+                "duration": round(now() - self.started_at, 3), "events": compact(self.events)}
+
+
+def synthesize_day(started_at: float = 1_767_571_200) -> dict:
+    """Returns a day long trace of the listening schedule simulate_day uses
+    (LISTENING, TRACK_LENGTHS) and a forecast every FORECAST_STEP, with
+    typical latencies. Stands in for a recording wherever none is around."""
+    events = [{"t": 0.0, "kind": "spotify", "status": 204, "latency": 0.09, "body": None}]
+
+    for start, end in LISTENING:
+        t, number = start * 3600, 0
+        while t < end * 3600:
+            length = TRACK_LENGTHS[number % len(TRACK_LENGTHS)]
+            events.append({"t": t, "kind": "spotify", "status": 200, "latency": 0.12, "body": {
+                "is_playing": True, "progress_ms": 0, "currently_playing_type": "track",
+                "item": {"id": f"{number:022d}", "name": f"Track {number}", "duration_ms": length * 1000,
+                         "artists": [{"name": "Scripted Artist"}], "album": {"images": []}}
+            }})
+            t += length
+            number += 1
+
+        events.append({"t": end * 3600, "kind": "spotify", "status": 204, "latency": 0.09, "body": None})
+
+    for t in range(0, 24 * 3600, FORECAST_STEP):
+        events.append({"t": float(t), "kind": "forecast", "status": 200, "latency": 0.18,
+                       "body": forecast_response("Toronto", started_at + t)})
+
+    events.sort(key=lambda event: event["t"])
+    return {"version": TRACE_VERSION, "started_at": started_at, "duration": 24 * 3600.0, "events": events}
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import threading
+from enum import Enum
+from typing import Any, Callable
+
+from clock import monotonic
+
+
+class BreakerState(Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider whose circuit is open."""
+
+
+class CircuitBreaker:
+    """A circuit breaker around a flaky provider.
+
+    After failure_threshold consecutive failures the circuit opens, and calls
+    fail fast with CircuitOpen instead of reaching the provider. Once
+    reset_timeout has passed, a single trial call is let through (half open):
+    if it succeeds the circuit closes again, otherwise it reopens.
+    """
+
+    name: str
+    failure_threshold: int
+    reset_timeout: float
+    clock: Callable[[], float]
+
+    state: BreakerState
+    failures: int
+    opened_at: float | None
+    last_error: BaseException | None
+    rejected: int
+
+    def __init__(self, name: str, failure_threshold: int = 3, reset_timeout: float = 300,
+                 clock: Callable[[], float] = monotonic) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.rejected = 0
+
+        self._lock = threading.Lock()
+
+    def call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Calls func through the breaker."""
+        with self._lock:
+            if self.state is BreakerState.OPEN:
+                if self.retry_in() > 0:
+                    self.rejected += 1
+                    raise CircuitOpen(f"{self.name} is unavailable ({self.last_error})")
+                self.state = BreakerState.HALF_OPEN
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._record_failure(e)
+            raise
+
+        with self._lock:
+            self.state = BreakerState.CLOSED
+            self.failures = 0
+            self.opened_at = None
+
+        return result
+
+    def retry_in(self) -> float:
+        """Returns how many seconds until a trial call is let through. Zero
+        unless the circuit is open."""
+        if self.state is not BreakerState.OPEN:
+            return 0.0
+
+        return max(self.opened_at + self.reset_timeout - self.clock(), 0.0)
+
+    def _record_failure(self, error: Exception) -> None:
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+
+            if self.state is BreakerState.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state is not BreakerState.OPEN:
+                    print(f"Warning: {self.name} circuit opened after {self.failures} failures: {error}")
+                self.state = BreakerState.OPEN
+                self.opened_at = self.clock()
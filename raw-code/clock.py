@@ -0,0 +1,160 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import selectors
+import time
+
+# How long a virtual loop waits for real, at most, while a blocking call is
+# still running on an executor
+BUSY_WAIT = 0.01
+
+
+class Clock:
+    """Where the time comes from. This one is the real (wall) clock.
+
+    Everything that needs the time asks the process-wide clock, through now
+    and monotonic below (or takes one of them as its clock argument), so the
+    whole app can be run against a VirtualClock instead.
+    """
+
+    def time(self) -> float:
+        """Seconds since the epoch."""
+        return time.time()
+
+    def monotonic(self) -> float:
+        """Seconds, for measuring intervals."""
+        return time.monotonic()
+
+    def new_event_loop(self) -> asyncio.AbstractEventLoop:
+        """Returns a new asyncio loop that runs on this clock."""
+        return asyncio.new_event_loop()
+
+
+class VirtualClock(Clock):
+    """A clock that only moves when told to (advance), or when its event loop
+    has nothing to do until some later time, in which case it jumps straight
+    there. A simulated day then takes as long as the work done in it.
+
+    Both time and monotonic read the same virtual time, in epoch seconds.
+    """
+
+    now: float
+
+    def __init__(self, start: float | None = None) -> None:
+        """Creates a new clock, starting at the given time (epoch seconds; the
+        current time by default)."""
+        self.now = time.time() if start is None else start
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += max(seconds, 0.0)
+
+    def new_event_loop(self) -> VirtualEventLoop:
+        return VirtualEventLoop(self)
+
+
+class _WarpSelector(selectors.DefaultSelector):
+    """A selector that, instead of sleeping until the loop's next timer,
+    advances the virtual clock to it."""
+
+    def __init__(self, clock: VirtualClock) -> None:
+        super().__init__()
+        self.clock = clock
+        self.loop = None
+
+    def select(self, timeout: float | None = None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+
+        # Something is still running for real: let it finish before moving on,
+        # or its timeout would be up before it even started
+        if self.loop.busy:
+            return super().select(BUSY_WAIT if timeout is None else min(timeout, BUSY_WAIT))
+
+        # Nothing scheduled at all: only another thread can wake us up
+        if timeout is None:
+            return super().select(None)
+
+        # At epoch magnitudes, a timeout below the spacing of floats wouldn't
+        # move the clock at all, and the timer would never come due
+        before = self.clock.now
+        self.clock.advance(timeout)
+        if self.clock.now == before and timeout > 0:
+            self.clock.now = math.nextafter(before, math.inf)
+        return []
+
+
+class VirtualEventLoop(asyncio.SelectorEventLoop):
+    """An asyncio loop on a VirtualClock. Sleeps and timeouts are virtual,
+    and take no real time at all.
+
+    Calls run on an explicit executor (i.e. the engine's blocking calls) are
+    waited on for real: time stands still until they are done. The default
+    executor isn't, as it runs things that wait on other threads (e.g.
+    asyncio.to_thread(stop_event.wait)).
+    """
+
+    clock: VirtualClock
+    busy: int
+
+    def __init__(self, clock: VirtualClock) -> None:
+        selector = _WarpSelector(clock)
+        super().__init__(selector)
+        selector.loop = self
+
+        self.clock = clock
+        self.busy = 0
+
+        # Loop time counts from here: at epoch magnitudes, a float can't tell
+        # the loop's clock resolution apart, and due timers would never run
+        self._origin = clock.now
+
+    def time(self) -> float:
+        return self.clock.now - self._origin
+
+    def run_in_executor(self, executor, func, *args) -> asyncio.Future:
+        future = super().run_in_executor(executor, func, *args)
+
+        if executor is not None:
+            self.busy += 1
+            future.add_done_callback(self._done)
+
+        return future
+
+    def _done(self, _future: asyncio.Future) -> None:
+        self.busy -= 1
+
+
+# The process-wide clock
+_clock: Clock = Clock()
+
+
+def get_clock() -> Clock:
+    return _clock
+
+
+def set_clock(clock: Clock) -> Clock:
+    """Makes the given clock the process-wide one. Returns the previous one.
+    Set it before anything is created, as some objects keep a time from
+    their creation."""
+    global _clock
+
+    previous, _clock = _clock, clock
+    return previous
+
+
+def now() -> float:
+    """Seconds since the epoch, from the process-wide clock."""
+    return _clock.time()
+
+
+def monotonic() -> float:
+    """Seconds for measuring intervals, from the process-wide clock."""
+    return _clock.monotonic()
@@ -0,0 +1,298 @@
+from __future__ import annotations
+
+import json
+import sys
+from dataclasses import dataclass, field, fields
+from typing import Any
+
+from templates import TemplateError, TemplateSet
+
+
+class ConfigError(ValueError):
+    """Raised for a config.json that is missing, unreadable or invalid. The
+    message lists every problem found, not just the first one."""
+
+
+# Optional sections, and what they default to
+WEATHER_CACHE_DEFAULTS = {
+    "path": "weather_cache.json",
+    "source": "forecast",
+    "ttl": 1800,
+    "max_staleness": 3 * 3600,
+    "forecast_ttl": 6 * 3600,
+    "forecast_max_staleness": 24 * 3600,
+    "breaker_threshold": 3,
+    "breaker_reset": 300
+}
+
+# Same as http_session's DEFAULT_TIMEOUT and DEFAULT_RETRIES, which can't be
+# imported from here without pulling in requests
+HTTP_DEFAULTS = {
+    "connect_timeout": 3.05,
+    "read_timeout": 10,
+    "retries": 2
+}
+
+METRICS_DEFAULTS = {
+    "enabled": False,
+    "host": "127.0.0.1",
+    "port": 9464,
+    "json_dump": None
+}
+
+STATE_DEFAULTS = {
+    "enabled": True,
+    "path": "presence_state.json",
+    "save_interval": 30,
+    "max_age": 300
+}
+
+# What the numbers in the optional sections must be: a zero interval would
+# be a busy loop, and a negative one an error somewhere much later
+RANGES = {
+    "weather_cache.ttl": "positive",
+    "weather_cache.max_staleness": "positive",
+    "weather_cache.forecast_ttl": "positive",
+    "weather_cache.forecast_max_staleness": "positive",
+    "weather_cache.breaker_threshold": "count",
+    "weather_cache.breaker_reset": "positive",
+    "http.connect_timeout": "positive",
+    "http.read_timeout": "positive",
+    "http.retries": "retries",
+    "metrics.port": "port",
+    "state.save_interval": "positive",
+    "state.max_age": "positive"
+}
+
+# Settings that may be null to turn persistence off
+NULLABLE_PATHS = ("weather_cache.path", "state.path")
+
+PLAYBACK_SOURCES = ("auto", "mpris", "web_api")
+WEATHER_SOURCES = ("forecast", "current")
+IPC_TRANSPORTS = ("native", "pypresence")
+IPC_PIPE_MODES = ("all", "first")
+
+
+@dataclass(frozen=True)
+class Config:
+    """The validated contents of config.json. See load_config."""
+
+    spotify_client_id: str
+    spotify_client_secret: str
+    spotify_redirect_uri: str
+    weather_api_key: str
+    default_rpc_id: str
+    spotify_rpc_id: str
+    default_image_list: tuple[str, ...]
+    spotify_image_list: tuple[str, ...]
+    city: str
+
+    token_cache: str | None = ".cache"
+    token_refresh_margin: float = 300
+    use_album_art: bool = False
+    track_cache_size: int = 64
+    playback_source: str = "auto"
+    mpris_player: str = "spotify"
+    ipc_transport: str = "pypresence" if sys.platform == "win32" else "native"
+    ipc_pipes: str = "all"
+    weather_cache: dict[str, Any] = field(default_factory=lambda: dict(WEATHER_CACHE_DEFAULTS))
+    http: dict[str, Any] = field(default_factory=lambda: dict(HTTP_DEFAULTS))
+    metrics: dict[str, Any] = field(default_factory=lambda: dict(METRICS_DEFAULTS))
+    state: dict[str, Any] = field(default_factory=lambda: dict(STATE_DEFAULTS))
+    templates: dict[str, dict[str, str]] = field(default_factory=dict)
+
+
+class _Validator:
+    """Collects problems while reading values out of the raw config."""
+
+    def __init__(self, raw: dict) -> None:
+        self.raw = raw
+        self.problems: list[str] = []
+
+    def problem(self, message: str) -> None:
+        if message not in self.problems:
+            self.problems.append(message)
+
+    def section(self, name: str, required: bool = True) -> dict:
+        value = self.raw.get(name)
+
+        if value is None:
+            if required:
+                self.problem(f"missing section \"{name}\"")
+            return {}
+
+        if not isinstance(value, dict):
+            self.problem(f"\"{name}\" must be an object")
+            return {}
+
+        return value
+
+    def get(self, section: str, key: str, kind: type | tuple[type, ...], default: Any = ...) -> Any:
+        """Returns section.key, checked against kind. Missing keys fall back
+        on default, or are a problem if there is none."""
+        value = self.section(section, required=default is ...).get(key, default)
+
+        if value is ...:
+            # A missing section has already been reported as a whole
+            if isinstance(self.raw.get(section), dict):
+                self.problem(f"missing \"{section}.{key}\"")
+            return None
+
+        # bool is an int, but never a sensible number here
+        if not isinstance(value, kind) or (isinstance(value, bool) and bool not in _as_tuple(kind)):
+            names = " or ".join(t.__name__ for t in _as_tuple(kind))
+            self.problem(f"\"{section}.{key}\" must be {names}, not {type(value).__name__}")
+            return default if default is not ... else None
+
+        return value
+
+    def choice(self, section: str, key: str, choices: tuple[str, ...], default: str) -> str:
+        value = self.get(section, key, str, default)
+
+        if value not in choices:
+            self.problem(f"\"{section}.{key}\" must be one of {', '.join(choices)}, not {value!r}")
+            return default
+
+        return value
+
+    def image_list(self, key: str) -> tuple[str, ...]:
+        images = self.get("metadata", key, list)
+
+        if images is None:
+            return ()
+        if not images or not all(isinstance(image, str) for image in images):
+            self.problem(f"\"metadata.{key}\" must be a non-empty list of image names")
+
+        return tuple(images)
+
+    def in_range(self, section: str, key: str, value: Any, kind: str, default: Any) -> Any:
+        """Returns value if it is within the given kind of range (see
+        RANGES), or default after reporting it."""
+        if value is None:
+            return value
+
+        if kind == "positive" and not value > 0:
+            self.problem(f"\"{section}.{key}\" must be positive, not {value!r}")
+        elif kind == "retries" and (not isinstance(value, int) or value < 0):
+            self.problem(f"\"{section}.{key}\" must be a whole number of at least 0, not {value!r}")
+        elif kind == "count" and (not isinstance(value, int) or value < 1):
+            self.problem(f"\"{section}.{key}\" must be a whole number of at least 1, not {value!r}")
+        elif kind == "port" and (not isinstance(value, int) or not 1 <= value <= 65535):
+            self.problem(f"\"{section}.{key}\" must be a port number (1-65535), not {value!r}")
+        else:
+            return value
+
+        return default
+
+    def defaults(self, name: str, defaults: dict[str, Any]) -> dict[str, Any]:
+        """Reads an optional section, filling in defaults. Each setting must
+        be of the same kind as its default: a number (within its RANGES), a
+        flag, or a string (which may also be null if the default is, or if it
+        is one of the NULLABLE_PATHS)."""
+        values = dict(defaults)
+
+        for key, value in self.section(name, required=False).items():
+            default = defaults.get(key, ...)
+
+            if default is ...:
+                self.problem(f"unknown setting \"{name}.{key}\"")
+            elif key == "source":
+                values[key] = self.choice(name, key, WEATHER_SOURCES, default)
+            elif isinstance(default, bool):
+                values[key] = self.get(name, key, bool, default)
+            elif default is None or f"{name}.{key}" in NULLABLE_PATHS:
+                values[key] = self.get(name, key, (str, type(None)), default)
+            elif isinstance(default, str):
+                values[key] = self.get(name, key, str, default)
+            else:
+                value = self.get(name, key, (int, float), default)
+                values[key] = self.in_range(name, key, value, RANGES[f"{name}.{key}"], default)
+
+        return values
+
+
+def _as_tuple(kind: type | tuple[type, ...]) -> tuple[type, ...]:
+    return kind if isinstance(kind, tuple) else (kind,)
+
+
+def parse_config(raw: Any) -> Config:
+    """Validates an already parsed config.json. Raises ConfigError listing
+    everything that is wrong with it."""
+    if not isinstance(raw, dict):
+        raise ConfigError("config.json must contain a JSON object")
+
+    v = _Validator(raw)
+    number = (int, float)
+    rpc_id = (str, int)
+
+    config = dict(
+        spotify_client_id=v.get("spotify_api", "client_id", str),
+        spotify_client_secret=v.get("spotify_api", "client_secret", str),
+        spotify_redirect_uri=v.get("spotify_api", "redirect_uri", str),
+        token_cache=v.get("spotify_api", "token_cache", (str, type(None)), ".cache"),
+        token_refresh_margin=v.get("spotify_api", "token_refresh_margin", number, 300),
+
+        weather_api_key=v.get("general_api_keys", "weather_api_key", str),
+        default_rpc_id=str(v.get("general_api_keys", "default_rpc_id", rpc_id)),
+        spotify_rpc_id=str(v.get("general_api_keys", "spotify_rpc_id", rpc_id)),
+
+        default_image_list=v.image_list("default_image_list"),
+        spotify_image_list=v.image_list("spotify_image_list"),
+        city=v.get("metadata", "city", str),
+        use_album_art=v.get("metadata", "use_album_art", bool, False),
+        track_cache_size=v.get("metadata", "track_cache_size", int, 64),
+        playback_source=v.choice("metadata", "playback_source", PLAYBACK_SOURCES, "auto"),
+        mpris_player=v.get("metadata", "mpris_player", str, "spotify"),
+
+        weather_cache=v.defaults("weather_cache", WEATHER_CACHE_DEFAULTS),
+        http=v.defaults("http", HTTP_DEFAULTS),
+        metrics=v.defaults("metrics", METRICS_DEFAULTS),
+        state=v.defaults("state", STATE_DEFAULTS),
+        templates=v.section("templates", required=False)
+    )
+
+    transport = raw.get("ipc_transport", Config.ipc_transport)
+    if transport not in IPC_TRANSPORTS:
+        v.problem(f"\"ipc_transport\" must be one of {', '.join(IPC_TRANSPORTS)}, not {transport!r}")
+    config["ipc_transport"] = transport
+
+    pipes = raw.get("ipc_pipes", Config.ipc_pipes)
+    if pipes not in IPC_PIPE_MODES:
+        v.problem(f"\"ipc_pipes\" must be one of {', '.join(IPC_PIPE_MODES)}, not {pipes!r}")
+    config["ipc_pipes"] = pipes
+
+    # Templates are compiled here too, so a typo fails at startup with the rest
+    for name in ("default", "spotify"):
+        overrides = config["templates"].get(name)
+        if overrides is not None and not isinstance(overrides, dict):
+            v.problem(f"\"templates.{name}\" must be an object")
+            continue
+
+        try:
+            TemplateSet.from_config(name, overrides)
+        except TemplateError as e:
+            v.problem(str(e))
+
+    if v.problems:
+        raise ConfigError("Invalid config.json:\n  - " + "\n  - ".join(v.problems))
+
+    return Config(**config)
+
+
+def load_config(path: str = "config.json") -> Config:
+    """Reads and validates config.json. Raises ConfigError if it can't be
+    read, or isn't valid."""
+    try:
+        with open(path, "r") as config_file:
+            raw = json.load(config_file)
+    except OSError as e:
+        raise ConfigError(f"Could not read {path}: {e.strerror}") from e
+    except ValueError as e:
+        raise ConfigError(f"{path} is not valid JSON: {e}") from e
+
+    return parse_config(raw)
+
+
+def changed_settings(old: Config, new: Config) -> frozenset[str]:
+    """Returns the name of every Config field that differs between the two."""
+    return frozenset(f.name for f in fields(Config) if getattr(old, f.name) != getattr(new, f.name))
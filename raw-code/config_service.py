@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import os
+
+from config import Config, ConfigError, changed_settings, load_config
+
+
+class ConfigService:
+    """Watches config.json for changes, so they can be applied without a
+    restart (see PresenceEngine).
+
+    The file is only stat-ed on each check, and only read again once its
+    modification time, size or inode changes (editors that save by renaming
+    a new file into place included). A change is validated in full before
+    it is handed out; an invalid one is reported once and ignored, and the
+    previous config stays in effect.
+    """
+
+    path: str
+    current: Config
+
+    reloads: int
+    rejected: int
+
+    def __init__(self, current: Config, path: str = "config.json") -> None:
+        """Creates a new service, starting from the given (already loaded)
+        config."""
+        self.path = path
+        self.current = current
+
+        self.reloads = 0
+        self.rejected = 0
+
+        self._signature = self._stat()
+
+    def check(self) -> tuple[Config, frozenset[str]] | None:
+        """Returns the new config and the names of the settings that changed,
+        if config.json changed (validly) since the last check, and None
+        otherwise."""
+        signature = self._stat()
+        if signature == self._signature or signature is None:
+            return None
+        self._signature = signature
+
+        try:
+            config = load_config(self.path)
+        except ConfigError as e:
+            self.rejected += 1
+            print(f"Warning: config.json change ignored, keeping the previous config. {e}")
+            return None
+
+        changed = changed_settings(self.current, config)
+        if not changed:
+            return None
+
+        self.current = config
+        self.reloads += 1
+        return config, changed
+
+    def _stat(self) -> tuple[int, int, int] | None:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
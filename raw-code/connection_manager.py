@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import os
+import time
+
+from custom_presence import EnhancedRPC, SpotifyRPC
+from discord_ipc import pipe_errors
+
+
+PresenceClient = EnhancedRPC | SpotifyRPC
+
+
+class ConnectionManager:
+    """Keeps every presence client connected at once (warm standby), and
+    switches between them by setting/clearing activity instead of tearing the
+    connections down.
+
+    A client is only (re)connected when it is first needed, or after its pipe
+    actually broke. None of the methods are thread safe: like the pypresence
+    clients themselves, they are meant to be driven from a single thread.
+    """
+
+    clients: list[PresenceClient]
+    active: PresenceClient | None
+
+    pipe_errors: tuple[type[BaseException], ...]
+
+    switches: int
+    reconnects: int
+    last_switch_latency: float | None
+
+    def __init__(self, *clients: PresenceClient) -> None:
+        """Creates a new manager over the given clients. Nothing is connected
+        until warm_up or show is called."""
+        self.clients = list(clients)
+        self.active = None
+
+        # The clients have imported their transports by now
+        self.pipe_errors = pipe_errors()
+
+        self.switches = 0
+        self.reconnects = 0
+        self.last_switch_latency = None
+
+        self._connected: set[int] = set()
+
+    def is_connected(self, client: PresenceClient) -> bool:
+        """Returns true iff the given client currently has an open pipe."""
+        return id(client) in self._connected
+
+    @property
+    def any_connected(self) -> bool:
+        """Returns true iff at least one client has an open pipe."""
+        return bool(self._connected)
+
+    def warm_up(self) -> None:
+        """Connects every client that isn't connected yet. A client that
+        fails to connect is simply left for later."""
+        for client in self.clients:
+            try:
+                self._ensure_connected(client)
+            except self.pipe_errors as e:
+                print(f"Warning: could not pre-connect {type(client).__name__}: {e}")
+
+    def show(self, client: PresenceClient) -> None:
+        """Pushes the given client's presence to Discord. If a different
+        client was showing, its activity is cleared (but its pipe stays open),
+        so switching costs two frames rather than two handshakes."""
+        if client is self.active:
+            self._with_reconnect(client, lambda: self._push(client))
+            return
+
+        start = time.perf_counter()
+
+        self._with_reconnect(client, lambda: self._push(client))
+        previous, self.active = self.active, client
+
+        if previous is not None and self.is_connected(previous):
+            try:
+                previous.clear(os.getpid())
+                previous.invalidate()
+            except self.pipe_errors:
+                # Its pipe broke while idle. It'll reconnect when next shown.
+                self._drop(previous)
+
+        self.last_switch_latency = time.perf_counter() - start
+        self.switches += 1
+
+    def disconnect(self, client: PresenceClient) -> None:
+        """Closes the given client's pipe, if it is open. It is connected
+        again when next shown."""
+        self._drop(client)
+
+    def close_all(self) -> None:
+        """Closes every open pipe."""
+        for client in self.clients:
+            self._drop(client)
+
+        self.active = None
+
+    @staticmethod
+    def _push(client: PresenceClient) -> None:
+        client.update()
+
+        # Duplicate frames are suppressed before they reach the pipe, so a
+        # dead pipe would otherwise go unnoticed until the activity changes.
+        client.check()
+
+    def _with_reconnect(self, client: PresenceClient, action) -> None:
+        """Runs action on the given client, connecting it first if needed. If
+        the pipe turns out to be broken, reconnects once and tries again."""
+        self._ensure_connected(client)
+
+        try:
+            action()
+        except self.pipe_errors:
+            self._drop(client)
+            self.reconnects += 1
+            self._ensure_connected(client)
+            action()
+
+    def _ensure_connected(self, client: PresenceClient) -> None:
+        if not self.is_connected(client):
+            client.connect()
+            client.invalidate()
+            self._connected.add(id(client))
+
+    def _drop(self, client: PresenceClient) -> None:
+        """Closes the given client's pipe (if it's still open), and forgets
+        about it."""
+        if not self.is_connected(client):
+            return
+
+        self._connected.discard(id(client))
+        if client is self.active:
+            self.active = None
+
+        try:
+            client.close()
+        except self.pipe_errors:
+            pass
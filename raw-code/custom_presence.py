@@ -1,189 +1,479 @@
 from __future__ import annotations
 
 import os
-import requests
+import threading
 import time
-import json
-from datetime import datetime, UTC
-from pypresence import Presence
-from spotipy import Spotify, SpotifyOAuth
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import metrics
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from clock import now
+from metrics import Sample
+from config import Config, load_config
+from outbound import UpdateCoalescer
+from playback_sources import PlaybackSource, PlaybackSourceError, build_sources
+from templates import ClockCache, Snapshot, TemplateSet
+from track_state import TrackCache, TrackState
+from weather_cache import WeatherCache, WeatherError
+from weather_timeline import FORECAST_POINTS, FORECAST_URL, parse_forecast, weather_at
+
+# requests, spotipy and pypresence take a while to import, and none of them
+# are needed for the first (default) frame, so they are only imported on
+# first use. See configure, get_http_session and SpotifyRPC.setup.
+if TYPE_CHECKING:
+    from spotipy import Spotify
+    from http_session import HTTPSession
+    from token_manager import TokenManager
+
+
+# The validated config.json, and everything built from it. Nothing is read
+# at import time; see configure.
+CONFIG: Config | None = None
+CONFIG_PATH: str | None = None
+HTTP_TIMEOUT: tuple[float, float] | None = None
+DEFAULT_PRESENCE_TEMPLATES: TemplateSet | None = None
+SPOTIFY_PRESENCE_TEMPLATES: TemplateSet | None = None
+WEATHER_BREAKER: CircuitBreaker | None = None
+WEATHER_CACHE: WeatherCache | None = None
+CLOCK = ClockCache()
+
+# Which settings each part is built from, for reconfigure
+TOKEN_SETTINGS = frozenset({"spotify_client_id", "spotify_client_secret", "spotify_redirect_uri",
+                            "token_cache", "token_refresh_margin"})
+SPOTIFY_SETTINGS = TOKEN_SETTINGS | {"playback_source", "mpris_player", "http"}
+TRANSPORT_SETTINGS = frozenset({"ipc_transport", "ipc_pipes"})
+
+# Built on first use, and shared from then on
+_http_session: HTTPSession | None = None
+_spotify_tokens: TokenManager | None = None
+_lazy_lock = threading.Lock()
+
+
+def configure(config: Config | None = None, path: str = "config.json") -> Config:
+    """Sets up the module from the given config (by default, read from path;
+    raises ConfigError if that is invalid). Only a config read from a file
+    can be reloaded later on (see CONFIG_PATH and ConfigService).
+
+    Only cheap work happens here: compiling the templates and loading the
+    weather cache from disk. Network clients are built on first use.
+    """
 
+    global CONFIG, CONFIG_PATH, HTTP_TIMEOUT, DEFAULT_PRESENCE_TEMPLATES, SPOTIFY_PRESENCE_TEMPLATES
+    global WEATHER_BREAKER, WEATHER_CACHE
 
-# current_config setup— based on current_config.json
-with open("config.json", "r") as config:
-    config_info = json.load(config)
+    config_path = None
+    if config is None:
+        config = load_config(path)
+        config_path = os.path.abspath(path)
 
-# Spotify API client information
-os.environ['SPOTIPY_CLIENT_ID'] = config_info["spotify_api"]["client_id"]
-os.environ['SPOTIPY_CLIENT_SECRET'] = config_info["spotify_api"]["client_secret"]
-os.environ['SPOTIPY_REDIRECT_URI'] = config_info["spotify_api"]["redirect_uri"]
+    # HTTP— one pooled session is shared by every upstream
+    HTTP_TIMEOUT = (config.http["connect_timeout"], config.http["read_timeout"])
 
-# API keys, client IDs
-WEATHER_API_KEY = config_info["general_api_keys"]["weather_api_key"]
-DEFAULT_RPC_ID = config_info["general_api_keys"]["default_rpc_id"]
-SPOTIFY_RPC_ID = config_info["general_api_keys"]["spotify_rpc_id"]
+    # presence templates— compiled once, here. Anything left out of
+    # config.json falls back to the built-in defaults.
+    DEFAULT_PRESENCE_TEMPLATES, SPOTIFY_PRESENCE_TEMPLATES = _compile_templates(config)
 
-# metadata— including image list
-DEFAULT_IMAGE_LIST = config_info["metadata"]["default_image_list"]
-SPOTIFY_IMAGE_LIST = config_info["metadata"]["spotify_image_list"]
-CURRENT_CITY = config_info["metadata"]["city"]
+    #  ̶T̶h̶i̶s̶ ̶i̶s̶ ̶E̶X̶T̶R̶E̶M̶E̶L̶Y̶ ̶p̶o̶o̶r̶ ̶p̶r̶a̶c̶t̶i̶c̶e̶.̶ ̶R̶e̶m̶e̶m̶b̶e̶r̶ ̶t̶o̶ ̶r̶e̶m̶o̶v̶e̶ ̶i̶n̶ ̶t̶h̶e̶ ̶f̶u̶t̶u̶r̶e̶!̶
+    # The global values have now been replaced with a proper (shared) cache!
+    WEATHER_BREAKER, WEATHER_CACHE = _build_weather(config)
 
-LAST_WEATHER_UPDATE = -1
-CURRENT_WEATHER_CONDITION = None
+    CONFIG, CONFIG_PATH = config, config_path
+    return config
 
 
-# Local helper functions
-def get_date_time(curr_time: int = -1, leading: bool = True, military_time: bool = False) -> dict[
-        str, dict[str, str | None] | dict[str, str] | dict[str, int]]:
-    """Returns current date and time in the style of HH:MM:AM/PM.
-    Takes time in epoch, with current time as default if none given.
+def reconfigure(config: Config, changed: frozenset[str]) -> None:
+    """Swaps in a new config (see ConfigService), only rebuilding what the
+    changed settings feed into. Everything is built before anything is
+    swapped. Live clients are brought up to date separately; see
+    CoalescedPresence.reconfigure.
 
-    Takes leading bool for whether leading zeros should be included or not.
-    Takes military_time bool for 24hr/12hr time.
+    Not thread safe with respect to rendering: the engine runs it on the IPC
+    thread, between updates.
     """
-    curr_time = time.time() if curr_time < 0 else curr_time
-    time_obj = datetime.fromtimestamp(curr_time)
-
-    # Time in day
-    hour = time_obj.strftime('%I') if not military_time else time_obj.strftime('%H')
-    if not leading:
-        hour = hour.lstrip('0')
-    minute = time_obj.strftime('%M')
-    am_pm = None if military_time else time_obj.strftime('%p')
-
-    # Day in year
-    weekday = time_obj.strftime("%A")
-    day = time_obj.strftime("%d")
-    month = time_obj.strftime("%B")
-    year = time_obj.strftime("%Y")
-
-    # Metadata
-    time_zone = datetime.fromtimestamp(3138004800).hour - datetime.fromtimestamp(3138004800, UTC).hour
-
-    # Hotfix to ensure that all timezones East of GMT have an additional "+" to
-    # follow general convention.
-    if time_zone >= 0:
-        time_zone = f"+{time_zone}"
-
-    # This is to ensure that the time_zone variable keeps one consistent type.
-    time_zone = str(time_zone)
-
-    # Formatting dict
-    time_dict = {
-        "exact": {
-            "hour": hour,
-            "minute": minute,
-            "am_pm": am_pm
-        },
-        "broad": {
-            "weekday": weekday,
-            "day": day,
-            "month": month,
-            "year": year
-        },
-        "meta": {
-            "timezone": time_zone
-        }
-    }
 
-    return time_dict
+    global CONFIG, HTTP_TIMEOUT, DEFAULT_PRESENCE_TEMPLATES, SPOTIFY_PRESENCE_TEMPLATES
+    global WEATHER_BREAKER, WEATHER_CACHE, _http_session, _spotify_tokens
+
+    templates = (_compile_templates(config) if "templates" in changed
+                 else (DEFAULT_PRESENCE_TEMPLATES, SPOTIFY_PRESENCE_TEMPLATES))
+    weather = _build_weather(config) if "weather_cache" in changed else (WEATHER_BREAKER, WEATHER_CACHE)
+
+    # The Spotify client is set up again (see SpotifyRPC.reconfigure), which
+    # restarts the background refresh with its new auth manager. The token
+    # itself is only dropped (and read back from disk) if it may not be valid
+    # any more; one saved for a different client id is ignored on the way
+    # back in (see TokenManager).
+    tokens = _spotify_tokens
+    if tokens is not None and changed & SPOTIFY_SETTINGS:
+        tokens.stop()
+
+    with _lazy_lock:
+        CONFIG = config
+        HTTP_TIMEOUT = (config.http["connect_timeout"], config.http["read_timeout"])
+        DEFAULT_PRESENCE_TEMPLATES, SPOTIFY_PRESENCE_TEMPLATES = templates
+        WEATHER_BREAKER, WEATHER_CACHE = weather
+
+        # Rebuilt on next use
+        if "http" in changed:
+            _http_session = None
+        if changed & TOKEN_SETTINGS:
+            _spotify_tokens = None
+
+
+def _compile_templates(config: Config) -> tuple[TemplateSet, TemplateSet]:
+    return (TemplateSet.from_config("default", config.templates.get("default")),
+            TemplateSet.from_config("spotify", config.templates.get("spotify")))
+
+
+def _build_weather(config: Config) -> tuple[CircuitBreaker, WeatherCache]:
+    """Fetches go through a circuit breaker, so a dead provider is left alone
+    for a while. By default, a forecast is cached rather than the current
+    weather: one fetch then covers hours, see weather_timeline."""
+
+    settings = config.weather_cache
+    forecast = settings["source"] == "forecast"
+
+    breaker = CircuitBreaker("OpenWeather",
+                             failure_threshold=settings["breaker_threshold"],
+                             reset_timeout=settings["breaker_reset"])
+    cache = WeatherCache(partial(breaker.call, fetch_weather_forecast if forecast else fetch_current_weather),
+                         path=settings["path"],
+                         ttl=settings["forecast_ttl" if forecast else "ttl"],
+                         max_staleness=settings["forecast_max_staleness" if forecast else "max_staleness"],
+                         source=settings["source"])
+
+    return breaker, cache
+
+
+def ensure_configured() -> Config:
+    """Returns the current config, loading config.json if configure hasn't
+    been called yet."""
+
+    return CONFIG if CONFIG is not None else configure()
+
+
+def get_http_session() -> HTTPSession:
+    """Returns the shared HTTP session, creating it (and importing requests)
+    on first use."""
+
+    global _http_session
+
+    with _lazy_lock:
+        if _http_session is None:
+            from http_session import HTTPSession
+
+            _http_session = HTTPSession(timeout=HTTP_TIMEOUT, retries=CONFIG.http["retries"])
+
+        return _http_session
+
+
+def get_spotify_tokens() -> TokenManager:
+    """Returns the Spotify token manager: one token for the whole process,
+    kept in memory and refreshed ahead of its expiry. Persisted to spotipy's
+    usual .cache file. Created (importing spotipy) on first use."""
+
+    global _spotify_tokens
+
+    with _lazy_lock:
+        if _spotify_tokens is None:
+            from token_manager import TokenManager
+
+            _spotify_tokens = TokenManager(path=CONFIG.token_cache,
+                                           refresh_margin=CONFIG.token_refresh_margin,
+                                           client_id=CONFIG.spotify_client_id)
+
+        return _spotify_tokens
+
+
+def make_transport(client_id: str):
+    """Returns a new IPC client for the given client id: the lean native
+    client wherever Discord uses Unix sockets, pypresence everywhere else
+    (i.e. Windows named pipes), unless config.json says otherwise.
+
+    By default, the native client fans out to every live Discord pipe (see
+    multi_pipe); with "ipc_pipes": "first", it only uses the first one.
+    pypresence always uses the first one: it takes pipe=0 to mean "any
+    pipe", so it can't be pointed at discord-ipc-0 specifically."""
+
+    if CONFIG.ipc_transport != "native":
+        from pypresence import Presence
+
+        return Presence(client_id)
+
+    from discord_ipc import IPCPresence, find_all_ipc_paths
 
+    if CONFIG.ipc_pipes != "all":
+        return IPCPresence(client_id)
 
-def get_current_weather(city: str) -> dict | None:
+    from multi_pipe import MultiPipeTransport
+
+    return MultiPipeTransport(client_id, lambda path: IPCPresence(client_id, path=path), find_all_ipc_paths)
+
+
+def collect_metrics() -> Iterator[Sample]:
+    """Reports the weather cache, HTTP and Spotify token statistics, for the
+    metrics endpoint (see metrics.py). Only what has been created so far."""
+
+    for name, value in WEATHER_CACHE.stats().items():
+        yield Sample(f"weather_cache_{name}_total", "counter", f"Weather cache {name.replace('_', ' ')}", {}, value)
+
+    if _http_session is not None:
+        for host, stats in _http_session.stats().items():
+            yield Sample("http_requests_total", "counter", "HTTP requests, by host", {"host": host},
+                         stats["requests"])
+            yield Sample("http_errors_total", "counter", "Failed HTTP requests (connection errors, 5xx), by host",
+                         {"host": host}, stats["errors"])
+            yield Sample("http_rate_limited_total", "counter", "HTTP 429s and requests held back by Retry-After",
+                         {"host": host}, stats["rate_limited"])
+
+    if _spotify_tokens is not None:
+        stats = _spotify_tokens.stats()
+        yield Sample("spotify_token_refreshes_total", "counter", "Spotify token refreshes", {},
+                     stats["refreshes"])
+        yield Sample("spotify_token_refresh_failures_total", "counter", "Failed Spotify token refreshes", {},
+                     stats["refresh_failures"])
+        if stats["expires_in"] is not None:
+            yield Sample("spotify_token_expires_in_seconds", "gauge", "Seconds until the Spotify token expires", {},
+                         stats["expires_in"])
+
+
+# Local helper functions
+def fetch_current_weather(city: str) -> dict:
     """Helper function to access the openweathermap API and retrieve local
-    weather data.
+    weather data. Always goes to the network; see get_current_weather for the
+    cached version.
 
     Choose your city as a parameter.
     Returns a dictionary with important outputs.
     """
 
-    global LAST_WEATHER_UPDATE, CURRENT_WEATHER_CONDITION
+    _key = CONFIG.weather_api_key
+    with metrics.timed("weather_fetch_seconds", endpoint="weather"):
+        response = get_http_session().get("https://api.openweathermap.org/data/2.5/weather",
+                                          params={"q": city, "appid": _key, "units": "metric"})
+
+    # Error bodies (bad key, unknown city, rate limit...) don't have the
+    # fields below, so anything missing means the provider failed us.
+    try:
+        response = response.json()
+
+        weather_data = {
+            "temp": {
+                "feels_like": response["main"]["feels_like"],
+                "temp_min": response["main"]["temp_min"],
+                "temp_nax": response["main"]["temp_max"],
+                "temp": response["main"]["temp"]
+            },
+            "weather": {
+                "description": response["weather"][0]["description"],
+                "main": response["weather"][0]["main"]
+            },
+            "meta": {
+                "city": response["name"],
+                "country": response["sys"]["country"]
+            }
+        }
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise WeatherError(f"Unexpected response from OpenWeather: {e!r}") from e
 
-    if not round(time.time()) - LAST_WEATHER_UPDATE > 1800:
-        return CURRENT_WEATHER_CONDITION
+    return weather_data
 
-    #  ̶T̶h̶i̶s̶ ̶i̶s̶ ̶E̶X̶T̶R̶E̶M̶E̶L̶Y̶ ̶p̶o̶o̶r̶ ̶p̶r̶a̶c̶t̶i̶c̶e̶.̶ ̶R̶e̶m̶e̶m̶b̶e̶r̶ ̶t̶o̶ ̶r̶e̶m̶o̶v̶e̶ ̶i̶n̶ ̶t̶h̶e̶ ̶f̶u̶t̶u̶r̶e̶!̶
-    # The issue has been resolved using global values!
-    _key = WEATHER_API_KEY
-    response = requests.get(f"https://api.openweathermap.org/data/2.5/weather?q="
-                            f"{city}&appid={_key}&units=metric").json()
-
-    weather_data = {
-        "temp": {
-            "feels_like": response["main"]["feels_like"],
-            "temp_min": response["main"]["temp_min"],
-            "temp_nax": response["main"]["temp_max"],
-            "temp": response["main"]["temp"]
-        },
-        "weather": {
-            "description": response["weather"][0]["description"],
-            "main": response["weather"][0]["main"]
-        },
-        "meta": {
-            "city": response["name"],
-            "country": response["sys"]["country"]
-        }
-    }
 
-    CURRENT_WEATHER_CONDITION = weather_data
-    LAST_WEATHER_UPDATE = round(time.time())
+def fetch_weather_forecast(city: str) -> dict:
+    """Helper function to access the openweathermap API and retrieve the
+    forecast for the next couple of days, in one request. Always goes to the
+    network.
 
-    return weather_data
+    Choose your city as a parameter.
+    Returns a timeline dictionary; see weather_timeline.
+    """
+
+    with metrics.timed("weather_fetch_seconds", endpoint="forecast"):
+        response = get_http_session().get(FORECAST_URL, params={"q": city, "appid": CONFIG.weather_api_key,
+                                                                "units": "metric", "cnt": FORECAST_POINTS})
+
+    try:
+        response = response.json()
+    except ValueError as e:
+        raise WeatherError(f"Unexpected response from OpenWeather: {e!r}") from e
 
+    return parse_forecast(response)
 
-def get_ordinal_suffix(num: int) -> str:
-    """Helper function to return a suffix for any numeral. In other words,
-    it returns '-st', '-nd', '-rd', and '-th' for any numeric input."""
 
-    # General exception edge cases- 11, 12, 13
-    if num in [11, 12, 13]:
-        return 'th'
+def get_current_weather(city: str, force: bool = False, wait: bool = True) -> dict | None:
+    """Returns the local weather data for the given city, from the shared
+    weather cache (interpolated from the cached forecast, by default).
 
-    # Generic values
-    last_digit = num % 10
+    Takes force bool to skip the cache and refresh right away.
+    Takes wait bool for whether to wait on the network if nothing is cached;
+    if not, the fetch carries on in the background and None is returned.
+    Never raises: if the provider is failing, returns the last good value
+    instead, or None if there never was one.
+    """
+
+    try:
+        if force:
+            return weather_at(WEATHER_CACHE.refresh(city), now())
+
+        return weather_at(WEATHER_CACHE.get(city, wait=wait), now())
+
+    except CircuitOpen:
+        pass
+
+    except Exception as e:
+        print(f"Warning: weather unavailable: {e}")
+
+    return weather_at(WEATHER_CACHE.last_value(city), now())
+
+
+def take_snapshot() -> Snapshot:
+    """Returns the clock and weather snapshot that a presence update renders
+    from. Taken once per update, so every line agrees on the time.
+
+    Never waits on the weather: until the first fetch is in, the weather
+    lines are simply left out."""
 
-    match last_digit:
-        case 1:
-            return 'st'
+    return Snapshot(CLOCK.snapshot(), get_current_weather(CONFIG.city, wait=False))
 
-        case 2:
-            return 'nd'
 
-        case 3:
-            return 'rd'
+class CoalescedPresence:
+    """A Discord RPC Presence Object that sends its activity through the
+    outbound stage: exact duplicates of the last frame are suppressed, and
+    bursts are collapsed to fit Discord's rate limit (see UpdateCoalescer).
 
-    # Final general catch-all
-    return 'th'
+    The pipe itself is handled by the transport (see make_transport).
+    """
+
+    outbound: UpdateCoalescer
+    current_state: dict
+    last_image: str | None
+
+    def __init__(self, client_id: str) -> None:
+        self.outbound = UpdateCoalescer()
+        self.current_state = {}
+        self.last_image = None
+        self.transport = make_transport(client_id)
+
+        # The frame showing before a restart, and its image; see restore_state
+        self._replay: tuple[str, str] | None = None
+
+    def connect(self) -> None:
+        self.transport.connect()
 
+    def clear(self, pid: int = os.getpid()) -> None:
+        self.transport.clear(pid)
 
-class EnhancedRPC(Presence):
+    def close(self) -> None:
+        self.transport.close()
+
+    def check(self) -> None:
+        """Raises if the pipe is known to be dead. Only the native transport
+        can tell without sending something."""
+        check = getattr(self.transport, "check", None)
+        if check is not None:
+            check()
+
+    def send_activity(self, activity: dict, pid: int = os.getpid(), payload_override: dict = None):
+        """Sends the given activity (a dict of Presence.update keyword
+        arguments), unless it is a duplicate or has to wait for the rate limit.
+
+        A large_image left as None is filled in from _cycle_image, but only
+        once a frame actually goes out, so the images rotate per frame rather
+        than per call.
+        """
+        self.current_state = activity
+
+        if payload_override is not None:
+            return self.transport.update(pid, payload_override=payload_override)
+
+        activity = self.outbound.submit(activity)
+        if activity is None:
+            return None
+
+        if activity["large_image"] is None:
+            activity = {**activity, "large_image": self._next_image()}
+        self.last_image = activity["large_image"]
+
+        return self.transport.update(pid, **activity)
+
+    def _next_image(self) -> str:
+        """Returns the image for the frame going out: the next one in the
+        rotation, unless the frame is the very one that was showing before a
+        restart, which then keeps its image."""
+
+        replay, self._replay = self._replay, None
+        if replay is not None and replay[0] == self.outbound.last_fingerprint:
+            return replay[1]
+
+        return self._cycle_image
+
+    def invalidate(self) -> None:
+        """Forgets the last activity sent to Discord, so that the next update
+        is sent regardless. Used whenever Discord drops the activity on its
+        end, e.g. after a (re)connect or a clear."""
+
+        self.outbound.reset()
+
+    def save_state(self) -> dict:
+        """Returns what restore_state needs to pick up where this client left
+        off after a restart (see StateSnapshot)."""
+
+        return {"fingerprint": self.outbound.last_fingerprint, "image": self.last_image}
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Picks up from a save_state taken age seconds ago, by the previous
+        process. Discord drops the activity along with the old pipe, so the
+        first frame still goes out; if it is the same one as before, it keeps
+        the same image rather than moving the rotation on."""
+
+        fingerprint, image = state.get("fingerprint"), state.get("image")
+        if isinstance(fingerprint, str) and isinstance(image, str):
+            self._replay = (fingerprint, image)
+
+    def rebind(self, client_id: str) -> None:
+        """Switches to the given client id, on a fresh transport built from
+        the current config. The old one must have been closed already (see
+        ConnectionManager.disconnect)."""
+
+        self.client_id = client_id
+        self.transport = make_transport(client_id)
+        self.invalidate()
+
+    def reconfigure(self, config: Config, changed: frozenset[str]) -> str | None:
+        """Catches up with a new config (see reconfigure, up top). Returns the
+        client id to reconnect with if the IPC transport changed, and None
+        otherwise."""
+
+        return self._rebind_to(self.client_id, changed)
+
+    def _rebind_to(self, client_id: str, changed: frozenset[str]) -> str | None:
+        """Returns the client id to reconnect with, if it or the IPC transport
+        changed, and None otherwise."""
+
+        if client_id != self.client_id or changed & TRANSPORT_SETTINGS:
+            return client_id
+        return None
+
+
+class EnhancedRPC(CoalescedPresence):
     """A Discord RPC Presence Object, specifically for use with default weather
     and time information built in.
     """
 
-    DEFAULT_ID = DEFAULT_RPC_ID
-    client_id: int
+    client_id: str
     image_num: int
 
     client_start: int
-    current_state: dict[str, str | None]
 
-    def __init__(self, client_id: int = -1) -> None:
+    def __init__(self, client_id: str | int = -1) -> None:
         """Creates a new Presence object. Takes some defaults."""
-        self.client_id = EnhancedRPC.DEFAULT_ID if client_id == -1 else client_id
+        self.client_id = ensure_configured().default_rpc_id if client_id == -1 else client_id
         self.image_num = 0
+        self._configured_id = client_id == -1
 
         # Get first start time
-        self.client_start = int(time.time())
-
-        self.current_state = {
-            "state": None,
-            "details": None,
-            "large_text": None,
-            "small_image": None,
-            "small_text": None,
-            "buttons": None
-        }
+        self.client_start = int(now())
 
         super().__init__(self.client_id)
 
@@ -199,57 +489,86 @@ class EnhancedRPC(Presence):
         """Override of default update behaviour using time and weather.
         If any of the parameters are filled, they will override the default
         parameter."""
-        if state is None and details is None:
-            state, details = EnhancedRPC.tooltip_helper()
+        started = time.perf_counter()
+        fields = take_snapshot().fields()
 
-        if large_image is None:
-            large_image = self._cycle_image
+        if state is None and details is None:
+            state, details = EnhancedRPC.tooltip_helper(fields)
 
         if start is None:
             start = self.client_start
 
         if large_text is None:
-            broad_time = get_date_time()["broad"]
-            large_text = f"{broad_time["weekday"]}, {broad_time["month"]} {broad_time["day"].lstrip('0') +
-                                                                           get_ordinal_suffix(int(broad_time["day"]))}"
+            large_text = DEFAULT_PRESENCE_TEMPLATES.render("large_text", fields)
 
-        previous_state = self.current_state.copy()
+        # An empty template leaves the tooltip out, rather than sending ""
+        if small_text is None:
+            small_text = DEFAULT_PRESENCE_TEMPLATES.render("small_text", fields) or None
 
-        # dump contents to current_config
-        self.current_state = {
+        metrics.observe("render_seconds", time.perf_counter() - started, presence="default")
+
+        activity = {
             "state": state,
             "details": details,
+            "start": start,
+            "end": end,
+            "large_image": large_image,
             "large_text": large_text,
             "small_image": small_image,
             "small_text": small_text,
-            "buttons": buttons
+            "party_id": party_id,
+            "party_size": party_size,
+            "join": join,
+            "spectate": spectate,
+            "match": match,
+            "buttons": buttons,
+            "instance": instance
         }
 
-        if self.needs_update(previous_state):
-            return super().update(pid, state, details, start, end, large_image,
-                                  large_text, small_image, small_text, party_id,
-                                  party_size, join, spectate, match, buttons,
-                                  instance, payload_override)
-
-        return
+        return self.send_activity(activity, pid, payload_override)
 
     @staticmethod
-    def tooltip_helper() -> tuple[str, str]:
+    def tooltip_helper(fields: dict[str, str] | None = None) -> tuple[str | None, str | None]:
         """Returns the default state/detail pairing for default presence update.
-        This specific implementation returns current time and weather.
+        By default this is the current time and weather, rendered from the
+        configured templates. A line whose data is unavailable (e.g. no
+        weather) is left out.
+
+        Takes the snapshot fields to render from; takes a fresh snapshot if
+        none are given.
 
         Friendly reminder: Details are displayed ABOVE the state.
         """
 
-        current_time = get_date_time()["exact"]
-        state = (f"It is {current_time["hour"].lstrip("0")}:{current_time["minute"]} {current_time["am_pm"]} "
-                 f"(UTC {get_date_time()["meta"]["timezone"]})")
+        if fields is None:
+            fields = take_snapshot().fields()
+
+        return (DEFAULT_PRESENCE_TEMPLATES.render("state", fields),
+                DEFAULT_PRESENCE_TEMPLATES.render("details", fields))
+
+    def reconfigure(self, config: Config, changed: frozenset[str]) -> str | None:
+        """Catches up with a new config (see reconfigure, up top). Returns the
+        client id to reconnect with if the client id or the IPC transport
+        changed, and None otherwise."""
+
+        if self.image_num >= len(config.default_image_list):
+            self.image_num = 0
 
-        current_weather = get_current_weather(CURRENT_CITY)
-        details = (f"{round(current_weather["temp"]["temp"])}°C, "
-                   f"{' '.join(word.capitalize() for word in current_weather["weather"]["description"].split(' '))}")
+        return self._rebind_to(config.default_rpc_id if self._configured_id else self.client_id, changed)
 
-        return state, details
+    def save_state(self) -> dict:
+        return {**super().save_state(), "client_start": self.client_start, "image_num": self.image_num}
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Also keeps the start time, so Discord's elapsed timer carries on
+        rather than starting over, and the image rotation."""
+
+        super().restore_state(state, age)
+
+        if isinstance(state.get("client_start"), int):
+            self.client_start = state["client_start"]
+        if isinstance(state.get("image_num"), int) and 0 <= state["image_num"] < len(CONFIG.default_image_list):
+            self.image_num = state["image_num"]
 
     @property
     def _cycle_image(self) -> str:
@@ -257,7 +576,7 @@ class EnhancedRPC(Presence):
 
         #  ̶T̶h̶i̶s̶ ̶s̶h̶o̶u̶l̶d̶ ̶b̶e̶ ̶c̶h̶a̶n̶g̶e̶d̶ ̶f̶o̶r̶ ̶a̶ ̶g̶e̶n̶e̶r̶a̶l̶ ̶s̶o̶l̶u̶t̶i̶o̶n̶ ̶s̶o̶m̶e̶ ̶t̶i̶m̶e̶ ̶i̶n̶ ̶t̶h̶e̶ ̶f̶u̶t̶u̶r̶e̶
         # General solution found and replaced!
-        images = DEFAULT_IMAGE_LIST
+        images = CONFIG.default_image_list
 
         # Creates a copy of the current index, then iterates the value by 1
         current_index = int(self.image_num)
@@ -265,55 +584,102 @@ class EnhancedRPC(Presence):
 
         return images[current_index]
 
-    def needs_update(self, current_config: dict) -> bool:
-        """Returns true iff the current state of the RPC is different from the
-        state offered in the current_config.
 
-        If a value in current_config is left as NoneType, its comparison will be
-        ignored.
-        """
-
-        for key in current_config:
-            if current_config[key] is not None:
-                if current_config[key] != self.current_state[key]:
-                    return True
-
-        return False
-
-
-class SpotifyRPC(Presence):
+class SpotifyRPC(CoalescedPresence):
     """A Discord RPC Presence Object, specifically for use with the Spotify API
     and displays the current music playing.
     """
 
-    DEFAULT_ID = SPOTIFY_RPC_ID
     DEFAULT_SMALL_PLAYING_ICON = "spotify_playing"
 
-    client_id: int
+    client_id: str
     image_num: int
-    spotify_client: Spotify
-    values: dict | None
-
-    current_state: dict[str, str | int | None]
-
-    def __init__(self, client_id: int = -1) -> None:
-        """Creates a new Presence object. Takes some defaults."""
-        self.client_id = SpotifyRPC.DEFAULT_ID if client_id == -1 else client_id
+    spotify_client: Spotify | None
+    track: TrackState | None
+    track_cache: TrackCache
+    sources: list[PlaybackSource]
+    source: PlaybackSource | None
+    ready: bool
+
+    def __init__(self, client_id: str | int = -1) -> None:
+        """Creates a new Presence object. Takes some defaults.
+
+        The Spotify client itself is only set up by setup (or the first
+        poll), so creating one of these is cheap."""
+        config = ensure_configured()
+        self.client_id = config.spotify_rpc_id if client_id == -1 else client_id
         self.image_num = 0
-        self.spotify_client = Spotify(auth_manager=SpotifyOAuth(scope="user-read-currently-playing"))
-        self.values = None
-
-        self.current_state = {
-            "state": None,
-            "details": None,
-            "large_text": None,
-            "small_image": None,
-            "small_text": None,
-            "buttons": None
-        }
+        self._configured_id = client_id == -1
+        self.spotify_client = None
+        self.track = None
+        self.track_cache = TrackCache(config.track_cache_size)
+        self.sources = []
+        self.source = None
+        self.ready = False
+
+        self._on_playback_change = None
+        self._setup_lock = threading.Lock()
 
         super().__init__(self.client_id)
 
+    def setup(self) -> None:
+        """Sets up the Spotify client (and its OAuth), the background token
+        refresh and the playback sources. This imports spotipy, so it takes
+        a moment; the engine runs it in the background, after the default
+        presence is up. Does nothing if already done."""
+
+        with self._setup_lock:
+            if self.ready:
+                return
+
+            from spotipy import Spotify, SpotifyOAuth
+
+            tokens = get_spotify_tokens()
+            auth_manager = SpotifyOAuth(client_id=CONFIG.spotify_client_id,
+                                        client_secret=CONFIG.spotify_client_secret,
+                                        redirect_uri=CONFIG.spotify_redirect_uri,
+                                        scope="user-read-currently-playing",
+                                        cache_handler=tokens,
+                                        requests_session=get_http_session(),
+                                        requests_timeout=HTTP_TIMEOUT)
+            self.spotify_client = Spotify(auth_manager=auth_manager,
+                                          requests_session=get_http_session(),
+                                          requests_timeout=HTTP_TIMEOUT)
+            tokens.start(auth_manager)
+
+            self.sources = build_sources(self.spotify_client, CONFIG.playback_source, CONFIG.mpris_player)
+            for source in self.sources:
+                source.on_change = self._on_playback_change
+
+            self.ready = True
+
+    def reset(self) -> None:
+        """Stops the playback sources and forgets the Spotify client, so that
+        the next poll sets everything up again from the current config."""
+
+        with self._setup_lock:
+            sources, self.sources, self.source = self.sources, [], None
+            self.spotify_client = None
+            self.ready = False
+
+        for source in sources:
+            source.close()
+
+    def reconfigure(self, config: Config, changed: frozenset[str]) -> str | None:
+        """Catches up with a new config (see reconfigure, up top): sets the
+        Spotify client up again if anything it is built from changed. Returns
+        the client id to reconnect with if the client id or the IPC transport
+        changed, and None otherwise."""
+
+        if self.image_num >= len(config.spotify_image_list):
+            self.image_num = 0
+        if "track_cache_size" in changed:
+            self.track_cache = TrackCache(config.track_cache_size)
+        if changed & SPOTIFY_SETTINGS:
+            self.reset()
+
+        return self._rebind_to(config.spotify_rpc_id if self._configured_id else self.client_id, changed)
+
     def update(self, pid: int = os.getpid(),
                state: str = None, details: str = None,
                start: int = None, end: int = None,
@@ -327,11 +693,11 @@ class SpotifyRPC(Presence):
         If any of the parameters are filled, they will override the default
         parameter."""
 
-        try:
-            default_values = self.currently_playing_helper()
-        except TypeError:
-            time.sleep(5)
-            default_values = self.currently_playing_helper()
+        started = time.perf_counter()
+        fields = take_snapshot().fields()
+
+        # Renders from the last poll; see poll()
+        default_values = self.currently_playing_helper(fields, self.track)
 
         if default_values is None:
             return
@@ -339,85 +705,107 @@ class SpotifyRPC(Presence):
         if state is None and details is None:
             state, details = default_values["state"], default_values["details"]
 
-        if large_image is None:
-            large_image = self._cycle_image
-
         if small_image is None:
             small_image = SpotifyRPC.DEFAULT_SMALL_PLAYING_ICON
 
         if start is None:
             start = default_values["start"]
 
+            # The computed start drifts by a second or so between polls. Keep
+            # the previous one unless the track was actually seeked.
+            previous_start = self.current_state.get("start")
+            if previous_start is not None and abs(previous_start - start) <= 5:
+                start = previous_start
+
         if buttons is None:
             buttons = default_values["buttons"]
 
-        if large_text is None and small_text is None:
-            current_time = get_date_time()["exact"]
-            small_text = (f"It is {current_time["hour"].lstrip("0")}:{current_time["minute"]} {current_time["am_pm"]} "
-                          f"(UTC {get_date_time()["meta"]["timezone"]})")
+        # Otherwise left as None, to cycle through the image list
+        if large_image is None and CONFIG.use_album_art:
+            large_image = default_values["album_art"]
 
-            current_weather = get_current_weather(CURRENT_CITY)
-            large_text = (f"{round(current_weather["temp"]["temp"])}°C, "
-                          f"{' '.join(word.capitalize() for word in current_weather["weather"]
-                                                                                   ["description"].split(' '))}")
+        if large_text is None and small_text is None:
+            small_text = SPOTIFY_PRESENCE_TEMPLATES.render("small_text", fields)
+            large_text = SPOTIFY_PRESENCE_TEMPLATES.render("large_text", fields)
 
-        previous_state = self.current_state.copy()
+        metrics.observe("render_seconds", time.perf_counter() - started, presence="spotify")
 
-        # dump contents to current_config
-        self.current_state = {
+        activity = {
             "state": state,
             "details": details,
+            "start": start,
+            "end": end,
+            "large_image": large_image,
             "large_text": large_text,
             "small_image": small_image,
             "small_text": small_text,
-            "buttons": buttons
+            "party_id": party_id,
+            "party_size": party_size,
+            "join": join,
+            "spectate": spectate,
+            "match": match,
+            "buttons": buttons,
+            "instance": instance
         }
 
-        if self.needs_update(previous_state):
-            return super().update(pid, state, details, start, end, large_image,
-                                  large_text, small_image, small_text, party_id,
-                                  party_size, join, spectate, match, buttons,
-                                  instance, payload_override)
+        return self.send_activity(activity, pid, payload_override)
 
-        return
-
-    def currently_playing_helper(self) -> dict[str, str | list[dict]] | None:
-        """Returns currently playing song and artist, using the Spotify API.
+    def currently_playing_helper(self, fields: dict[str, str] | None = None,
+                                 track: TrackState | None = None) -> dict[str, str | list[dict] | None] | None:
+        """Returns currently playing song and artist, from the given track (the
+        last poll by default). Returns None if nothing is playing.
+        Takes the snapshot fields the templates may use on top of the track.
         Friendly reminder: Details are displayed ABOVE the state.
         """
 
-        try:
-            results = self.values.copy()
-            state = f"by {', '.join([artist['name'] for artist in results['item']['artists']])}"
-            details = f"{results['item']['name']}"
+        track = self.track if track is None else track
 
-        except TypeError:
+        if track is None:
             # Perhaps could be the result of the player not working—
             # Just return for now. Check for whether the player is still running
             return None
 
-        # buttons
-        button = [{"label": "Play on Spotify", "url": f"spotify://track/{results['item']['id']}"}]
+        info = self.track_cache.get(track)
+        fields = {
+            **(fields or {}),
+            "artists": info.artists,
+            "title": info.title
+        }
+        state = SPOTIFY_PRESENCE_TEMPLATES.render("state", fields)
+        details = SPOTIFY_PRESENCE_TEMPLATES.render("details", fields)
 
         # start time
-        start = round(time.time() - results['progress_ms'] / 1000)
+        start = round(now() - track.progress / 1000)
 
         output_config = {
             "state": state,
             "details": details,
             "start": start,
-            "buttons": button
+            "buttons": info.buttons,
+            "album_art": info.album_art
         }
 
         return output_config
 
+    def save_state(self) -> dict:
+        return {**super().save_state(), "image_num": self.image_num}
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Also keeps the image rotation. The track is restored by the
+        SpotifyProvider, which knows when it was polled."""
+
+        super().restore_state(state, age)
+
+        if isinstance(state.get("image_num"), int) and 0 <= state["image_num"] < len(CONFIG.spotify_image_list):
+            self.image_num = state["image_num"]
+
     @property
     def _cycle_image(self) -> str:
         """Cycles linearly through the images, and returns the next one."""
 
         #  ̶T̶h̶i̶s̶ ̶s̶h̶o̶u̶l̶d̶ ̶b̶e̶ ̶c̶h̶a̶n̶g̶e̶d̶ ̶f̶o̶r̶ ̶a̶ ̶g̶e̶n̶e̶r̶a̶l̶ ̶s̶o̶l̶u̶t̶i̶o̶n̶ ̶s̶o̶m̶e̶ ̶t̶i̶m̶e̶ ̶i̶n̶ ̶t̶h̶e̶ ̶f̶u̶t̶u̶r̶e̶
         # General solution found and replaced!
-        images = SPOTIFY_IMAGE_LIST
+        images = CONFIG.spotify_image_list
 
         # Creates a copy of the current index, then iterates the value by 1
         current_index = int(self.image_num)
@@ -425,45 +813,69 @@ class SpotifyRPC(Presence):
 
         return images[current_index]
 
-    @property
-    def is_playing(self) -> bool:
-        """Return whether the Spotify client is running, and is actively playing
-        a song."""
+    def poll(self) -> TrackState | None:
+        """Asks the first available playback source what is playing, and
+        keeps the parsed result as the track that is_playing and update()
+        work from. Falls back on the next source if one can't answer."""
 
-        # check for whether the client is playing music
-        # Set the market as CA to reduce the amount of data transferred
-        # Also useful for debugging purposes!
-        self.values = self.spotify_client.currently_playing(market="CA")
+        self.setup()
+        error = None
 
-        try:
-            if "is_playing" in self.values:
-                return self.values["is_playing"]
-        except TypeError:
-            pass
+        # reset() swaps in a new list rather than emptying this one, so the
+        # sources can be iterated outside the lock (polls are network calls)
+        with self._setup_lock:
+            sources = self.sources
 
-        return False
+        for source in sources:
+            if not source.available:
+                continue
 
-    def needs_update(self, current_config: dict) -> bool:
-        """Returns true iff the current state of the RPC is different from the
-        state offered in the current_config.
+            try:
+                self.track = source.poll()
+            except PlaybackSourceError as e:
+                error = e
+                continue
 
-        If a value in current_config is left as NoneType, its comparison will be
-        ignored.
+            if source is not self.source:
+                print(f"\33[97mPlayback source: {source.name}")
+                self.source = source
 
-        In this version, the "start" value is treated DIFFERENTLY with a 5-
-        second error given to prevent discrepancies in pipeline.
-        """
+            return self.track
+
+        self.track = None
+        if error is not None:
+            raise error
 
-        for key in current_config:
-            if current_config[key] is not None:
+        return None
 
-                if key == "start" and abs(self.current_state[key] - current_config[key]) > 5:
-                    return True
+    def watch_playback(self, callback: Callable[[], None] | None) -> None:
+        """Sets the callback that sources which push changes (MPRIS) call as
+        soon as playback changes. Called from their own threads."""
 
-                elif current_config[key] != self.current_state[key]:
-                    return True
+        with self._setup_lock:
+            self._on_playback_change = callback
+            for source in self.sources:
+                source.on_change = callback
+
+    def shutdown(self) -> None:
+        """Stops every playback source, and the background token refresh."""
+
+        with self._setup_lock:
+            sources = self.sources
+
+        for source in sources:
+            source.close()
+
+        if _spotify_tokens is not None:
+            _spotify_tokens.stop()
+
+    @property
+    def is_playing(self) -> bool:
+        """Return whether the Spotify client is running, and is actively playing
+        a song, as of the last poll."""
 
-        return False
+        track = self.track
+        return track is not None and track.is_playing
 
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+"""Headless entry point, for running the presence as a background service
+(e.g. a systemd user unit) instead of from the tray:
+
+    python daemon.py
+
+Nothing here imports Qt or win11toast. Stop it with SIGTERM or Ctrl+C; the
+connection status is printed rather than shown in a tray icon.
+"""
+from __future__ import annotations
+
+import os
+import signal
+import sys
+import threading
+
+import custom_presence
+from config import ConfigError
+from event_loop import presence_event_loop
+from presence_engine import PresenceEngine, get_quick_timestamp
+
+# How often the status is checked for changes, in seconds
+STATUS_INTERVAL = 1.0
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def print_status(engine: PresenceEngine, stop_event: threading.Event) -> None:
+    """Prints every change in the engine's status until the stop_event is
+    set. Stands in for the tray's status line."""
+    last_status = None
+
+    while not stop_event.wait(STATUS_INTERVAL):
+        status = (engine.state.value, engine.active_provider or "No")
+
+        if status != last_status:
+            print(f"\33[97mDiscord: {status[0]}, {status[1]} presence ({get_quick_timestamp()})")
+            last_status = status
+
+
+def daemon_event_loop() -> int:
+    # Under a service manager stdout is a pipe: without this, every message
+    # (the engine's too) would sit in the buffer until it fills up
+    sys.stdout.reconfigure(line_buffering=True)
+
+    try:
+        custom_presence.configure()
+    except ConfigError as e:
+        print(f"\33[91m{e}")
+        return 1
+
+    stop_event = threading.Event()
+    engine = PresenceEngine(stop_event)
+
+    def on_signal(signum: int, _frame) -> None:
+        print(f"\33[97mReceived {signal.Signals(signum).name}, shutting down")
+        stop_event.set()
+
+    # Signal handlers only ever run on the main thread, so the engine runs on a
+    # worker like in tray mode, and the main thread just watches it
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+
+    worker = threading.Thread(
+        target=presence_event_loop,
+        args=(stop_event, engine),
+        daemon=True,
+        name="MainEventLoop"
+    )
+    worker.start()
+    print(f"\33[97mDiscordRPC activated: {get_quick_timestamp()}")
+
+    print_status(engine, stop_event)
+
+    worker.join(timeout=SHUTDOWN_TIMEOUT)
+    if worker.is_alive():
+        print(f"Warning: engine did not stop within {SHUTDOWN_TIMEOUT:.0f} s")
+        return 1
+
+    print(f"\33[97mDiscordRPC closed: {get_quick_timestamp()}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit_code = daemon_event_loop()
+
+    # A call still stuck on an executor thread (e.g. the Spotify login, waiting
+    # on its redirect) would keep the interpreter from ever exiting
+    sys.stdout.flush()
+    os._exit(exit_code)
@@ -0,0 +1,408 @@
+from __future__ import annotations
+
+import itertools
+import json
+import os
+import select
+import socket
+import struct
+import sys
+import tempfile
+import time
+
+
+# Opcodes of Discord's IPC framing
+OP_HANDSHAKE = 0
+OP_FRAME = 1
+OP_CLOSE = 2
+OP_PING = 3
+OP_PONG = 4
+
+HEADER = struct.Struct("<II")
+
+# Where the various Discord builds (native, snap, flatpak) put their sockets,
+# relative to the runtime directory
+IPC_SUBDIRECTORIES = (".", "snap.discord", "app/com.discordapp.Discord", "app/com.discordapp.DiscordCanary")
+IPC_PIPES = range(10)
+
+# How much unsent data may pile up before a write waits for the socket
+MAX_BUFFERED = 64 * 1024
+
+
+class IPCError(Exception):
+    """Base class of everything the native transport raises when the pipe
+    itself fails (see pipe_errors)."""
+
+
+class DiscordNotFound(IPCError, FileNotFoundError):
+    """Raised when no Discord IPC socket could be found."""
+
+
+class PipeClosed(IPCError, ConnectionError):
+    """Raised when Discord closed the socket, or it broke."""
+
+
+class ServerError(Exception):
+    """Raised when Discord answered a command with an error (e.g. a details
+    line over 128 characters). Not an IPCError: the pipe is fine, it was the
+    payload that was refused."""
+
+
+def pipe_errors() -> tuple[type[BaseException], ...]:
+    """Returns everything that means "this pipe is gone", as opposed to a bad
+    payload (ServerError). pypresence's errors are only included if it is in
+    use, so that the native transport never has to import it."""
+    errors = (OSError, AssertionError, IPCError)
+
+    if "pypresence" in sys.modules:
+        # Not ServerError, nor argument errors. DiscordError (and InvalidID)
+        # only come out of a refused handshake.
+        from pypresence.exceptions import (ConnectionTimeout, DiscordError, DiscordNotFound, InvalidPipe, PipeClosed,
+                                           ResponseTimeout)
+        errors += (ConnectionTimeout, DiscordError, DiscordNotFound, InvalidPipe, PipeClosed, ResponseTimeout)
+
+    return errors
+
+
+def ipc_directories() -> list[str]:
+    """Returns every directory a Discord IPC socket may live in."""
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return [os.path.join(base, subdirectory) for subdirectory in IPC_SUBDIRECTORIES]
+
+
+def find_ipc_paths() -> list[str]:
+    """Returns the path of every live discord-ipc-{0..9} socket, in pipe
+    order."""
+    paths = []
+    for pipe in IPC_PIPES:
+        for directory in ipc_directories():
+            path = os.path.join(directory, f"discord-ipc-{pipe}")
+            if os.path.exists(path):
+                paths.append(path)
+                break
+
+    return paths
+
+
+def find_all_ipc_paths() -> list[str]:
+    """Returns the path of every live discord-ipc-{0..9} socket, in every
+    directory, in pipe order: e.g. stable, PTB and Canary running side by
+    side, or a native and a flatpak build. A socket symlinked into several
+    directories is only listed once."""
+    paths, seen = [], set()
+    for pipe in IPC_PIPES:
+        for directory in ipc_directories():
+            path = os.path.join(directory, f"discord-ipc-{pipe}")
+            if os.path.exists(path) and os.path.realpath(path) not in seen:
+                seen.add(os.path.realpath(path))
+                paths.append(os.path.normpath(path))
+
+    return paths
+
+
+def find_ipc_path(pipe: int | None = None) -> str | None:
+    """Returns the path of the given pipe's socket, or of the first live one
+    if pipe is None. Returns None if there isn't one."""
+    if pipe is None:
+        paths = find_ipc_paths()
+        return paths[0] if paths else None
+
+    for directory in ipc_directories():
+        path = os.path.join(directory, f"discord-ipc-{pipe}")
+        if os.path.exists(path):
+            return path
+
+    return None
+
+
+def build_activity(state: str = None, details: str = None,
+                   start: int = None, end: int = None,
+                   large_image: str = None, large_text: str = None,
+                   small_image: str = None, small_text: str = None,
+                   party_id: str = None, party_size: list = None,
+                   join: str = None, spectate: str = None,
+                   match: str = None, buttons: list = None,
+                   instance: bool = True) -> dict:
+    """Returns a SET_ACTIVITY activity object, leaving out every field that
+    is None (same shape as pypresence's Payload.set_activity)."""
+    activity = {}
+
+    if state is not None:
+        activity["state"] = state
+    if details is not None:
+        activity["details"] = details
+
+    timestamps = {}
+    if start:
+        timestamps["start"] = int(start)
+    if end:
+        timestamps["end"] = int(end)
+    if timestamps:
+        activity["timestamps"] = timestamps
+
+    assets = {key: value for key, value in (("large_image", large_image), ("large_text", large_text),
+                                            ("small_image", small_image), ("small_text", small_text))
+              if value is not None}
+    if assets:
+        activity["assets"] = assets
+
+    party = {key: value for key, value in (("id", party_id), ("size", party_size)) if value is not None}
+    if party:
+        activity["party"] = party
+
+    secrets = {key: value for key, value in (("join", join), ("spectate", spectate), ("match", match))
+               if value is not None}
+    if secrets:
+        activity["secrets"] = secrets
+
+    if buttons is not None:
+        activity["buttons"] = buttons
+
+    activity["instance"] = instance
+
+    return activity
+
+
+class IPCPresence:
+    """A lean, native Discord RPC client for Unix sockets, meant as a drop-in
+    replacement for pypresence's Presence.
+
+    Frames are written straight to a non-blocking socket. SET_ACTIVITY writes
+    are pipelined: update() returns as soon as the frame is handed to the
+    kernel, and responses are matched to their commands by nonce whenever the
+    socket is next touched. An error reported by Discord is raised on the next
+    call.
+    """
+
+    client_id: str
+    pipe: int | None
+    path: str | None
+    connection_timeout: float
+    response_timeout: float
+
+    pending: dict[str, float]
+    last_latency: float | None
+
+    def __init__(self, client_id: str | int, pipe: int | None = None,
+                 connection_timeout: float = 30, response_timeout: float = 10,
+                 path: str | None = None) -> None:
+        """Creates a new client. Connects to the socket at the given path, or
+        else to the given pipe (the first live one by default)."""
+        self.client_id = str(client_id)
+        self.pipe = pipe
+        self.path = path
+        self.connection_timeout = connection_timeout
+        self.response_timeout = response_timeout
+
+        self.pending = {}
+        self.last_latency = None
+
+        self._sock: socket.socket | None = None
+        self._in = bytearray()
+        self._out = bytearray()
+        self._error: ServerError | None = None
+        self._nonces = itertools.count()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock is not None
+
+    def connect(self) -> None:
+        """Opens the socket and does the handshake."""
+        path = self.path if self.path is not None else find_ipc_path(self.pipe)
+        if path is None or not os.path.exists(path):
+            raise DiscordNotFound("Could not find a Discord IPC socket")
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.connection_timeout)
+        try:
+            sock.connect(path)
+        except OSError:
+            sock.close()
+            raise
+
+        sock.setblocking(False)
+        self._sock = sock
+        self._in.clear()
+        self._out.clear()
+        self.pending.clear()
+        self._error = None
+
+        self._send(OP_HANDSHAKE, {"v": 1, "client_id": self.client_id})
+        op, data = self._wait_for_frame(self.connection_timeout)
+
+        if op == OP_CLOSE or "code" in data:
+            self._teardown()
+            raise PipeClosed(data.get("message", "Handshake refused"))
+
+    def update(self, pid: int = os.getpid(),
+               state: str = None, details: str = None,
+               start: int = None, end: int = None,
+               large_image: str = None, large_text: str = None,
+               small_image: str = None, small_text: str = None,
+               party_id: str = None, party_size: list = None,
+               join: str = None, spectate: str = None,
+               match: str = None, buttons: list = None,
+               instance: bool = True, payload_override: dict = None) -> str:
+        """Sends a SET_ACTIVITY command. Returns its nonce without waiting for
+        Discord to answer."""
+        if payload_override is not None:
+            return self._command(payload_override)
+
+        activity = build_activity(state, details, start, end, large_image, large_text,
+                                  small_image, small_text, party_id, party_size,
+                                  join, spectate, match, buttons, instance)
+        return self._command({"cmd": "SET_ACTIVITY", "args": {"pid": pid, "activity": activity}})
+
+    def clear(self, pid: int = os.getpid()) -> str:
+        """Clears the activity. Returns the command's nonce."""
+        return self._command({"cmd": "SET_ACTIVITY", "args": {"pid": pid}})
+
+    def check(self) -> None:
+        """Handles whatever Discord sent since the last call, without
+        blocking. Raises PipeClosed if the socket is gone."""
+        self._pump()
+
+    def flush(self, timeout: float | None = None) -> None:
+        """Waits until every command sent so far has been answered."""
+        deadline = time.monotonic() + (self.response_timeout if timeout is None else timeout)
+
+        while self.pending or self._out:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{len(self.pending)} IPC responses still outstanding")
+            self._wait(remaining, writing=bool(self._out))
+            self._pump()
+
+    def close(self) -> None:
+        """Says goodbye to Discord and closes the socket."""
+        if self._sock is None:
+            return
+
+        try:
+            self._send(OP_CLOSE, {"v": 1, "client_id": self.client_id})
+        except OSError:
+            pass
+        finally:
+            self._teardown()
+
+    def _command(self, payload: dict) -> str:
+        if self._sock is None:
+            raise PipeClosed("Not connected")
+
+        self._pump()
+
+        nonce = payload.get("nonce")
+        if nonce is None:
+            nonce = payload["nonce"] = str(next(self._nonces))
+
+        self.pending[nonce] = time.perf_counter()
+        self._send(OP_FRAME, payload)
+
+        return nonce
+
+    def _send(self, op: int, payload: dict) -> None:
+        data = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+        self._out += HEADER.pack(op, len(data))
+        self._out += data
+
+        # Only block if Discord has stopped reading altogether
+        if len(self._out) > MAX_BUFFERED:
+            self._wait(self.response_timeout, writing=True)
+
+        self._flush_out()
+
+    def _flush_out(self) -> None:
+        while self._out:
+            try:
+                sent = self._sock.send(self._out)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self._teardown()
+                raise PipeClosed(str(e)) from e
+
+            del self._out[:sent]
+
+    def _pump(self) -> None:
+        """Writes whatever is buffered, reads whatever has arrived, and
+        handles the frames in it. Raises any error Discord reported since."""
+        if self._sock is None:
+            raise PipeClosed("Not connected")
+
+        self._flush_out()
+        self._read_available()
+
+        while (frame := self._next_frame()) is not None:
+            self._handle(*frame)
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _read_available(self) -> None:
+        while True:
+            try:
+                chunk = self._sock.recv(65536)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                self._teardown()
+                raise PipeClosed(str(e)) from e
+
+            if not chunk:
+                self._teardown()
+                raise PipeClosed("Discord closed the connection")
+
+            self._in += chunk
+
+    def _next_frame(self) -> tuple[int, dict] | None:
+        if len(self._in) < HEADER.size:
+            return None
+
+        op, length = HEADER.unpack_from(self._in)
+        if len(self._in) < HEADER.size + length:
+            return None
+
+        data = json.loads(self._in[HEADER.size:HEADER.size + length])
+        del self._in[:HEADER.size + length]
+
+        return op, data
+
+    def _handle(self, op: int, data: dict) -> None:
+        if op == OP_PING:
+            self._send(OP_PONG, data)
+            return
+
+        if op == OP_CLOSE:
+            self._teardown()
+            raise PipeClosed(data.get("message", "Discord closed the connection"))
+
+        sent_at = self.pending.pop(data.get("nonce"), None)
+        if sent_at is not None:
+            self.last_latency = time.perf_counter() - sent_at
+
+        if data.get("evt") == "ERROR":
+            self._error = ServerError(data.get("data", {}).get("message", "Unknown error"))
+
+    def _wait_for_frame(self, timeout: float) -> tuple[int, dict]:
+        deadline = time.monotonic() + timeout
+
+        while (frame := self._next_frame()) is None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._teardown()
+                raise TimeoutError("Timed out waiting for Discord")
+            self._wait(remaining, writing=bool(self._out))
+            self._flush_out()
+            self._read_available()
+
+        return frame
+
+    def _wait(self, timeout: float, writing: bool = False) -> None:
+        select.select([self._sock], [self._sock] if writing else [], [], timeout)
+
+    def _teardown(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
@@ -1,80 +1,37 @@
 from __future__ import annotations
 
+import asyncio
 import threading
-import time
-from datetime import datetime
 import sys
+from typing import TYPE_CHECKING
 
-from PyQt6.QtWidgets import QApplication, QSystemTrayIcon, QMenu
-from PyQt6.QtGui import QIcon, QAction
+import custom_presence
+from clock import get_clock
+from config import ConfigError
+from presence_engine import PresenceEngine
 
-from win11toast import toast
+# Qt and win11toast are only imported by the tray mode itself, so the headless
+# daemon (see daemon.py) can share presence_event_loop without loading them.
+if TYPE_CHECKING:
+    from PyQt6.QtWidgets import QApplication
 
-from custom_presence import EnhancedRPC, SpotifyRPC
 
-
-def get_quick_timestamp() -> str:
-    """quick and dirty func to get a simple timestamp for informational purposes"""
-    return datetime.fromtimestamp(time.time()).strftime('%I:%M %p')
-
-
-def presence_event_loop(stop_event: threading.Event):
-    default_client = EnhancedRPC()
-    spotify_client = SpotifyRPC()
+def presence_event_loop(stop_event: threading.Event, engine: PresenceEngine | None = None):
+    if engine is None:
+        engine = PresenceEngine(stop_event)
     # Quick client connection startup
     print("\33[37mClients instantiated!")
 
-    # The below is a terrible, hacky workaround for a silly Windows issue.
-    while not stop_event.is_set():
-        try:
-            default_client.connect()
-            default_client.update()
-            print(f"\33[97mDefault client connected: {get_quick_timestamp()}")
-
-            # infinite outer loop
-            while True:
-                # default client loop:
-                while not spotify_client.is_playing:
-                    default_client.update()
-                    time.sleep(5)
-
-                # for continuity, connect to new client before closing the previous one.
-                spotify_client.connect()
-                spotify_client.update()
-                print(f"\33[97mSpotify client connected: {get_quick_timestamp()}")
-
-                default_client.close()
-                print(f"\033[93mDefault client disconnected: {get_quick_timestamp()}")
-
-                while spotify_client.is_playing:
-                    spotify_client.update()
-                    time.sleep(5)
-
-                print(f"\33[97mDefault client connected: {get_quick_timestamp()}")
-                default_client.connect()
-                default_client.update()
-
-                print(f"\033[93mSpotify client disconnected: {get_quick_timestamp()}")
-                spotify_client.close()
+    asyncio.run(engine.run(), loop_factory=get_clock().new_event_loop)
 
-        except BrokenPipeError:
-            pass
 
-        except Exception as e:
-            print(f"Warning: {e} ({get_quick_timestamp()})")
+def tray_icon_application_builder(app: QApplication, stop_event: threading.Event,
+                                  engine: PresenceEngine | None = None):
+    from PyQt6.QtCore import QTimer
+    from PyQt6.QtWidgets import QSystemTrayIcon, QMenu
+    from PyQt6.QtGui import QIcon, QAction
+    from win11toast import toast
 
-        try:
-            default_client.close()
-        except AssertionError:
-            pass
-
-        try:
-            spotify_client.close()
-        except AssertionError:
-            pass
-
-
-def tray_icon_application_builder(app: QApplication, stop_event: threading.Event):
     # Crucial: Keeps the app running even if the main window closes
     app.setQuitOnLastWindowClosed(False)
 
@@ -90,6 +47,22 @@ def tray_icon_application_builder(app: QApplication, stop_event: threading.Event
     menu = QMenu()
     exit_app = QAction("Close presence", menu)
 
+    # Connection status, straight from the engine's supervisor
+    if engine is not None:
+        status = QAction(menu)
+        status.setEnabled(False)
+        menu.addAction(status)
+
+        def refresh_status():
+            text = f"Discord: {engine.state.value}"
+            status.setText(text)
+            tray.setToolTip(f"DiscordRPC ({text})")
+
+        refresh_status()
+        status_timer = QTimer(menu)
+        status_timer.timeout.connect(refresh_status)
+        status_timer.start(1000)
+
     def on_exit():
         stop_event.set()
         app.quit()
@@ -106,12 +79,23 @@ def tray_icon_application_builder(app: QApplication, stop_event: threading.Event
 
 
 def application_event_loop():
+    from PyQt6.QtWidgets import QApplication
+    from win11toast import toast
+
+    try:
+        custom_presence.configure()
+    except ConfigError as e:
+        print(f"\33[91m{e}")
+        toast("DiscordRPC could not start", str(e))
+        sys.exit(1)
+
     stop_event = threading.Event()
+    engine = PresenceEngine(stop_event)
 
     # Start your infinite loop in a background thread
     worker = threading.Thread(
         target=presence_event_loop,
-        args=(stop_event,),
+        args=(stop_event, engine),
         daemon=True,          # daemon => app can exit even if loop is still running
         name="MainEventLoop"
     )
@@ -121,7 +105,7 @@ def application_event_loop():
 
     # Start Qt tray on the MAIN thread
     app = QApplication(sys.argv)
-    tray = tray_icon_application_builder(app, stop_event)
+    tray = tray_icon_application_builder(app, stop_event, engine)
 
     exit_code = app.exec()
 
@@ -0,0 +1,198 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from clock import monotonic, now
+
+# (connect, read) timeouts, in seconds
+DEFAULT_TIMEOUT = (3.05, 10)
+DEFAULT_RETRIES = 2
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 4
+
+# How many latency samples each host keeps around for percentiles
+LATENCY_SAMPLES = 256
+
+
+class RateLimited(requests.exceptions.RequestException):
+    """Raised instead of making a request while its host is still inside a
+    429 Retry-After window."""
+
+
+class JitteredRetry(Retry):
+    """urllib3 Retry with full jitter on its exponential backoff, and a cap on
+    how long a single Retry-After is allowed to block the calling thread: a
+    longer one isn't retried at all, and the response is handed back for the
+    session to deal with (see HTTPSession.request).
+
+    The cap is a class attribute on purpose: urllib3 rebuilds Retry objects
+    through new(), which only knows about its own arguments.
+    """
+
+    MAX_RETRY_AFTER = 10
+
+    def get_backoff_time(self) -> float:
+        """Returns a random backoff between zero and the usual exponential
+        backoff, so retries from different callers don't line up."""
+        return random.uniform(0, super().get_backoff_time())
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        """Gives up straight away on a Retry-After longer than the cap, rather
+        than hitting the host again inside its window. With raise_on_status
+        off, urllib3 then returns the response as is."""
+        if response is not None and (self.get_retry_after(response) or 0) > JitteredRetry.MAX_RETRY_AFTER:
+            raise MaxRetryError(_pool, url, ResponseError(f"Retry-After over {JitteredRetry.MAX_RETRY_AFTER}s"))
+
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
+class HostStats:
+    """Latency and error statistics for a single upstream host."""
+
+    requests: int
+    errors: int
+    rate_limited: int
+    total_time: float
+    max_time: float
+    samples: deque[float]
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+
+    def record(self, elapsed: float) -> None:
+        """Records the latency of one request, in seconds."""
+        self.requests += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.samples.append(elapsed)
+
+    def percentile(self, pct: float) -> float:
+        """Returns the given percentile (0-100) over the recent samples."""
+        if not self.samples:
+            return 0.0
+
+        ordered = sorted(self.samples)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+    def summary(self) -> dict[str, float | int]:
+        """Returns the statistics as a plain dict."""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "mean": self.total_time / self.requests if self.requests else 0.0,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "max": self.max_time
+        }
+
+
+class HTTPSession(requests.Session):
+    """A pooled, keep-alive requests Session shared by every upstream.
+
+    Every request gets a default (connect, read) timeout, failed requests are
+    retried with jittered backoff, and a 429's Retry-After is remembered per
+    host so nothing is sent there until it has passed. Per-host latency is
+    tracked in host_stats.
+    """
+
+    timeout: float | tuple[float, float]
+    host_stats: dict[str, HostStats]
+
+    def __init__(self, timeout: float | tuple[float, float] = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES, backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 pool_size: int = DEFAULT_POOL_SIZE) -> None:
+        super().__init__()
+        self.timeout = timeout
+        self.host_stats = {}
+
+        self._blocked_until: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        retry = JitteredRetry(total=retries, connect=retries, read=retries, status=retries,
+                              backoff_factor=backoff_factor,
+                              status_forcelist=(429, 500, 502, 503, 504),
+                              respect_retry_after_header=True,
+                              raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, method, url, *args, **kwargs) -> requests.Response:
+        """Same as requests.Session.request, with a default timeout, the
+        Retry-After gate and latency bookkeeping on top."""
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+
+        host = urlsplit(url).netloc
+        stats = self._stats_for(host)
+
+        blocked_for = self._blocked_until.get(host, 0) - monotonic()
+        if blocked_for > 0:
+            stats.rate_limited += 1
+            raise RateLimited(f"{host} is rate limited for another {blocked_for:.0f}s")
+
+        start = time.perf_counter()
+        try:
+            response = super().request(method, url, *args, **kwargs)
+        except requests.exceptions.RequestException:
+            stats.errors += 1
+            raise
+        finally:
+            stats.record(time.perf_counter() - start)
+
+        if response.status_code == 429:
+            stats.rate_limited += 1
+            retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after:
+                # Nothing goes to the host until the window has passed, and
+                # the caller isn't kept waiting on it either
+                self._blocked_until[host] = monotonic() + retry_after
+                raise RateLimited(f"{host} is rate limited for {retry_after:.0f}s")
+        elif response.status_code >= 500:
+            stats.errors += 1
+
+        return response
+
+    def stats(self) -> dict[str, dict[str, float | int]]:
+        """Returns the latency statistics of every host seen so far."""
+        with self._lock:
+            return {host: stats.summary() for host, stats in self.host_stats.items()}
+
+    def _stats_for(self, host: str) -> HostStats:
+        with self._lock:
+            if host not in self.host_stats:
+                self.host_stats[host] = HostStats()
+            return self.host_stats[host]
+
+
+def _parse_retry_after(value: str | None) -> float | None:
+    """Parses a Retry-After header, which is either a number of seconds or an
+    HTTP date. Returns None if it is missing or unreadable."""
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - now(), 0.0)
+    except (TypeError, ValueError):
+        return None
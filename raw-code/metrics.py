@@ -0,0 +1,256 @@
+from __future__ import annotations
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable, NamedTuple
+
+from atomic_file import atomic_write_json
+
+# Latency buckets, in seconds: from a template render up to a hung request
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NO_TIMER = nullcontext()
+
+
+class Sample(NamedTuple):
+    """One value, as reported by a collector."""
+
+    name: str
+    kind: str  # "counter" or "gauge"
+    help: str
+    labels: dict[str, str]
+    value: float
+
+
+class Histogram:
+    """A Prometheus style histogram: cumulative bucket counts, sum and count."""
+
+    buckets: tuple[float, ...]
+    counts: list[int]
+    sum: float
+    count: int
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """Returns (le, count) pairs, +Inf included."""
+        total, out = 0, []
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            out.append((_format(bound), total))
+        out.append(("+Inf", self.count))
+        return out
+
+
+class Metrics:
+    """Everything measured across the pipeline.
+
+    Latencies and event counts are recorded as they happen (observe, inc).
+    Values other objects already keep count of (the outbound stage, the
+    connection manager, the caches...) are read by collectors, only when
+    the metrics are scraped or dumped, so they cost nothing in between.
+    """
+
+    started_at: float
+
+    def __init__(self) -> None:
+        self.started_at = time.time()
+
+        self._help: dict[str, tuple[str, str]] = {}
+        self._histograms: dict[tuple[str, tuple], Histogram] = {}
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._collectors: list[Callable[[], Iterable[Sample]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, kind: str, help: str) -> None:
+        """Sets the type and help text shown for the given metric."""
+        self._help[name] = (kind, help)
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collector: Callable[[], Iterable[Sample]]) -> None:
+        self._collectors.append(collector)
+
+    def samples(self) -> list[Sample]:
+        """Returns every counter and gauge, collectors included."""
+        with self._lock:
+            samples = [Sample(name, *self._help.get(name, ("counter", "")), dict(labels), value)
+                       for (name, labels), value in self._counters.items()]
+
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+
+        return samples
+
+    def render(self) -> str:
+        """Returns every metric in the Prometheus text format."""
+        lines = []
+        seen = set()
+
+        def header(name: str, kind: str, help: str) -> None:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help or name}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for sample in sorted(self.samples(), key=lambda s: s.name):
+            header(sample.name, sample.kind, sample.help)
+            lines.append(f"{sample.name}{_labels(sample.labels)} {_format(sample.value)}")
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            snapshots = [(key, histogram.cumulative(), histogram.sum, histogram.count)
+                         for key, histogram in histograms]
+
+        for (name, labels), buckets, total, count in snapshots:
+            header(name, "histogram", self._help.get(name, ("", ""))[1])
+            for le, cumulative in buckets:
+                lines.append(f"{name}_bucket{_labels(dict(labels), le=le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(dict(labels))} {_format(total)}")
+            lines.append(f"{name}_count{_labels(dict(labels))} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        """Returns every metric as plain JSON-able data."""
+        with self._lock:
+            histograms = [{"name": name, "labels": dict(labels), "count": histogram.count,
+                           "sum": histogram.sum, "buckets": dict(histogram.cumulative())}
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+
+        return {
+            "started_at": self.started_at,
+            "dumped_at": time.time(),
+            "samples": [sample._asdict() for sample in self.samples()],
+            "histograms": histograms
+        }
+
+    def dump(self, path: str) -> None:
+        """Writes to_dict to the given file, atomically."""
+        try:
+            atomic_write_json(path, self.to_dict(), indent=2)
+        except OSError as e:
+            print(f"Warning: could not write metrics to {path}: {e}")
+
+    def serve(self, host: str = "127.0.0.1", port: int = 9464) -> ThreadingHTTPServer:
+        """Serves render() at /metrics on a background thread. Returns the
+        server; call shutdown() on it to stop."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True, name="MetricsServer").start()
+        return server
+
+
+def _format(value: float) -> str:
+    value = float(value)
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _labels(labels: dict[str, str], **extra: str) -> str:
+    labels = {**labels, **extra}
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels.items()) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# The process wide metrics, or None while disabled. Everything below is a
+# no-op (one global lookup) until enable is called.
+METRICS: Metrics | None = None
+
+
+def enable() -> Metrics:
+    """Turns metrics on. Does nothing if they already are."""
+    global METRICS
+
+    if METRICS is None:
+        METRICS = Metrics()
+    return METRICS
+
+
+def enabled() -> bool:
+    return METRICS is not None
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    if METRICS is not None:
+        METRICS.observe(name, value, **labels)
+
+
+def inc(name: str, amount: float = 1, **labels: str) -> None:
+    if METRICS is not None:
+        METRICS.inc(name, amount, **labels)
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "started")
+
+    def __init__(self, name: str, labels: dict[str, str]) -> None:
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+def timed(name: str, **labels: str):
+    """Returns a context manager that observes how long its body took, in
+    seconds. A shared do-nothing one while metrics are disabled."""
+    if METRICS is None:
+        return _NO_TIMER
+    return _Timer(name, labels)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+from typing import Any, Callable, Hashable
+
+from discord_ipc import DiscordNotFound, PipeClosed, pipe_errors
+from supervisor import ipc_snapshot
+
+
+class MultiPipeTransport:
+    """One presence, shown on every live Discord IPC pipe at once: e.g.
+    stable, PTB and Canary side by side, or several sandboxed installs.
+
+    Looks like a single transport (connect, update, clear, check, close) to
+    everything above it, so the presence is rendered, deduplicated and rate
+    limited once, and only the final write is repeated per pipe. A session
+    whose pipe breaks is dropped on its own. It only counts as a failure once
+    every pipe is gone.
+
+    Pipes that show up later (another Discord starting) are joined on the
+    next check, and get the last activity right away. Nothing is replayed
+    on connect: a fresh connection starts blank, like a single pipe would.
+    """
+
+    client_id: str
+    sessions: dict[Hashable, Any]
+
+    def __init__(self, client_id: str, factory: Callable[[Hashable], Any],
+                 discover: Callable[[], list[Hashable]]) -> None:
+        """Creates a new fan-out. Takes a factory that returns a new
+        (single-pipe) transport for the given endpoint, and a function that
+        returns every live endpoint (socket paths)."""
+        self.client_id = client_id
+        self.sessions = {}
+
+        self._factory = factory
+        self._discover = discover
+        self._snapshot = None
+        self._last: tuple[int, dict] | None = None
+        self._errors = pipe_errors()
+
+    @property
+    def connected(self) -> bool:
+        return bool(self.sessions)
+
+    def connect(self) -> None:
+        """Connects to every live pipe. Raises if not a single one would
+        take."""
+        self.close()
+        self._errors = pipe_errors()
+        self._join_new(replay=False)
+
+        if not self.sessions:
+            raise DiscordNotFound("Could not connect to any Discord IPC pipe")
+
+    def update(self, pid: int = os.getpid(), **activity: Any) -> list:
+        """Sends the activity (Presence.update keyword arguments) to every
+        pipe. Returns each transport's result."""
+        self._last = (pid, activity)
+        return self._fan_out(lambda session: session.update(pid, **activity))
+
+    def clear(self, pid: int = os.getpid()) -> list:
+        self._last = None
+        return self._fan_out(lambda session: session.clear(pid))
+
+    def check(self) -> None:
+        """Drops every pipe known to be dead, and joins any new ones. Raises
+        PipeClosed once none are left."""
+        for endpoint, session in list(self.sessions.items()):
+            check = getattr(session, "check", None)
+            if check is None:
+                continue
+            try:
+                check()
+            except self._errors:
+                self._drop(endpoint)
+
+        if ipc_snapshot() != self._snapshot:
+            # Only pipes joining a live fan-out are caught up with the others
+            self._join_new(replay=bool(self.sessions))
+
+        if not self.sessions:
+            raise PipeClosed("Every Discord IPC pipe is gone")
+
+    def close(self) -> None:
+        """Closes every pipe, and forgets the last activity."""
+        self._last = None
+        for endpoint in list(self.sessions):
+            self._drop(endpoint)
+
+    def _fan_out(self, action: Callable[[Any], Any]) -> list:
+        if not self.sessions:
+            raise PipeClosed("Not connected")
+
+        results = []
+        for endpoint, session in list(self.sessions.items()):
+            try:
+                results.append(action(session))
+            except self._errors:
+                self._drop(endpoint)
+
+        if not self.sessions:
+            raise PipeClosed("Every Discord IPC pipe is gone")
+
+        return results
+
+    def _join_new(self, replay: bool) -> None:
+        """Connects to every live pipe that doesn't have a session yet, and
+        if replay, brings it up to date with the last activity."""
+        self._snapshot = ipc_snapshot()
+
+        for endpoint in self._discover():
+            if endpoint in self.sessions:
+                continue
+
+            session = self._factory(endpoint)
+            try:
+                session.connect()
+                if replay and self._last is not None:
+                    pid, activity = self._last
+                    session.update(pid, **activity)
+            except self._errors as e:
+                print(f"Warning: could not connect to Discord at {endpoint}: {e}")
+                try:
+                    session.close()
+                except self._errors:
+                    pass
+                continue
+
+            self.sessions[endpoint] = session
+
+    def _drop(self, endpoint: Hashable) -> None:
+        session = self.sessions.pop(endpoint, None)
+        if session is None:
+            return
+
+        try:
+            session.close()
+        except self._errors:
+            pass
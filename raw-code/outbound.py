@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from collections import deque
+from typing import Callable
+
+from clock import monotonic
+
+
+# Discord allows 5 activity updates per 20 seconds
+RATE_LIMIT_UPDATES = 5
+RATE_LIMIT_PERIOD = 20.0
+
+
+def fingerprint(payload: dict) -> str:
+    """Returns a short, stable fingerprint of an activity payload."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class UpdateCoalescer:
+    """The last stage before an activity payload goes out to Discord.
+
+    Exact duplicates of the last payload sent are suppressed outright. The
+    rest are held to Discord's activity rate limit, over a sliding window: at
+    most capacity frames in any period seconds. While the window is full,
+    only the latest payload is kept (latest wins), so a burst of changes
+    collapses into a single frame once the oldest send falls out of the
+    window, instead of being queued or dropped.
+    """
+
+    capacity: int
+    period: float
+    clock: Callable[[], float]
+
+    last_fingerprint: str | None
+    pending: dict | None
+
+    sent: int
+    suppressed: int
+    coalesced: int
+
+    def __init__(self, capacity: int = RATE_LIMIT_UPDATES, period: float = RATE_LIMIT_PERIOD,
+                 clock: Callable[[], float] = monotonic) -> None:
+        """Creates a new coalescer allowing capacity updates per period
+        seconds."""
+        self.capacity = capacity
+        self.period = period
+        self.clock = clock
+
+        self.last_fingerprint = None
+        self.pending = None
+
+        self.sent = 0
+        self.suppressed = 0
+        self.coalesced = 0
+
+        self._pending_fingerprint = None
+        self._sent_at: deque[float] = deque()
+
+    def submit(self, payload: dict) -> dict | None:
+        """Offers a payload for sending. Returns the payload to send right
+        now, or None if it is a duplicate or has to wait for room in the
+        window (in which case it is kept as the pending payload)."""
+        payload_fingerprint = fingerprint(payload)
+
+        if payload_fingerprint == self.last_fingerprint:
+            # Whatever was pending has been superseded by what's already shown
+            self.suppressed += 1
+            self.pending = self._pending_fingerprint = None
+            return None
+
+        if self.pending is not None and payload_fingerprint != self._pending_fingerprint:
+            self.coalesced += 1
+
+        self.pending = payload
+        self._pending_fingerprint = payload_fingerprint
+
+        return self.flush()
+
+    def flush(self) -> dict | None:
+        """Returns the pending payload if the window has room for it, and
+        None otherwise."""
+        if self.pending is None:
+            return None
+
+        now = self.clock()
+        self._expire(now)
+        if len(self._sent_at) >= self.capacity:
+            return None
+
+        self._sent_at.append(now)
+        payload, self.pending = self.pending, None
+        self.last_fingerprint, self._pending_fingerprint = self._pending_fingerprint, None
+        self.sent += 1
+
+        return payload
+
+    def next_flush_in(self) -> float | None:
+        """Returns how many seconds until the pending payload can go out, or
+        None if nothing is pending."""
+        if self.pending is None:
+            return None
+
+        now = self.clock()
+        self._expire(now)
+        if len(self._sent_at) < self.capacity:
+            return 0.0
+
+        return max(self._sent_at[0] + self.period - now, 0.0)
+
+    def reset(self) -> None:
+        """Forgets the last payload sent, so the next one always goes out.
+        The window is left alone: Discord still remembers."""
+        self.last_fingerprint = None
+
+    def _expire(self, now: float) -> None:
+        """Drops the sends that have left the window."""
+        while self._sent_at and self._sent_at[0] + self.period <= now:
+            self._sent_at.popleft()
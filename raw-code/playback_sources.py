@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import TYPE_CHECKING, Callable
+
+from track_state import TrackState
+
+if TYPE_CHECKING:
+    from spotipy import Spotify
+
+# jeepney (pure Python D-Bus) is only needed for MPRIS, i.e. on Linux
+try:
+    from jeepney import DBusAddress, HeaderFields, MatchRule, MessageType, Properties, message_bus
+    from jeepney.io.threading import DBusRouter, Proxy, open_dbus_connection
+except ImportError:
+    DBusRouter = None
+
+
+MPRIS_PATH = "/org/mpris/MediaPlayer2"
+MPRIS_PLAYER_INTERFACE = "org.mpris.MediaPlayer2.Player"
+PROPERTIES_INTERFACE = "org.freedesktop.DBus.Properties"
+
+
+class PlaybackSourceError(Exception):
+    """Raised by a playback source that can't be asked right now."""
+
+
+class PlaybackSource:
+    """Somewhere SpotifyRPC can find out what is playing.
+
+    on_change, if set, is called (from any thread) whenever the source learns
+    that playback changed, so the caller can poll right away instead of
+    waiting for its next scheduled poll.
+    """
+
+    name: str = "unknown"
+    on_change: Callable[[], None] | None = None
+
+    @property
+    def available(self) -> bool:
+        """Returns true iff poll() is worth calling right now."""
+        return True
+
+    def poll(self) -> TrackState | None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class WebAPISource(PlaybackSource):
+    """Polls the Spotify Web API. Works for any device, but every poll is an
+    HTTPS round trip (and needs OAuth)."""
+
+    name = "Spotify Web API"
+
+    spotify_client: Spotify
+
+    def __init__(self, spotify_client: Spotify) -> None:
+        self.spotify_client = spotify_client
+
+    def poll(self) -> TrackState | None:
+        # Set the market as CA to reduce the amount of data transferred
+        # Also useful for debugging purposes!
+        return TrackState.from_response(self.spotify_client.currently_playing(market="CA"))
+
+
+class MPRISSource(PlaybackSource):
+    """Reads playback from a local player over MPRIS, on the D-Bus session bus
+    (Linux). No network, no OAuth.
+
+    Subscribes to the player's PropertiesChanged and Seeked signals, and to it
+    appearing or disappearing from the bus, and calls on_change for each. A
+    poll is one local GetAll call.
+
+    Only available while the player is running; SpotifyRPC falls back on the
+    Web API otherwise.
+    """
+
+    name = "MPRIS"
+
+    bus_name: str
+    timeout: float
+    owner: str | None
+    signals: int
+
+    def __init__(self, player: str = "spotify", bus: str = "SESSION", timeout: float = 1.0) -> None:
+        """Connects to the given bus (the session bus by default, or a D-Bus
+        address), and starts watching org.mpris.MediaPlayer2.{player}.
+        Raises PlaybackSourceError if there is no bus to connect to."""
+        if DBusRouter is None:
+            raise PlaybackSourceError("MPRIS needs the jeepney package")
+
+        self.bus_name = f"org.mpris.MediaPlayer2.{player}"
+        self.timeout = timeout
+        self.owner = None
+        self.signals = 0
+
+        self._player = DBusAddress(MPRIS_PATH, bus_name=self.bus_name, interface=MPRIS_PLAYER_INTERFACE)
+        self._events = queue.Queue()
+
+        try:
+            self._connection = open_dbus_connection(bus)
+        except (OSError, KeyError, ValueError) as e:
+            raise PlaybackSourceError(f"No D-Bus session bus: {e}") from e
+
+        self._router = DBusRouter(self._connection)
+        bus_proxy = Proxy(message_bus, self._router, timeout=timeout)
+
+        rules = [
+            MatchRule(type="signal", interface=PROPERTIES_INTERFACE, member="PropertiesChanged",
+                      path=MPRIS_PATH),
+            MatchRule(type="signal", interface=MPRIS_PLAYER_INTERFACE, member="Seeked", path=MPRIS_PATH),
+            MatchRule(type="signal", sender="org.freedesktop.DBus", interface="org.freedesktop.DBus",
+                      member="NameOwnerChanged")
+        ]
+        rules[2].add_arg_condition(0, self.bus_name)
+
+        # Signals are filtered locally by sender (the player's unique name),
+        # since that is what they carry rather than the well known name
+        self._filters = [self._router.filter(rule, queue=self._events) for rule in rules]
+
+        try:
+            for rule in rules:
+                bus_proxy.AddMatch(rule)
+        except Exception as e:
+            self.close()
+            raise PlaybackSourceError(f"Could not subscribe to {self.bus_name}: {e}") from e
+
+        try:
+            self.owner = bus_proxy.GetNameOwner(self.bus_name)[0]
+        except Exception:
+            # Not running (yet); NameOwnerChanged will tell us when it is
+            self.owner = None
+
+        self._thread = threading.Thread(target=self._listen, daemon=True, name="MPRISListener")
+        self._thread.start()
+
+    @property
+    def available(self) -> bool:
+        return self.owner is not None
+
+    def poll(self) -> TrackState | None:
+        if self.owner is None:
+            raise PlaybackSourceError(f"{self.bus_name} is not running")
+
+        try:
+            reply = self._router.send_and_get_reply(Properties(self._player).get_all(), timeout=self.timeout)
+        except Exception as e:
+            # The player went away mid-call, the bus is gone, or it hung
+            self.owner = None
+            raise PlaybackSourceError(f"{self.bus_name} did not answer: {e}") from e
+
+        if reply.header.message_type is MessageType.error:
+            raise PlaybackSourceError(f"{self.bus_name} returned an error: {reply.body}")
+
+        return TrackState.from_mpris(reply.body[0])
+
+    def close(self) -> None:
+        self._events.put(None)
+        for handle in self._filters:
+            handle.close()
+
+        self._router.close()
+        self._connection.close()
+
+    def _listen(self) -> None:
+        """Runs on its own thread, handling signals as they come in."""
+        while True:
+            message = self._events.get()
+            if message is None:
+                return
+
+            member = message.header.fields.get(HeaderFields.member)
+            sender = message.header.fields.get(HeaderFields.sender)
+
+            if member == "NameOwnerChanged":
+                _, _, new_owner = message.body
+                self.owner = new_owner or None
+
+            elif sender != self.owner:
+                continue
+
+            elif member == "PropertiesChanged" and message.body[0] != MPRIS_PLAYER_INTERFACE:
+                continue
+
+            self.signals += 1
+            if self.on_change is not None:
+                self.on_change()
+
+
+def build_sources(spotify_client: Spotify, preference: str = "auto",
+                  player: str = "spotify") -> list[PlaybackSource]:
+    """Returns the playback sources to try, most preferred first.
+
+    preference is "web_api", "mpris" (MPRIS only, no network at all), or
+    "auto": MPRIS wherever there is a session bus, with the Web API as the
+    fallback.
+    """
+    sources = []
+
+    if preference in ("auto", "mpris"):
+        try:
+            sources.append(MPRISSource(player))
+        except PlaybackSourceError as e:
+            if preference == "mpris":
+                print(f"Warning: MPRIS unavailable: {e}")
+
+    if preference != "mpris":
+        sources.append(WebAPISource(spotify_client))
+
+    return sources
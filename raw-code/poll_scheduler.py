@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import random
+from typing import Callable
+
+from clock import monotonic
+from track_state import TrackState
+
+
+class PollScheduler:
+    """Decides when Spotify should be polled next.
+
+    While a track is playing, the end of the track is predicted from the
+    progress and duration of the last observed TrackState, and
+    polling tightens up around that boundary. While idle or paused, the
+    interval backs off exponentially instead, each wait cut short by up to
+    jitter (a fraction of it) at random, so idle polls don't settle into
+    lockstep with anything else on a round interval.
+
+    The clock is injectable, so every decision can be checked against a fake
+    clock.
+    """
+
+    clock: Callable[[], float]
+
+    playing_interval: float
+    boundary_lead: float
+    tight_interval: float
+    boundary_grace: float
+    idle_interval: float
+    idle_max_interval: float
+    backoff_factor: float
+    jitter: float
+
+    playing: bool
+    track_id: str | None
+    track_end: float | None
+    observed_at: float | None
+    idle_streak: int
+
+    def __init__(self, clock: Callable[[], float] = monotonic,
+                 playing_interval: float = 5.0, boundary_lead: float = 0.5,
+                 tight_interval: float = 0.5, boundary_grace: float = 5.0,
+                 idle_interval: float = 5.0, idle_max_interval: float = 30.0,
+                 backoff_factor: float = 2.0, jitter: float = 0.1) -> None:
+        """Creates a new scheduler. All intervals are in seconds.
+
+        playing_interval caps the gap between polls mid-track, so skips and
+        pauses are still picked up. Polling tightens to tight_interval from
+        boundary_lead before the predicted end of the track until a new track
+        shows up, for at most boundary_grace seconds.
+        """
+        self.clock = clock
+
+        self.playing_interval = playing_interval
+        self.boundary_lead = boundary_lead
+        self.tight_interval = tight_interval
+        self.boundary_grace = boundary_grace
+        self.idle_interval = idle_interval
+        self.idle_max_interval = idle_max_interval
+        self.backoff_factor = backoff_factor
+        self.jitter = jitter
+
+        self.playing = False
+        self.track_id = None
+        self.track_end = None
+        self.observed_at = None
+        self.idle_streak = 0
+
+        self._idle_jitter = 1.0
+
+    def observe(self, track: TrackState | None) -> bool:
+        """Records the result of a poll (None, if nothing is playing).
+        Returns true iff playback changed since the last poll.
+        """
+        now = self.clock()
+
+        if track is None:
+            playing, track_id, remaining = False, None, None
+        else:
+            playing, track_id, remaining = track.is_playing, track.id, track.remaining
+
+        changed = playing != self.playing or track_id != self.track_id
+
+        self.playing = playing
+        self.track_id = track_id
+        self.track_end = now + max(remaining, 0) if playing and remaining is not None else None
+        self.observed_at = now
+
+        # Drawn once per poll, so that next_delay stays the same until the next
+        self._idle_jitter = random.uniform(1 - self.jitter, 1.0)
+
+        if playing or changed:
+            self.idle_streak = 0
+        elif self.idle_interval * self.backoff_factor ** max(self.idle_streak - 1, 0) < self.idle_max_interval:
+            # No point counting past the longest wait (the power overflows
+            # after a few hours idle)
+            self.idle_streak += 1
+
+        return changed
+
+    def next_delay(self) -> float:
+        """Returns how long to wait, from now, before polling again."""
+        now = self.clock()
+
+        if self.observed_at is None:
+            return 0.0
+
+        if not self.playing:
+            delay = self.idle_interval * self.backoff_factor ** max(self.idle_streak - 1, 0)
+            delay = min(delay, self.idle_max_interval) * self._idle_jitter
+            return max(delay - (now - self.observed_at), 0.0)
+
+        next_poll = self.observed_at + self.playing_interval
+
+        if self.track_end is not None:
+            boundary = self.track_end - self.boundary_lead
+
+            # Near (or just past) the end of the track, poll tightly until the
+            # next one shows up.
+            if boundary <= now <= self.track_end + self.boundary_grace:
+                next_poll = min(next_poll, self.observed_at + self.tight_interval)
+            elif now < boundary:
+                next_poll = min(next_poll, boundary)
+
+        return max(next_poll - now, 0.0)
+
+    def due(self) -> bool:
+        """Returns true iff a poll is due right now."""
+        return self.next_delay() <= 0
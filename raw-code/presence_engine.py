@@ -0,0 +1,486 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Iterator
+
+import custom_presence
+import metrics
+from circuit_breaker import CircuitOpen
+from clock import now
+from config import Config
+from config_service import ConfigService
+from metrics import Sample
+from connection_manager import ConnectionManager
+from providers import Arbiter, PresenceProvider, ProviderRegistry, default_providers
+from state_snapshot import StateSnapshot
+from supervisor import ConnectionState, ConnectionSupervisor
+
+
+# Cadences, in seconds
+TICK_INTERVAL = 5
+MIN_POLL_INTERVAL = 0.25
+SOCKET_WATCH_INTERVAL = 0.1
+CONFIG_WATCH_INTERVAL = 2
+WEATHER_REFRESH_MARGIN = 300
+WEATHER_RETRY_INTERVAL = 60
+
+# Settings that need the weather refreshed right away when they change
+WEATHER_SETTINGS = frozenset({"city", "weather_api_key", "weather_cache"})
+
+# Per-call timeouts, in seconds (providers set their own)
+WEATHER_TIMEOUT = 15
+IPC_TIMEOUT = 10
+
+
+def get_quick_timestamp() -> str:
+    """quick and dirty func to get a simple timestamp for informational purposes"""
+    return datetime.fromtimestamp(now()).strftime('%I:%M %p')
+
+
+class PresenceEngine:
+    """Asyncio based presence engine.
+
+    Every provider (see providers.py) is polled by its own task on its own
+    thread and cadence, and the weather refresh and the Discord IPC writes
+    run as tasks of their own too, so one slow upstream never stalls the
+    others. Whenever a provider reports a change, the writer is woken and the
+    Arbiter picks what to show. Every blocking call is wrapped in a timeout,
+    and the whole thing is cancelled as soon as the stop_event is set.
+    """
+
+    stop_event: threading.Event
+    providers: ProviderRegistry
+    arbiter: Arbiter
+    connections: ConnectionManager
+    supervisor: ConnectionSupervisor
+    config_service: ConfigService | None
+    state_snapshot: StateSnapshot | None
+
+    def __init__(self, stop_event: threading.Event, providers: ProviderRegistry | None = None) -> None:
+        """Creates a new engine, over the default providers unless given
+        others. Clients are built here (outside the running event loop) so
+        pypresence gets to set up its own loops. Loads config.json if
+        custom_presence hasn't been configured yet."""
+        config = custom_presence.ensure_configured()
+
+        self.stop_event = stop_event
+        self.providers = default_providers() if providers is None else providers
+        self.arbiter = Arbiter(self.providers)
+
+        self.connections = ConnectionManager(*self.providers.clients)
+        self.supervisor = ConnectionSupervisor()
+        self._wake = None
+        self._disconnected = None
+        self._weather_changed = None
+        self._last_update_error = None
+
+        # config.json changes are applied live, unless the config didn't come
+        # from a file in the first place
+        path = custom_presence.CONFIG_PATH
+        self.config_service = ConfigService(config, path) if path is not None else None
+
+        # Warm start: picks up where the last run left off, if that was recent
+        # enough. Before anything is shown, so the first frame already counts.
+        self._state_settings = config.state
+        self.state_snapshot = None
+        if config.state["enabled"] and config.state["path"] is not None:
+            self.state_snapshot = StateSnapshot(config.state["path"], config.state["max_age"])
+            snapshot = self.state_snapshot.load()
+            if snapshot is not None:
+                self.restore_state(*snapshot)
+
+        # pypresence's synchronous Presence drives its own event loop, so all
+        # IPC calls are serialised onto one dedicated thread. Network calls get
+        # their own threads (one per provider) so a hung request only ever
+        # delays itself.
+        self._ipc_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="PresenceIPC")
+        self._weather_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="WeatherRefresh")
+        self._provider_executors = {
+            id(provider): ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{provider.name}Poll")
+            for provider in self.providers
+        }
+
+        # Metrics: only ever looked at when enabled in config.json
+        self._metrics_settings = config.metrics
+        self._metrics_server = None
+        if config.metrics["enabled"]:
+            registry = metrics.enable()
+            registry.add_collector(self.collect_metrics)
+            registry.add_collector(custom_presence.collect_metrics)
+
+            registry.describe("provider_poll_seconds", "histogram", "Provider poll latency")
+            registry.describe("weather_fetch_seconds", "histogram", "OpenWeather fetch latency")
+            registry.describe("render_seconds", "histogram", "Presence template render latency")
+            registry.describe("ipc_write_seconds", "histogram", "Discord IPC write latency")
+            registry.describe("provider_errors_total", "counter", "Failed or timed out provider polls")
+            registry.describe("ipc_failures_total", "counter", "Failed or timed out Discord IPC writes")
+            registry.describe("update_errors_total", "counter", "Presence updates that failed to build")
+
+    async def run(self) -> None:
+        """Runs every task until the stop_event is set, then tears everything
+        down."""
+        self._wake = asyncio.Event()
+        self._wake.set()
+        self._disconnected = asyncio.Event()
+        self._disconnected.set()
+        self._weather_changed = asyncio.Event()
+
+        tasks = [
+            asyncio.create_task(self._watch_stop(), name="watch_stop"),
+            asyncio.create_task(self._ticker(), name="ticker"),
+            asyncio.create_task(self._weather_refresher(), name="weather_refresher"),
+            asyncio.create_task(self._ipc_writer(), name="ipc_writer"),
+            asyncio.create_task(self._supervise(), name="supervise"),
+        ]
+        tasks += [asyncio.create_task(self._provider_poller(provider), name=f"{provider.name}_poller")
+                  for provider in self.providers]
+        if self.config_service is not None:
+            tasks.append(asyncio.create_task(self._watch_config(), name="watch_config"))
+        if self.state_snapshot is not None:
+            tasks.append(asyncio.create_task(self._save_state(), name="save_state"))
+
+        if metrics.enabled():
+            host, port = self._metrics_settings["host"], self._metrics_settings["port"]
+            try:
+                self._metrics_server = metrics.METRICS.serve(host, port)
+                print(f"\33[97mMetrics at http://{host}:{port}/metrics")
+            except OSError as e:
+                print(f"Warning: could not serve metrics on {host}:{port}: {e}")
+
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"Warning: {task.get_name()} stopped: {task.exception()} ({get_quick_timestamp()})")
+        finally:
+            # Also releases the stop watcher if some other task died first
+            self.stop_event.set()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if self.state_snapshot is not None:
+                await self._write_state()
+            await self._disconnect_all()
+
+            for provider in self.providers:
+                provider.close()
+            self._ipc_executor.shutdown(wait=False)
+            self._weather_executor.shutdown(wait=False)
+            for executor in self._provider_executors.values():
+                executor.shutdown(wait=False)
+
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server = None
+            if metrics.enabled() and self._metrics_settings["json_dump"] is not None:
+                metrics.METRICS.dump(self._metrics_settings["json_dump"])
+
+    @property
+    def active_provider(self) -> str | None:
+        """The name of the provider being shown, if any. Safe to read from
+        any thread."""
+        current = self.arbiter.current
+        return current.name if current is not None else None
+
+    @property
+    def state(self) -> ConnectionState:
+        """Where the connection to Discord stands. Safe to read from any
+        thread (e.g. the tray)."""
+        return self.supervisor.state
+
+    def collect_metrics(self) -> Iterator[Sample]:
+        """Reports the outbound, connection and arbitration statistics, for
+        the metrics endpoint (see metrics.py)."""
+        for client in self.providers.clients:
+            labels = {"client_id": str(client.client_id)}
+            yield Sample("updates_sent_total", "counter", "Activity updates sent to Discord", labels,
+                         client.outbound.sent)
+            yield Sample("updates_suppressed_total", "counter", "Activity updates suppressed as duplicates",
+                         labels, client.outbound.suppressed)
+            yield Sample("updates_coalesced_total", "counter", "Activity updates superseded while rate limited",
+                         labels, client.outbound.coalesced)
+
+            # Only known when fanning out to every pipe (see multi_pipe)
+            sessions = getattr(client.transport, "sessions", None)
+            if sessions is not None:
+                yield Sample("ipc_pipes", "gauge", "Discord IPC pipes the presence is shown on", labels,
+                             len(sessions))
+
+        yield Sample("ipc_reconnects_total", "counter", "Discord pipes reconnected after breaking", {},
+                     self.connections.reconnects)
+        yield Sample("presence_switches_total", "counter", "Switches between presences", {},
+                     self.connections.switches)
+
+        state = self.state
+        for candidate in ConnectionState:
+            yield Sample("discord_state", "gauge", "Where the connection to Discord stands (1 = current)",
+                         {"state": candidate.value}, int(candidate is state))
+
+        current = self.arbiter.current
+        for provider in self.providers:
+            yield Sample("provider_active", "gauge", "Whether a provider has something to show",
+                         {"provider": provider.name}, int(provider.active))
+            yield Sample("provider_shown", "gauge", "Whether a provider is the one being shown",
+                         {"provider": provider.name}, int(provider is current))
+
+    def capture_state(self) -> dict:
+        """Returns what the next run picks up from after a restart (see
+        StateSnapshot): every client's and provider's saved state. The
+        weather isn't included, as the weather cache persists itself. Runs on
+        the IPC thread, between updates."""
+        return {
+            "clients": {str(client.client_id): client.save_state() for client in self.providers.clients},
+            "providers": {provider.name: provider.save_state() for provider in self.providers}
+        }
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Hands a snapshot taken age seconds ago back to the clients and
+        providers it came from. Anything no longer around is skipped."""
+        clients, providers = state.get("clients"), state.get("providers")
+
+        for client in self.providers.clients:
+            saved = clients.get(str(client.client_id)) if isinstance(clients, dict) else None
+            if isinstance(saved, dict):
+                client.restore_state(saved, age)
+
+        for provider in self.providers:
+            saved = providers.get(provider.name) if isinstance(providers, dict) else None
+            if isinstance(saved, dict):
+                provider.restore_state(saved, age)
+
+    async def _call(self, executor: ThreadPoolExecutor, timeout: float,
+                    func: Callable[..., Any], *args: Any) -> Any:
+        """Runs a blocking call on the given executor, bounded by timeout."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.wait_for(loop.run_in_executor(executor, func, *args), timeout)
+
+    async def _watch_stop(self) -> None:
+        """Returns once the stop_event has been set."""
+        await asyncio.to_thread(self.stop_event.wait)
+
+    async def _ticker(self) -> None:
+        """Wakes the writer at a steady cadence so the clock stays fresh."""
+        while True:
+            await asyncio.sleep(TICK_INTERVAL)
+            self._wake.set()
+
+    async def _provider_poller(self, provider: PresenceProvider) -> None:
+        """Polls the given provider on its own cadence (or right away, when it
+        pushes a change), and wakes the writer as soon as anything it would
+        show changes, rather than waiting for the next tick."""
+        loop = asyncio.get_running_loop()
+        executor = self._provider_executors[id(provider)]
+        poll_now = asyncio.Event()
+
+        # Providers that push changes (e.g. MPRIS) get polled the moment they do
+        provider.watch(lambda: loop.call_soon_threadsafe(poll_now.set))
+
+        while True:
+            started = time.perf_counter()
+            try:
+                changed = await self._call(executor, provider.timeout, provider.poll)
+                metrics.observe("provider_poll_seconds", time.perf_counter() - started, provider=provider.name)
+                if changed:
+                    self._wake.set()
+            except asyncio.TimeoutError:
+                # Tells us nothing new, so keep the old schedule
+                metrics.inc("provider_errors_total", provider=provider.name, error="timeout")
+                print(f"Warning: {provider.name} poll timed out ({get_quick_timestamp()})")
+            except Exception as e:
+                metrics.inc("provider_errors_total", provider=provider.name, error=type(e).__name__)
+                print(f"Warning: {e} ({get_quick_timestamp()})")
+                was_active = provider.active
+                provider.failed(e)
+                if provider.active != was_active:
+                    self._wake.set()
+
+            await asyncio.sleep(MIN_POLL_INTERVAL)
+            delay = provider.next_delay()
+            try:
+                await asyncio.wait_for(poll_now.wait(),
+                                       None if delay is None else max(delay - MIN_POLL_INTERVAL, 0))
+            except asyncio.TimeoutError:
+                pass
+            poll_now.clear()
+
+    async def _weather_refresher(self) -> None:
+        """Refreshes the weather ahead of its expiry, so presence updates never
+        have to wait on OpenWeather. A warm cache from the last run is used
+        as-is; on a cold start, the writer is woken once the first weather is
+        in, since the first frames go out without it. Starts over right away
+        when the weather settings change (see _apply_config)."""
+        while True:
+            # Looked up every time, as a config change may replace them
+            weather_cache = custom_presence.WEATHER_CACHE
+            city = custom_presence.CONFIG.city
+
+            if weather_cache.expires_in(city) <= WEATHER_REFRESH_MARGIN:
+                try:
+                    await self._call(self._weather_executor, WEATHER_TIMEOUT, weather_cache.refresh, city)
+                    self._wake.set()
+                except CircuitOpen:
+                    pass
+                except asyncio.TimeoutError:
+                    print(f"Warning: weather refresh timed out ({get_quick_timestamp()})")
+                except Exception as e:
+                    print(f"Warning: {e} ({get_quick_timestamp()})")
+
+            # While the provider is down, don't even try until the breaker lets us
+            delay = max(weather_cache.expires_in(city) - WEATHER_REFRESH_MARGIN,
+                        custom_presence.WEATHER_BREAKER.retry_in(), WEATHER_RETRY_INTERVAL)
+            try:
+                await asyncio.wait_for(self._weather_changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            self._weather_changed.clear()
+
+    async def _ipc_writer(self) -> None:
+        """Pushes the active presence to Discord whenever it is woken up, as
+        long as the supervisor allows an attempt."""
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+
+            if not self.supervisor.should_attempt():
+                continue
+
+            provider = self.arbiter.pick()
+            if provider is None:
+                continue
+
+            target = provider.client
+            switching = target is not self.connections.active
+            self.supervisor.attempting()
+
+            started = time.perf_counter()
+            try:
+                await self._call(self._ipc_executor, IPC_TIMEOUT, self.connections.show, target)
+            except (asyncio.TimeoutError, *self.connections.pipe_errors) as e:
+                metrics.inc("ipc_failures_total", error=type(e).__name__)
+                await self._on_failure(e)
+                continue
+            except Exception as e:
+                # A bug in building the presence, or Discord refusing it (a
+                # ServerError): the pipes are fine, so they are left alone
+                metrics.inc("update_errors_total", error=type(e).__name__)
+                if repr(e) != self._last_update_error:
+                    print(f"Warning: could not update the {provider.name} presence: {e!r}")
+                self._last_update_error = repr(e)
+                continue
+            self._last_update_error = None
+            metrics.observe("ipc_write_seconds", time.perf_counter() - started)
+
+            if self.supervisor.record_success() is not ConnectionState.LIVE:
+                print(f"\33[97mDiscord connected: {get_quick_timestamp()}")
+
+                # Get every other client's pipe ready too, for instant switching
+                try:
+                    await self._call(self._ipc_executor, IPC_TIMEOUT * 2, self.connections.warm_up)
+                except asyncio.TimeoutError:
+                    pass
+
+            # Rate limited: make sure the held-back frame goes out once it can
+            flush_in = target.outbound.next_flush_in()
+            if flush_in is not None:
+                asyncio.get_running_loop().call_later(flush_in, self._wake.set)
+
+            if switching:
+                print(f"\33[97m{provider.name} client active: {get_quick_timestamp()} "
+                      f"(switched in {self.connections.last_switch_latency * 1000:.1f} ms)")
+
+    async def _on_failure(self, error: Exception) -> None:
+        """Hands a failed write to the supervisor. Only state changes are
+        logged, so a missing Discord doesn't flood the console."""
+        if isinstance(error, asyncio.TimeoutError):
+            error = TimeoutError("Discord update timed out")
+
+        previous = self.supervisor.record_failure(error)
+
+        if self.supervisor.state is ConnectionState.DISCONNECTED:
+            await self._disconnect_all()
+            self._disconnected.set()
+
+        if previous is not ConnectionState.CONNECTING or self.supervisor.failures == 1:
+            print(f"Warning: Discord {self.supervisor.state.value}: {error} ({get_quick_timestamp()})")
+
+    async def _supervise(self) -> None:
+        """While disconnected, wakes the writer once the backoff is over, or
+        as soon as a Discord IPC socket shows up, whichever comes first."""
+        while True:
+            await self._disconnected.wait()
+
+            while self.supervisor.state is ConnectionState.DISCONNECTED:
+                if self.supervisor.sockets_changed() or self.supervisor.should_attempt():
+                    self._wake.set()
+                await asyncio.sleep(SOCKET_WATCH_INTERVAL)
+
+            self._disconnected.clear()
+
+    async def _save_state(self) -> None:
+        """Saves a state snapshot every so often, so that even a crash leaves
+        a recent one behind."""
+        while True:
+            await asyncio.sleep(self._state_settings["save_interval"])
+            await self._write_state()
+
+    async def _write_state(self) -> None:
+        try:
+            state = await self._call(self._ipc_executor, IPC_TIMEOUT, self.capture_state)
+        except Exception as e:
+            print(f"Warning: could not capture presence state: {e} ({get_quick_timestamp()})")
+            return
+
+        await asyncio.to_thread(self.state_snapshot.save, state)
+
+    async def _watch_config(self) -> None:
+        """Applies config.json changes as they are saved. Only the parts that
+        depend on the settings that changed are rebuilt; see _apply_config."""
+        while True:
+            await asyncio.sleep(CONFIG_WATCH_INTERVAL)
+
+            change = self.config_service.check()
+            if change is None:
+                continue
+            config, changed = change
+
+            try:
+                await self._call(self._ipc_executor, IPC_TIMEOUT, self._apply_config, config, changed)
+            except Exception as e:
+                print(f"Warning: could not apply the config.json change: {e} ({get_quick_timestamp()})")
+                continue
+
+            print(f"\33[97mConfig reloaded ({', '.join(sorted(changed))}): {get_quick_timestamp()}")
+            if changed & WEATHER_SETTINGS:
+                self._weather_changed.set()
+            self._wake.set()
+
+    def _apply_config(self, config: Config, changed: frozenset[str]) -> None:
+        """Swaps the new config in, and brings every client up to date. Runs
+        on the IPC thread, so no update ever renders from half a swap."""
+        custom_presence.reconfigure(config, changed)
+
+        # Only clients whose client id or transport changed reconnect
+        for client in self.providers.clients:
+            client_id = client.reconfigure(config, changed)
+            if client_id is not None:
+                self.connections.disconnect(client)
+                client.rebind(client_id)
+
+        restart_only = changed & {"metrics", "state"}
+        if restart_only:
+            print(f"Warning: {' and '.join(sorted(restart_only))} settings only take effect after a restart")
+
+    async def _disconnect_all(self) -> None:
+        """Closes every pipe, so the next attempt reconnects from scratch."""
+        if not self.connections.any_connected:
+            return
+
+        try:
+            await self._call(self._ipc_executor, IPC_TIMEOUT, self.connections.close_all)
+            print(f"\033[93mClients disconnected: {get_quick_timestamp()}")
+        except Exception as e:
+            print(f"Warning: {e} ({get_quick_timestamp()})")
@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+from dataclasses import asdict
+from typing import Callable
+
+from custom_presence import CoalescedPresence, EnhancedRPC, SpotifyRPC
+from poll_scheduler import PollScheduler
+from track_state import TrackState
+
+
+class PresenceProvider:
+    """Something that can fill in the Discord presence: a Discord client (and
+    with it, a client id), a priority, and a poll schedule.
+
+    The engine polls every provider on its own cadence, on its own thread, so
+    a slow one never holds the others up. Each tick, the Arbiter shows the
+    active provider with the highest priority.
+
+    Subclasses override poll (and usually active and next_delay). Providers
+    that learn about changes on their own can call the callback given to
+    watch, to be polled right away.
+    """
+
+    name: str = "Provider"
+    priority: int = 0
+    timeout: float = 10
+    client: CoalescedPresence
+
+    def __init__(self, client: CoalescedPresence) -> None:
+        self.client = client
+
+    @property
+    def client_id(self) -> str:
+        return self.client.client_id
+
+    @property
+    def active(self) -> bool:
+        """Whether this provider has something to show right now."""
+        return True
+
+    def poll(self) -> bool:
+        """Refreshes whatever this provider shows. Blocking; runs on the
+        provider's own thread. Returns true iff what it would show (or
+        whether it is active at all) changed."""
+        return False
+
+    def failed(self, error: Exception) -> None:
+        """Called after poll raised (not after a timeout). Nothing by
+        default."""
+
+    def next_delay(self) -> float | None:
+        """Returns how many seconds to wait before the next poll, or None to
+        only poll when pushed (see watch)."""
+        return None
+
+    def watch(self, callback: Callable[[], None] | None) -> None:
+        """Sets the callback to call (from any thread) when this provider
+        wants to be polled right away. Ignored by default."""
+
+    def save_state(self) -> dict:
+        """Returns what restore_state needs to pick up where this provider
+        left off after a restart (see StateSnapshot). Nothing by default."""
+        return {}
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Picks up from a save_state taken age seconds ago, by the previous
+        process. Nothing by default."""
+
+    def close(self) -> None:
+        """Releases whatever the provider holds on to, other than its Discord
+        pipe (see ConnectionManager)."""
+
+
+class DefaultProvider(PresenceProvider):
+    """The time and weather presence (EnhancedRPC). Always active, at the
+    lowest priority, so it shows whenever nothing else has anything to show.
+    Nothing to poll: the clock and the weather are kept fresh by the engine."""
+
+    name = "Default"
+    priority = 0
+
+    def __init__(self, client: EnhancedRPC | None = None) -> None:
+        super().__init__(EnhancedRPC() if client is None else client)
+
+
+class SpotifyProvider(PresenceProvider):
+    """The currently playing track (SpotifyRPC). Active while something is
+    playing, polled on the PollScheduler's adaptive cadence, and right away
+    whenever a playback source pushes a change (MPRIS)."""
+
+    name = "Spotify"
+    priority = 10
+    client: SpotifyRPC
+    scheduler: PollScheduler
+
+    def __init__(self, client: SpotifyRPC | None = None, scheduler: PollScheduler | None = None) -> None:
+        super().__init__(SpotifyRPC() if client is None else client)
+        self.scheduler = PollScheduler() if scheduler is None else scheduler
+
+    @property
+    def active(self) -> bool:
+        return self.scheduler.playing
+
+    def poll(self) -> bool:
+        return self.scheduler.observe(self.client.poll())
+
+    def failed(self, error: Exception) -> None:
+        self.client.track = None
+        self.scheduler.observe(None)
+
+    def next_delay(self) -> float:
+        return self.scheduler.next_delay()
+
+    def save_state(self) -> dict:
+        track = self.client.track
+        if track is None or not self.scheduler.playing:
+            return {}
+
+        # Where the track has got to by now, rather than as of the last poll
+        progress = track.progress
+        if self.scheduler.observed_at is not None:
+            progress += int((self.scheduler.clock() - self.scheduler.observed_at) * 1000)
+
+        return {"track": {**asdict(track), "progress": progress}}
+
+    def restore_state(self, state: dict, age: float) -> None:
+        """Shows the track that was playing straight away, where it would
+        have got to by now, instead of the default presence until Spotify is
+        set up and polled. The first poll still checks."""
+        values = state.get("track")
+        if not isinstance(values, dict):
+            return
+
+        try:
+            track = TrackState(**{**values, "artists": tuple(values["artists"]),
+                                  "progress": int(values["progress"] + age * 1000)})
+        except (TypeError, KeyError, ValueError):
+            return
+
+        if track.is_playing and track.progress < track.duration:
+            self.client.track = track
+            self.scheduler.observe(track)
+
+    def watch(self, callback: Callable[[], None] | None) -> None:
+        self.client.watch_playback(callback)
+
+    def close(self) -> None:
+        self.client.watch_playback(None)
+        self.client.shutdown()
+
+
+class ProviderRegistry:
+    """The providers the engine runs, kept in order of priority (highest
+    first; ties in order of registration)."""
+
+    providers: list[PresenceProvider]
+
+    def __init__(self, *providers: PresenceProvider) -> None:
+        self.providers = []
+        for provider in providers:
+            self.register(provider)
+
+    def register(self, provider: PresenceProvider) -> PresenceProvider:
+        """Adds the given provider. Must happen before the engine starts."""
+        self.providers.append(provider)
+        self.providers.sort(key=lambda p: -p.priority)
+        return provider
+
+    @property
+    def clients(self) -> list[CoalescedPresence]:
+        """Every provider's Discord client, once each."""
+        clients = []
+        for provider in self.providers:
+            if all(provider.client is not client for client in clients):
+                clients.append(provider.client)
+        return clients
+
+    def __iter__(self):
+        return iter(self.providers)
+
+    def __len__(self) -> int:
+        return len(self.providers)
+
+
+class Arbiter:
+    """Picks which provider gets shown: the active one with the highest
+    priority."""
+
+    registry: ProviderRegistry
+    current: PresenceProvider | None
+
+    def __init__(self, registry: ProviderRegistry) -> None:
+        self.registry = registry
+        self.current = None
+
+    def pick(self) -> PresenceProvider | None:
+        """Returns the winning provider, or None if none is active, and
+        remembers it as current."""
+        self.current = next((provider for provider in self.registry if provider.active), None)
+        return self.current
+
+
+def default_providers() -> ProviderRegistry:
+    """Returns the standard registry: Spotify over the default presence."""
+    return ProviderRegistry(DefaultProvider(), SpotifyProvider())
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import json
+from typing import Any, Callable
+
+from atomic_file import atomic_write_json
+from clock import now
+
+# Bumped whenever the layout changes; older snapshots are then ignored
+STATE_VERSION = 1
+
+
+class StateSnapshot:
+    """A small file holding what a restart would otherwise throw away: when
+    the presence started, where the image rotation got to, what was last
+    shown, and what was playing (see PresenceEngine.save_state).
+
+    Written periodically and on shutdown, atomically (see atomic_write_json).
+    A snapshot older than max_age is ignored: after a long enough break, a
+    fresh start is what should be shown.
+    """
+
+    path: str
+    max_age: float
+    clock: Callable[[], float]
+
+    saves: int
+
+    def __init__(self, path: str = "presence_state.json", max_age: float = 300,
+                 clock: Callable[[], float] = now) -> None:
+        """Creates a new snapshot file. max_age is in seconds."""
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+
+        self.saves = 0
+
+    def load(self) -> tuple[dict[str, Any], float] | None:
+        """Returns the saved state and its age in seconds, or None if there is
+        no usable snapshot (missing, broken, outdated or too old)."""
+        try:
+            with open(self.path, "r") as state_file:
+                snapshot = json.load(state_file)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(snapshot, dict) or snapshot.get("version") != STATE_VERSION:
+            return None
+
+        try:
+            age = self.clock() - float(snapshot["saved_at"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if not 0 <= age <= self.max_age or not isinstance(snapshot.get("state"), dict):
+            return None
+
+        return snapshot["state"], age
+
+    def save(self, state: dict[str, Any]) -> None:
+        """Writes the given state out, atomically."""
+        snapshot = {"version": STATE_VERSION, "saved_at": self.clock(), "state": state}
+
+        try:
+            atomic_write_json(self.path, snapshot)
+        except OSError as e:
+            print(f"Warning: could not save presence state: {e}")
+            return
+
+        self.saves += 1
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import os
+import random
+import sys
+from enum import Enum
+from typing import Callable
+
+from clock import monotonic
+from discord_ipc import find_ipc_paths, ipc_directories
+
+
+class ConnectionState(Enum):
+    """Where the connection to Discord stands."""
+
+    DISCONNECTED = "disconnected"
+    CONNECTING = "connecting"
+    LIVE = "live"
+    DEGRADED = "degraded"
+
+
+def ipc_snapshot() -> frozenset:
+    """Returns a cheap snapshot of where the Discord IPC sockets (or pipes, on
+    Windows) live. It changes whenever a socket is created or removed, i.e.
+    when Discord starts, stops or restarts.
+
+    On Unix this only stats the socket directories, so it is cheap enough to
+    poll several times a second.
+    """
+    if sys.platform == "win32":
+        try:
+            return frozenset(entry.name for entry in os.scandir(r"\\?\pipe")
+                             if entry.name.startswith("discord-ipc-"))
+        except OSError:
+            return frozenset()
+
+    snapshot = set()
+    for directory in ipc_directories():
+        try:
+            snapshot.add((directory, os.stat(directory).st_mtime_ns))
+        except OSError:
+            pass
+
+    return frozenset(snapshot)
+
+
+class ConnectionSupervisor:
+    """Tracks the state of the connection to Discord, and decides when the
+    next reconnect attempt is due.
+
+    Failed attempts back off exponentially (with jitter, capped at
+    max_delay). The wait is cut short as soon as the IPC sockets change, so a
+    freshly started Discord is picked up right away instead of being
+    busy-polled for.
+    """
+
+    base_delay: float
+    max_delay: float
+    clock: Callable[[], float]
+
+    state: ConnectionState
+    failures: int
+    retry_at: float
+    last_error: BaseException | None
+    reconnects: int
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 60.0,
+                 clock: Callable[[], float] = monotonic) -> None:
+        """Creates a new supervisor. Delays are in seconds."""
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+
+        self.state = ConnectionState.DISCONNECTED
+        self.failures = 0
+        self.retry_at = clock()
+        self.last_error = None
+        self.reconnects = 0
+
+        self._snapshot = ipc_snapshot()
+
+    @property
+    def live(self) -> bool:
+        return self.state is ConnectionState.LIVE
+
+    def should_attempt(self) -> bool:
+        """Returns true iff a write (or reconnect) may be attempted now."""
+        return self.state is not ConnectionState.DISCONNECTED or self.clock() >= self.retry_at
+
+    def attempting(self) -> None:
+        """Marks the start of an attempt."""
+        if self.state is ConnectionState.DISCONNECTED:
+            self.state = ConnectionState.CONNECTING
+
+    def record_success(self) -> ConnectionState:
+        """Marks the last attempt as successful. Returns the previous state."""
+        previous = self.state
+        if previous is not ConnectionState.LIVE and self.failures:
+            self.reconnects += 1
+
+        self.state = ConnectionState.LIVE
+        self.failures = 0
+        self.last_error = None
+
+        return previous
+
+    def record_failure(self, error: BaseException) -> ConnectionState:
+        """Marks the last attempt as failed. A single failure on a live
+        connection only degrades it; anything more backs off. Returns the
+        previous state."""
+        previous = self.state
+        self.failures += 1
+        self.last_error = error
+
+        if previous is ConnectionState.LIVE:
+            self.state = ConnectionState.DEGRADED
+            return previous
+
+        self.state = ConnectionState.DISCONNECTED
+        self.retry_at = self.clock() + self.backoff()
+        self._snapshot = ipc_snapshot()
+
+        return previous
+
+    def backoff(self) -> float:
+        """Returns the delay before the next attempt: exponential in the
+        number of consecutive failures, capped, with equal jitter."""
+        delay = min(self.base_delay * 2 ** max(self.failures - 1, 0), self.max_delay)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def sockets_changed(self) -> bool:
+        """Returns true iff the IPC sockets changed since the last check, and
+        at least one of them exists. Cuts any pending backoff short."""
+        snapshot = ipc_snapshot()
+        if snapshot == self._snapshot:
+            return False
+
+        self._snapshot = snapshot
+
+        # On Unix the snapshot only covers the directories, so look inside
+        live_sockets = snapshot if sys.platform == "win32" else find_ipc_paths()
+        if not live_sockets:
+            return False
+
+        self.retry_at = self.clock()
+        return True
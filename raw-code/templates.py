@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from string import Formatter
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from clock import now
+
+
+# The templates used when config.json doesn't say otherwise. These reproduce
+# the presence exactly as it was before templates existed.
+DEFAULT_TEMPLATES = {
+    "default": {
+        "state": "It is {hour}:{minute} {am_pm} (UTC {timezone})",
+        "details": "{weather}",
+        "large_text": "{weekday}, {month} {day}{ordinal}",
+        # Empty: no small image tooltip, as before there was a template for it
+        "small_text": ""
+    },
+    "spotify": {
+        "state": "by {artists}",
+        "details": "{title}",
+        "large_text": "{weather}",
+        "small_text": "It is {hour}:{minute} {am_pm} (UTC {timezone})"
+    }
+}
+
+CLOCK_FIELDS = frozenset({"hour", "hour24", "minute", "am_pm", "weekday", "month",
+                          "day", "ordinal", "year", "timezone"})
+WEATHER_FIELDS = frozenset({"weather", "temp", "feels_like", "description", "city"})
+TRACK_FIELDS = frozenset({"artists", "title"})
+FIELDS = CLOCK_FIELDS | WEATHER_FIELDS | TRACK_FIELDS
+
+# What a template is trial-rendered against when compiled: every field is a
+# string, so a format spec only numbers take ('{hour:02d}') fails right there
+SAMPLE_FIELDS = MappingProxyType({field: "sample" for field in FIELDS})
+
+
+class TemplateError(ValueError):
+    """Raised at startup for a template that can never render."""
+
+
+def get_ordinal_suffix(num: int) -> str:
+    """Returns '-st', '-nd', '-rd', or '-th' for any numeric input."""
+    if num % 100 in (11, 12, 13):
+        return "th"
+
+    return {1: "st", 2: "nd", 3: "rd"}.get(num % 10, "th")
+
+
+def format_timezone(offset: int) -> str:
+    """Formats a UTC offset in seconds as '+5', '-4' or '+5:30'."""
+    sign = "+" if offset >= 0 else "-"
+    hours, seconds = divmod(abs(offset), 3600)
+
+    if seconds:
+        return f"{sign}{hours}:{seconds // 60:02d}"
+
+    return f"{sign}{hours}"
+
+
+@dataclass(frozen=True, slots=True)
+class ClockSnapshot:
+    """Everything the templates need to know about the current time, worked
+    out once per minute."""
+
+    minute_start: float
+    fields: Mapping[str, str]
+
+    @classmethod
+    def at(cls, now: float) -> ClockSnapshot:
+        """Builds the snapshot for the minute containing now."""
+        local = time.localtime(now)
+        weekday, month, am_pm = time.strftime("%A|%B|%p", local).split("|")
+
+        fields = {
+            "hour": str(local.tm_hour % 12 or 12),
+            "hour24": f"{local.tm_hour:02d}",
+            "minute": f"{local.tm_min:02d}",
+            "am_pm": am_pm,
+            "weekday": weekday,
+            "month": month,
+            "day": str(local.tm_mday),
+            "ordinal": get_ordinal_suffix(local.tm_mday),
+            "year": str(local.tm_year),
+            "timezone": format_timezone(local.tm_gmtoff)
+        }
+
+        return cls(now - local.tm_sec - now % 1, MappingProxyType(fields))
+
+
+class ClockCache:
+    """Hands out the ClockSnapshot for the current minute.
+
+    The snapshot (including the timezone and the ordinal day) is only rebuilt
+    once the minute rolls over. DST transitions always fall on a minute
+    boundary, so they are picked up on time too.
+    """
+
+    clock: Callable[[], float]
+
+    def __init__(self, clock: Callable[[], float] = now) -> None:
+        self.clock = clock
+        self._snapshot = None
+
+    def snapshot(self, now: float | None = None) -> ClockSnapshot:
+        now = self.clock() if now is None else now
+        current = self._snapshot
+
+        if current is None or not current.minute_start <= now < current.minute_start + 60:
+            current = self._snapshot = ClockSnapshot.at(now)
+
+        return current
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    """The immutable state a tick renders from: the clock and the weather."""
+
+    clock: ClockSnapshot
+    weather: dict | None
+
+    def fields(self) -> dict[str, str]:
+        """Returns every field a template may use. Weather fields are left
+        out when there is no weather."""
+        fields = dict(self.clock.fields)
+
+        if self.weather is not None:
+            description = " ".join(word.capitalize() for word in self.weather["weather"]["description"].split(" "))
+            temp = f"{round(self.weather["temp"]["temp"])}°C"
+
+            fields["weather"] = f"{temp}, {description}"
+            fields["temp"] = temp
+            fields["description"] = description
+
+            if "feels_like" in self.weather["temp"]:
+                fields["feels_like"] = f"{round(self.weather["temp"]["feels_like"])}°C"
+            if "city" in self.weather.get("meta", {}):
+                fields["city"] = self.weather["meta"]["city"]
+
+        return fields
+
+
+class Template:
+    """A presence string template, using str.format syntax ('It is {hour}').
+
+    Field names and format specs are checked once, when the template is
+    compiled, by rendering it against sample fields. Rendering is a single
+    format_map call; if a field the template needs is missing (e.g.
+    the weather is unavailable), the template renders as None so that line is
+    left out of the presence.
+    """
+
+    source: str
+    fields: frozenset[str]
+
+    def __init__(self, source: str) -> None:
+        try:
+            parsed = list(Formatter().parse(source))
+        except ValueError as e:
+            raise TemplateError(f"Invalid template {source!r}: {e}") from e
+
+        fields = set()
+        for _, field, _, _ in parsed:
+            if field is None:
+                continue
+            if field not in FIELDS:
+                raise TemplateError(f"Unknown field {{{field}}} in template {source!r}")
+            fields.add(field)
+
+        try:
+            source.format_map(SAMPLE_FIELDS)
+        except (KeyError, ValueError, IndexError) as e:
+            raise TemplateError(f"Invalid template {source!r}: {e}") from e
+
+        self.source = source
+        self.fields = frozenset(fields)
+
+    def render(self, fields: Mapping[str, str]) -> str | None:
+        try:
+            return self.source.format_map(fields)
+        except (KeyError, ValueError, IndexError):
+            return None
+
+
+class TemplateSet:
+    """The compiled templates of one presence (state, details, ...)."""
+
+    templates: dict[str, Template]
+
+    def __init__(self, sources: Mapping[str, str]) -> None:
+        self.templates = {key: Template(source) for key, source in sources.items()}
+
+    @classmethod
+    def from_config(cls, name: str, overrides: Mapping[str, str] | None) -> TemplateSet:
+        """Compiles the default templates of the named presence, with any
+        overrides from config.json on top."""
+        sources = dict(DEFAULT_TEMPLATES[name])
+
+        for key, source in (overrides or {}).items():
+            if key not in sources:
+                raise TemplateError(f"Unknown template {name}.{key}")
+            if not isinstance(source, str):
+                raise TemplateError(f"Template {name}.{key} must be a string")
+            sources[key] = source
+
+        return cls(sources)
+
+    def render(self, key: str, fields: Mapping[str, str]) -> str | None:
+        return self.templates[key].render(fields)
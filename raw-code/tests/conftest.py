@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The modules live flat in raw-code, next to this directory. The benchmarks
+# import each other by name, as they are run as scripts.
+RAW_CODE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(RAW_CODE, "benchmarks"))
+sys.path.insert(0, RAW_CODE)
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import json
+import os
+
+import pytest
+
+from atomic_file import atomic_write_json
+
+
+def test_writes_and_replaces(tmp_path) -> None:
+    path = tmp_path / "data.json"
+    atomic_write_json(str(path), {"a": 1})
+    atomic_write_json(str(path), {"a": 2})
+
+    assert json.loads(path.read_text()) == {"a": 2}
+    assert os.listdir(tmp_path) == ["data.json"]
+
+
+def test_failed_write_keeps_the_old_file(tmp_path) -> None:
+    path = tmp_path / "data.json"
+    atomic_write_json(str(path), {"a": 1})
+
+    with pytest.raises(TypeError):
+        atomic_write_json(str(path), {"a": object()})
+
+    assert json.loads(path.read_text()) == {"a": 1}
+    assert os.listdir(tmp_path) == ["data.json"]
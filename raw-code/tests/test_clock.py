@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import asyncio
+
+from clock import VirtualClock
+
+
+def test_sleeps_pass_virtually() -> None:
+    clock = VirtualClock(1_767_571_200)
+    asyncio.run(asyncio.sleep(3600), loop_factory=clock.new_event_loop)
+
+    assert clock.time() == 1_767_571_200 + 3600
+
+
+def test_sleep_shorter_than_the_float_spacing_ends() -> None:
+    # Epoch seconds are only precise to ~2e-7 s, so advancing by 1e-8 alone
+    # leaves the clock where it was
+    clock = VirtualClock(1_767_571_200.1)
+
+    async def sleeps() -> None:
+        for _ in range(100):
+            await asyncio.sleep(1e-8)
+
+    asyncio.run(asyncio.wait_for(sleeps(), 1), loop_factory=clock.new_event_loop)
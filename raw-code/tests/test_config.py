@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+import pytest
+
+from config import ConfigError, parse_config
+
+RAW = {
+    "spotify_api": {"client_id": "id", "client_secret": "secret", "redirect_uri": "http://127.0.0.1:8888/callback"},
+    "general_api_keys": {"weather_api_key": "key", "default_rpc_id": "111", "spotify_rpc_id": "222"},
+    "metadata": {"default_image_list": ["default"], "spotify_image_list": ["spotify"], "city": "Toronto"}
+}
+
+
+@pytest.mark.parametrize("section, key, value", [
+    ("state", "save_interval", 0),
+    ("weather_cache", "ttl", -1),
+    ("weather_cache", "breaker_threshold", 0),
+    ("http", "read_timeout", 0),
+    ("http", "retries", -1),
+    ("http", "retries", 1.5),
+    ("metrics", "port", 0),
+    ("metrics", "port", 65536)
+])
+def test_out_of_range_settings_are_rejected(section, key, value) -> None:
+    with pytest.raises(ConfigError, match=f"{section}.{key}"):
+        parse_config({**RAW, section: {key: value}})
+
+
+def test_settings_at_their_limits_are_accepted() -> None:
+    config = parse_config({**RAW, "http": {"retries": 0}, "metrics": {"port": 65535},
+                           "state": {"save_interval": 0.5}})
+
+    assert (config.http["retries"], config.metrics["port"], config.state["save_interval"]) == (0, 65535, 0.5)
+
+
+def test_persistence_paths_may_be_null() -> None:
+    config = parse_config({**RAW, "weather_cache": {"path": None}, "state": {"path": None}})
+
+    assert config.weather_cache["path"] is None and config.state["path"] is None
+
+    with pytest.raises(ConfigError, match="metrics.host"):
+        parse_config({**RAW, "metrics": {"host": None}})
@@ -0,0 +1,34 @@
+from __future__ import annotations
+
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake Discord uses Unix sockets")
+
+from benchmarks.fake_discord import FakeDiscord
+from discord_ipc import IPCPresence, ServerError, pipe_errors
+
+
+@pytest.fixture
+def discord(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    fake = FakeDiscord(str(tmp_path), 0).start()
+    yield fake
+    fake.stop()
+
+
+def test_server_error_is_not_a_pipe_error(discord) -> None:
+    presence = IPCPresence("222")
+    presence.connect()
+
+    presence.update(details="x" * 129)
+    with pytest.raises(ServerError) as raised:
+        presence.flush()
+    assert not isinstance(raised.value, pipe_errors())
+
+    # The pipe is still good for the next update
+    presence.update(details="fits")
+    presence.flush()
+    assert discord.activities["222"]["details"] == "fits"
+    presence.close()
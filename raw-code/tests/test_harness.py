@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import os
+import sys
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake Discord uses Unix sockets")
+
+from harness import Simulation
+
+
+@pytest.mark.parametrize("runtime_dir", [None, "/run/user/1000"])
+def test_simulation_cleans_up_after_itself(runtime_dir, monkeypatch) -> None:
+    if runtime_dir is None:
+        monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    else:
+        monkeypatch.setenv("XDG_RUNTIME_DIR", runtime_dir)
+
+    with Simulation() as simulation:
+        assert os.environ["XDG_RUNTIME_DIR"] == simulation.discord.directory
+        assert os.path.isdir(simulation.directory)
+
+    assert os.environ.get("XDG_RUNTIME_DIR") == runtime_dir
+    assert not os.path.exists(simulation.directory)
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from email.utils import formatdate
+
+import pytest
+
+from clock import VirtualClock, set_clock
+from http_session import _parse_retry_after
+
+
+@pytest.fixture
+def clock():
+    virtual = VirtualClock(1_767_571_200)
+    previous = set_clock(virtual)
+    yield virtual
+    set_clock(previous)
+
+
+def test_retry_after_date_is_read_against_the_clock(clock) -> None:
+    assert _parse_retry_after(formatdate(clock.time() + 120, usegmt=True)) == 120
+
+
+def test_retry_after_in_the_past_is_zero(clock) -> None:
+    assert _parse_retry_after(formatdate(clock.time() - 60, usegmt=True)) == 0
+    assert _parse_retry_after("30") == 30
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+import sys
+import time
+
+import pytest
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the fake Discord uses Unix sockets")
+
+from benchmarks.fake_discord import FakeDiscord
+from discord_ipc import IPCPresence, find_all_ipc_paths
+from multi_pipe import MultiPipeTransport
+
+
+def settle(transport: MultiPipeTransport, discords: list[FakeDiscord], frames: int) -> None:
+    """Waits until the fakes have taken in the given number of frames."""
+    for session in transport.sessions.values():
+        session.flush()
+
+    deadline = time.monotonic() + 5
+    while sum(discord.frames for discord in discords) < frames and time.monotonic() < deadline:
+        time.sleep(0.005)
+    time.sleep(0.05)
+
+
+@pytest.fixture
+def discords(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    started = [FakeDiscord(str(tmp_path), 0).start()]
+    yield started
+    for discord in started:
+        discord.stop()
+
+
+def transport() -> MultiPipeTransport:
+    return MultiPipeTransport("222", lambda path: IPCPresence("222", path=path), find_all_ipc_paths)
+
+
+def test_reconnect_does_not_replay_the_last_activity(discords) -> None:
+    client = transport()
+    client.connect()
+    client.update(os.getpid(), details="stale")
+    settle(client, discords, 2)
+    assert discords[0].activities["222"]["details"] == "stale"
+
+    client.close()
+    client.connect()
+    settle(client, discords, 3)
+
+    assert "222" not in discords[0].activities
+
+
+def test_pipe_joining_a_live_fan_out_gets_the_last_activity(discords, tmp_path) -> None:
+    client = transport()
+    client.connect()
+    client.update(os.getpid(), details="now")
+
+    discords.append(FakeDiscord(str(tmp_path), 1).start())
+    client.check()
+    settle(client, discords, 4)
+
+    assert len(client.sessions) == 2
+    assert discords[1].activities["222"]["details"] == "now"
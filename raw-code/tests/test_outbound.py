@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from clock import VirtualClock
+from outbound import RATE_LIMIT_PERIOD, RATE_LIMIT_UPDATES, UpdateCoalescer
+
+
+def activity(number: int) -> dict:
+    return {"state": f"Update {number}", "details": "Coalescer test"}
+
+
+def test_burst_is_coalesced_to_the_last_activity() -> None:
+    clock = VirtualClock(0)
+    coalescer = UpdateCoalescer(clock=clock.monotonic)
+
+    sent = [coalescer.submit(activity(number)) for number in range(5)]
+    assert all(payload is not None for payload in sent)
+
+    # The window is full: everything after is held, and only the last kept
+    for number in range(5, 50):
+        assert coalescer.submit(activity(number)) is None
+    assert coalescer.pending == activity(49)
+    assert coalescer.coalesced == 44
+
+    clock.advance(coalescer.next_flush_in())
+    assert coalescer.flush() == activity(49)
+    assert coalescer.pending is None
+
+
+def test_identical_payloads_are_suppressed() -> None:
+    clock = VirtualClock(0)
+    coalescer = UpdateCoalescer(clock=clock.monotonic)
+
+    assert coalescer.submit(activity(1)) == activity(1)
+    assert coalescer.submit(activity(1)) is None
+    assert coalescer.submit({"details": "Coalescer test", "state": "Update 1"}) is None
+    assert (coalescer.sent, coalescer.suppressed) == (1, 2)
+
+    # Until the last payload is forgotten
+    coalescer.reset()
+    assert coalescer.submit(activity(1)) == activity(1)
+
+
+def test_never_more_than_the_rate_limit_in_any_window() -> None:
+    clock = VirtualClock(0)
+    coalescer = UpdateCoalescer(clock=clock.monotonic)
+    sent_at = []
+
+    # A change every 0.7 s for ten minutes, flushing whenever allowed
+    for number in range(850):
+        if coalescer.submit(activity(number)) is not None or coalescer.flush() is not None:
+            sent_at.append(clock.time())
+        clock.advance(0.7)
+
+    for start in sent_at:
+        in_window = [t for t in sent_at if start <= t < start + RATE_LIMIT_PERIOD]
+        assert len(in_window) <= RATE_LIMIT_UPDATES
+
+    # And the limit is actually used, not just respected
+    assert len(sent_at) >= 600 / RATE_LIMIT_PERIOD * RATE_LIMIT_UPDATES - RATE_LIMIT_UPDATES
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import pytest
+
+from clock import VirtualClock
+from poll_scheduler import PollScheduler
+from track_state import TrackState
+
+
+def playing(progress: float, duration: float = 180, track_id: str = "a") -> TrackState:
+    """A track that is playing, progress seconds in."""
+    return TrackState(id=track_id, name="Track", artists=("Artist",), progress=int(progress * 1000),
+                      duration=int(duration * 1000), is_playing=True)
+
+
+@pytest.fixture
+def clock() -> VirtualClock:
+    return VirtualClock(1_767_571_200)
+
+
+def test_first_poll_is_due_straight_away(clock) -> None:
+    assert PollScheduler(clock.monotonic).due()
+
+
+def test_playing_polls_every_playing_interval_mid_track(clock) -> None:
+    scheduler = PollScheduler(clock.monotonic)
+    scheduler.observe(playing(10))
+
+    assert scheduler.next_delay() == 5.0
+    clock.advance(2)
+    assert scheduler.next_delay() == 3.0
+
+
+def test_polls_tighten_around_the_end_of_the_track(clock) -> None:
+    scheduler = PollScheduler(clock.monotonic)
+    scheduler.observe(playing(177))
+
+    # Wakes up boundary_lead before the end, then polls every tight_interval
+    assert scheduler.next_delay() == pytest.approx(2.5)
+    clock.advance(2.5)
+    scheduler.observe(playing(179.5))
+    assert scheduler.next_delay() == pytest.approx(0.5)
+
+    # Until the next track shows up
+    clock.advance(0.5)
+    assert scheduler.observe(playing(0, track_id="b"))
+    assert scheduler.next_delay() == 5.0
+
+
+def test_idle_polls_back_off_up_to_the_cap(clock) -> None:
+    scheduler = PollScheduler(clock.monotonic, jitter=0)
+    delays = []
+
+    for _ in range(6):
+        scheduler.observe(None)
+        delays.append(scheduler.next_delay())
+        clock.advance(delays[-1])
+
+    assert delays == [5.0, 10.0, 20.0, 30.0, 30.0, 30.0]
+
+
+def test_pause_counts_as_idle(clock) -> None:
+    scheduler = PollScheduler(clock.monotonic, jitter=0)
+    scheduler.observe(playing(60))
+
+    paused = TrackState(id="a", name="Track", artists=("Artist",), progress=60000, duration=180000, is_playing=False)
+    assert scheduler.observe(paused)
+    assert scheduler.next_delay() == 5.0
+
+
+def test_idle_jitter_stays_within_bounds(clock) -> None:
+    scheduler = PollScheduler(clock.monotonic, jitter=0.1)
+
+    for _ in range(200):
+        scheduler.observe(None)
+        delay = scheduler.next_delay()
+        cap = min(5.0 * 2.0 ** max(scheduler.idle_streak - 1, 0), 30.0)
+
+        assert cap * 0.9 <= delay <= cap
+        # The same until the next poll
+        assert scheduler.next_delay() == delay
+        clock.advance(delay)
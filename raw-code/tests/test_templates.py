@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import pytest
+
+from config import ConfigError, parse_config
+from templates import SAMPLE_FIELDS, Template, TemplateError, TemplateSet
+
+
+def raw_config(templates: dict | None = None) -> dict:
+    raw = {
+        "spotify_api": {"client_id": "test", "client_secret": "test", "redirect_uri": "http://127.0.0.1:8888/callback"},
+        "general_api_keys": {"weather_api_key": "test", "default_rpc_id": "111", "spotify_rpc_id": "222"},
+        "metadata": {"default_image_list": ["default"], "spotify_image_list": ["spotify"], "city": "Toronto"}
+    }
+    if templates is not None:
+        raw["templates"] = templates
+    return raw
+
+
+def test_renders_fields() -> None:
+    assert Template("It is {hour}:{minute}").render({"hour": "9", "minute": "05"}) == "It is 9:05"
+
+
+def test_missing_field_renders_none() -> None:
+    assert Template("{weather}").render({"hour": "9"}) is None
+
+
+def test_string_format_spec_is_allowed() -> None:
+    assert Template("{hour:>3}").render({"hour": "9"}) == "  9"
+
+
+@pytest.mark.parametrize("source", ["{hour:02d}", "{minute:.1f}", "{hour!z}", "{nope}", "{hour"])
+def test_invalid_template_fails_to_compile(source: str) -> None:
+    with pytest.raises(TemplateError):
+        Template(source)
+
+
+def test_default_templates_compile() -> None:
+    for name in ("default", "spotify"):
+        templates = TemplateSet.from_config(name, None)
+        for key in templates.templates:
+            assert templates.render(key, SAMPLE_FIELDS) is not None
+
+
+def test_bad_format_spec_is_a_config_error() -> None:
+    with pytest.raises(ConfigError, match="Unknown format code"):
+        parse_config(raw_config({"default": {"state": "{hour:02d}"}}))
+
+
+def test_valid_override_is_accepted() -> None:
+    config = parse_config(raw_config({"default": {"state": "{hour24}:{minute}"}}))
+    assert config.templates["default"]["state"] == "{hour24}:{minute}"
+
+
+def default_activity(small_text: str) -> dict:
+    """Returns what EnhancedRPC sends with the given small_text template."""
+    import custom_presence
+
+    custom_presence.configure(parse_config(raw_config({"default": {"small_text": small_text}})))
+    rpc = custom_presence.EnhancedRPC()
+    rpc.send_activity = lambda activity, pid, payload_override: activity
+    return rpc.update()
+
+
+def test_default_small_text_is_sent() -> None:
+    assert default_activity("Local time: {hour}:{minute}")["small_text"].startswith("Local time: ")
+
+
+def test_empty_default_small_text_is_left_out() -> None:
+    assert default_activity("")["small_text"] is None
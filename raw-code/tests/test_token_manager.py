@@ -0,0 +1,29 @@
+from __future__ import annotations
+
+import json
+
+from token_manager import TokenManager
+
+TOKEN = {"access_token": "access", "refresh_token": "refresh", "expires_at": 1}
+
+
+def test_token_is_saved_with_its_client(tmp_path) -> None:
+    path = tmp_path / "token.json"
+    TokenManager(str(path), client_id="a").save_token_to_cache(dict(TOKEN))
+
+    assert json.loads(path.read_text())["client_id"] == "a"
+    assert TokenManager(str(path), client_id="a").get_cached_token() == TOKEN
+
+
+def test_token_of_another_client_is_ignored(tmp_path) -> None:
+    path = tmp_path / "token.json"
+    TokenManager(str(path), client_id="a").save_token_to_cache(dict(TOKEN))
+
+    assert TokenManager(str(path), client_id="b").get_cached_token() is None
+
+
+def test_untagged_token_is_kept(tmp_path) -> None:
+    path = tmp_path / "token.json"
+    path.write_text(json.dumps(TOKEN))
+
+    assert TokenManager(str(path), client_id="a").get_cached_token() == TOKEN
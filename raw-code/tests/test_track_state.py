@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+from benchmarks.bench_track_state import MAX_RETAINED, fake_response, old_path, retained
+from track_state import TrackInfo, TrackState
+
+
+def test_parses_the_fields_the_presence_uses() -> None:
+    track = TrackState.from_response(fake_response(3))
+
+    assert track.id == f"{3:022d}"
+    assert track.name == "Track 3"
+    assert track.artists == ("Artist 3", "Artist 4")
+    assert (track.progress, track.duration, track.is_playing) == (3000, 200000, True)
+
+
+def test_nothing_playing_is_none() -> None:
+    assert TrackState.from_response(None) is None
+
+
+def test_holds_less_than_the_raw_payload() -> None:
+    held = retained(TrackState.from_response)
+
+    assert held <= MAX_RETAINED
+    assert held * 4 < retained(old_path)
+
+
+def mpris_properties(track_id: str) -> dict:
+    """GetAll's answer for a playing track, wrapped in D-Bus variants."""
+    metadata = {"mpris:trackid": ("o", track_id), "xesam:title": ("s", "Title"), "xesam:artist": ("as", ["Artist"]),
+                "mpris:length": ("x", 200_000_000)}
+    return {"Metadata": ("a{sv}", metadata), "PlaybackStatus": ("s", "Playing"), "Position": ("x", 3_000_000)}
+
+
+def test_spotify_tracks_get_a_play_button() -> None:
+    for track in (TrackState.from_response(fake_response(3)),
+                  TrackState.from_mpris(mpris_properties("/com/spotify/track/4uLU6hMCjMI75M1A2tKUQC"))):
+        assert TrackInfo.from_track(track).buttons[0]["url"] == f"spotify://track/{track.id}"
+
+
+def test_other_players_get_no_play_button() -> None:
+    track = TrackState.from_mpris(mpris_properties("/org/mpris/MediaPlayer2/Track/3"))
+
+    assert not track.on_spotify
+    assert TrackInfo.from_track(track).buttons is None
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+from weather_cache import WeatherCache
+
+
+def cache(path, source: str, fetched: list[str]) -> WeatherCache:
+    def fetch(city: str) -> dict:
+        fetched.append(source)
+        return {"source": source}
+
+    return WeatherCache(fetch, path=str(path), clock=lambda: 1000.0, source=source)
+
+
+def test_entries_are_kept_per_source(tmp_path) -> None:
+    path, fetched = tmp_path / "weather_cache.json", []
+
+    assert cache(path, "forecast", fetched).get("Toronto") == {"source": "forecast"}
+    assert cache(path, "forecast", fetched).get("Toronto") == {"source": "forecast"}
+    assert fetched == ["forecast"]
+
+    current = cache(path, "current", fetched)
+    assert current.last_value("Toronto") is None
+    assert current.get("Toronto") == {"source": "current"}
+    assert (current.misses, fetched) == (1, ["forecast", "current"])
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Callable
+
+from atomic_file import atomic_write_json
+from clock import now
+from spotipy import SpotifyOAuth
+from spotipy.cache_handler import CacheHandler
+
+
+class TokenManager(CacheHandler):
+    """Keeps the Spotify OAuth token in memory, and fresh.
+
+    Used as the cache handler of every SpotifyOAuth in the process, so they
+    all share one token, and reading it never touches the disk. The token
+    file is read once at startup and written through (atomically) whenever
+    the token changes, so it survives a restart.
+
+    Once started, a background thread refreshes the token refresh_margin
+    seconds before it expires. spotipy only refreshes inline once less than a
+    minute is left, so the presence never has to wait on a refresh unless the
+    background one has been failing.
+    """
+
+    path: str | None
+    client_id: str | None
+    refresh_margin: float
+    retry_interval: float
+    clock: Callable[[], float]
+    auth_manager: SpotifyOAuth | None
+
+    refreshes: int
+    refresh_failures: int
+    last_refresh_duration: float | None
+    last_error: BaseException | None
+
+    def __init__(self, path: str | None = ".cache", refresh_margin: float = 300,
+                 retry_interval: float = 60, clock: Callable[[], float] = now,
+                 client_id: str | None = None) -> None:
+        """Creates a new token manager. Takes the token file (spotipy's
+        default .cache, or None to keep the token in memory only), and the
+        Spotify client id the token is for: a token saved for another client
+        is ignored, as it can't be refreshed with this one's credentials.
+        Times are in seconds."""
+        self.path = path
+        self.client_id = client_id
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.clock = clock
+        self.auth_manager = None
+
+        self.refreshes = 0
+        self.refresh_failures = 0
+        self.last_refresh_duration = None
+        self.last_error = None
+
+        self._token_info = None
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+        self._load()
+
+    def get_cached_token(self) -> dict | None:
+        return self._token_info
+
+    def save_token_to_cache(self, token_info: dict) -> None:
+        self._token_info = token_info
+        self._save()
+
+        # Reschedules the background refresh for the new expiry
+        self._changed.set()
+
+    def expires_in(self) -> float | None:
+        """Returns how many seconds the current token has left, or None if
+        there is no token yet."""
+        token_info = self._token_info
+        if token_info is None:
+            return None
+
+        return token_info["expires_at"] - self.clock()
+
+    def start(self, auth_manager: SpotifyOAuth) -> None:
+        """Starts refreshing in the background, through the given auth
+        manager. Does nothing if already started."""
+        with self._lock:
+            if self._thread is not None:
+                return
+
+            self.auth_manager = auth_manager
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="SpotifyTokenRefresh")
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stops the background refresh."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+        if thread is not None:
+            self._stopped.set()
+            self._changed.set()
+            thread.join(timeout=5)
+
+    def refresh(self) -> dict:
+        """Refreshes the token right away, and returns the new one. Raises
+        whatever spotipy raises if it couldn't."""
+        token_info = self._token_info
+        if token_info is None or self.auth_manager is None:
+            raise RuntimeError("No Spotify token to refresh yet")
+
+        started = time.perf_counter()
+        try:
+            # Saves the new token through save_token_to_cache
+            token_info = self.auth_manager.refresh_access_token(token_info["refresh_token"])
+        except Exception as e:
+            self.refresh_failures += 1
+            self.last_error = e
+            raise
+        finally:
+            self.last_refresh_duration = time.perf_counter() - started
+
+        self.refreshes += 1
+        self.last_error = None
+
+        return token_info
+
+    def stats(self) -> dict[str, int | float | None]:
+        """Returns the refresh counters and timings."""
+        return {
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "last_refresh_duration": self.last_refresh_duration,
+            "expires_in": self.expires_in()
+        }
+
+    def _run(self) -> None:
+        """Runs on its own thread: sleeps until the token is due for a
+        refresh (or changes), then refreshes it."""
+        delay = 0.0
+
+        while not self._stopped.is_set():
+            if self._changed.wait(delay):
+                self._changed.clear()
+
+            if self._stopped.is_set():
+                return
+
+            expires_in = self.expires_in()
+            if expires_in is None:
+                # Nothing to refresh until the user has logged in
+                delay = None
+                continue
+
+            delay = expires_in - self.refresh_margin
+            if delay > 0:
+                continue
+
+            try:
+                self.refresh()
+                self._changed.clear()  # That change was ours
+
+                # Never refresh more often than retry_interval, however
+                # short lived the new token is
+                delay = max(self.expires_in() - self.refresh_margin, self.retry_interval)
+            except Exception as e:
+                print(f"Warning: Spotify token refresh failed: {e}")
+                delay = self.retry_interval
+
+    def _load(self) -> None:
+        """Reads the token file, if there is one."""
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, "r") as token_file:
+                token_info = json.load(token_file)
+        except (OSError, ValueError):
+            token_info = None
+
+        if not isinstance(token_info, dict):
+            self._token_info = None
+            return
+
+        # Files written before tokens were tagged are taken as they are
+        owner = token_info.pop("client_id", None)
+        if owner is not None and self.client_id is not None and owner != self.client_id:
+            print("\33[97mSpotify client changed: log in again")
+            token_info = None
+
+        self._token_info = token_info
+
+    def _save(self) -> None:
+        """Writes the token to disk, atomically (see atomic_write_json)."""
+        if self.path is None:
+            return
+
+        try:
+            with self._save_lock:
+                atomic_write_json(self.path, {**self._token_info, "client_id": self.client_id})
+        except OSError as e:
+            print(f"Warning: could not save Spotify token: {e}")
@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class TrackState:
+    """What Spotify is playing, parsed once out of a currently_playing
+    payload. Only the handful of fields the presence actually uses are kept,
+    so the (rather large) raw response can be thrown away right after the
+    poll.
+
+    Progress and duration are in milliseconds, like the Spotify API.
+    album_art is the URL of the largest album cover, if there is one.
+    on_spotify is false for other MPRIS players, whose ids Spotify can't play.
+    """
+
+    id: str | None
+    name: str
+    artists: tuple[str, ...]
+    progress: int
+    duration: int
+    is_playing: bool
+    album_art: str | None = None
+    on_spotify: bool = True
+
+    @classmethod
+    def from_response(cls, values: dict | None) -> TrackState | None:
+        """Parses a currently_playing payload. Returns None if nothing (or
+        nothing we can show, e.g. an ad) is playing. Local files have no id."""
+        try:
+            item = values["item"]
+
+            return cls(id=item["id"],
+                       name=item["name"],
+                       artists=tuple(artist["name"] for artist in item["artists"]),
+                       progress=values["progress_ms"] or 0,
+                       duration=item["duration_ms"],
+                       is_playing=bool(values["is_playing"]),
+                       album_art=_largest_image(item.get("album")))
+
+        except (TypeError, KeyError):
+            return None
+
+    @classmethod
+    def from_mpris(cls, properties: dict) -> TrackState | None:
+        """Parses the properties of an MPRIS player, as returned by GetAll on
+        org.mpris.MediaPlayer2.Player (i.e. still wrapped in D-Bus variants).
+        Returns None if nothing (or an ad) is playing."""
+        try:
+            properties = {key: value for key, (_, value) in properties.items()}
+            metadata = {key: value for key, (_, value) in properties["Metadata"].items()}
+            status = properties["PlaybackStatus"]
+
+            # e.g. /com/spotify/track/<id>, or spotify:track:<id> on older clients
+            track_path = str(metadata["mpris:trackid"])
+            kind, track_id = track_path.replace(":", "/").rstrip("/").split("/")[-2:]
+            on_spotify = track_path.startswith(("/com/spotify/track/", "spotify:track:"))
+
+            if status == "Stopped" or kind == "ad":
+                return None
+
+            return cls(id=track_id,
+                       name=metadata["xesam:title"],
+                       artists=tuple(metadata.get("xesam:artist", ())),
+                       progress=properties.get("Position", 0) // 1000,
+                       duration=metadata.get("mpris:length", 0) // 1000,
+                       is_playing=status == "Playing",
+                       album_art=metadata.get("mpris:artUrl") or None,
+                       on_spotify=on_spotify)
+
+        except (TypeError, KeyError, ValueError):
+            return None
+
+    @property
+    def remaining(self) -> float:
+        """Seconds left in the track, as of the poll."""
+        return max(self.duration - self.progress, 0) / 1000
+
+
+def _largest_image(album: dict | None) -> str | None:
+    """Returns the URL of the largest image of an album, if it has any."""
+    try:
+        return max(album["images"], key=lambda image: image.get("width") or 0)["url"]
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+@dataclass(frozen=True, slots=True)
+class TrackInfo:
+    """Everything about a track the presence renders that doesn't change
+    while it plays, worked out once per track."""
+
+    artists: str
+    title: str
+    buttons: list[dict[str, str]] | None
+    album_art: str | None
+    duration: int
+
+    @classmethod
+    def from_track(cls, track: TrackState) -> TrackInfo:
+        # Only Spotify can open the track (and local files have no id at all)
+        buttons = None
+        if track.on_spotify and track.id is not None:
+            buttons = [{"label": "Play on Spotify", "url": f"spotify://track/{track.id}"}]
+
+        return cls(artists=", ".join(track.artists),
+                   title=track.name,
+                   buttons=buttons,
+                   album_art=track.album_art,
+                   duration=track.duration)
+
+
+class TrackCache:
+    """A bounded LRU cache of TrackInfo, keyed by track id. Polls of a track
+    that was seen recently skip all the string work.
+
+    Tracks without an id (local files) are never cached.
+    """
+
+    size: int
+    hits: int
+    misses: int
+
+    def __init__(self, size: int = 64) -> None:
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+        self._entries: OrderedDict[str, TrackInfo] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, track: TrackState) -> TrackInfo:
+        """Returns the TrackInfo of the given track, from the cache if
+        possible."""
+        info = self._entries.get(track.id) if track.id is not None else None
+
+        if info is not None:
+            self._entries.move_to_end(track.id)
+            self.hits += 1
+            return info
+
+        self.misses += 1
+        info = TrackInfo.from_track(track)
+
+        if track.id is not None and self.size > 0:
+            self._entries[track.id] = info
+            if len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+        return info
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import threading
+from concurrent.futures import Future
+from typing import Callable
+
+from atomic_file import atomic_write_json
+from clock import now
+
+
+class WeatherError(Exception):
+    """Raised when the weather provider answered with something unusable."""
+
+
+class WeatherCache:
+    """A per-city weather cache, persisted to disk.
+
+    Fresh entries are served straight from memory. Stale entries (older than
+    ttl, but younger than max_staleness) are still served while a background
+    thread fetches a replacement. Only a missing or hopelessly stale entry
+    makes the caller wait on the network.
+
+    Concurrent callers asking for the same city share one fetch, so the
+    default and Spotify presences can never trigger duplicate API calls.
+
+    Entries are tagged with the source they were fetched from ("current" or
+    "forecast"), so that after switching weather_cache.source, the other
+    kind's entries in the file count as a miss rather than being served.
+    """
+
+    fetcher: Callable[[str], dict]
+    source: str | None
+    path: str | None
+    ttl: float
+    max_staleness: float
+    clock: Callable[[], float]
+
+    hits: int
+    stale_hits: int
+    misses: int
+    fetches: int
+    fetch_failures: int
+
+    def __init__(self, fetcher: Callable[[str], dict], path: str | None = "weather_cache.json",
+                 ttl: float = 1800, max_staleness: float = 3 * 3600,
+                 clock: Callable[[], float] = now, source: str | None = None) -> None:
+        """Creates a new cache. Takes the function used to fetch the weather
+        for a city, the file the cache is persisted to (None to keep it in
+        memory only), and what the fetcher fetches. Times are in seconds."""
+        self.fetcher = fetcher
+        self.source = source
+        self.path = path
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self.clock = clock
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.fetch_failures = 0
+
+        self._entries: dict[str, dict] = {}
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+        self._load()
+
+    def get(self, city: str, wait: bool = True) -> dict | None:
+        """Returns the weather for the given city, following the
+        stale-while-revalidate rules laid out above. With wait false, a miss
+        doesn't wait on the fetch either: it is started in the background,
+        and None is returned for now."""
+        entry = self._entries.get(city)
+        age = self.clock() - entry["fetched_at"] if entry is not None else None
+
+        if age is not None and age <= self.ttl:
+            self.hits += 1
+            return entry["value"]
+
+        if age is not None and age <= self.max_staleness:
+            self.stale_hits += 1
+            self.refresh_in_background(city)
+            return entry["value"]
+
+        self.misses += 1
+        if not wait:
+            self.refresh_in_background(city)
+            return None
+
+        return self.refresh(city)
+
+    def refresh(self, city: str) -> dict | None:
+        """Fetches the weather for the given city right away, and waits for it.
+        Joins the fetch already in flight for that city, if there is one."""
+        with self._lock:
+            future = self._inflight.get(city)
+            owner = future is None
+            if owner:
+                future = self._inflight[city] = Future()
+
+        if owner:
+            self._run_fetch(city, future)
+
+        return future.result()
+
+    def refresh_in_background(self, city: str) -> None:
+        """Starts a fetch for the given city on a background thread, unless
+        one is already in flight."""
+        with self._lock:
+            if city in self._inflight:
+                return
+            future = self._inflight[city] = Future()
+
+        # Nobody waits on a background fetch, so mark its failure as seen
+        future.add_done_callback(lambda f: f.exception())
+        threading.Thread(target=self._run_fetch, args=(city, future),
+                         daemon=True, name="WeatherCacheRefresh").start()
+
+    def last_value(self, city: str) -> dict | None:
+        """Returns the last weather fetched for the given city, however old,
+        or None if there never was one. Never touches the network."""
+        entry = self._entries.get(city)
+        return entry["value"] if entry is not None else None
+
+    def expires_in(self, city: str) -> float:
+        """Returns how many seconds are left before the entry for the given
+        city goes stale. Negative (or zero) if it already has."""
+        entry = self._entries.get(city)
+        if entry is None:
+            return 0.0
+
+        return entry["fetched_at"] + self.ttl - self.clock()
+
+    def stats(self) -> dict[str, int]:
+        """Returns the hit/miss counters."""
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "fetch_failures": self.fetch_failures
+        }
+
+    def _run_fetch(self, city: str, future: Future) -> None:
+        """Runs the fetcher, stores the result and settles the future."""
+        self.fetches += 1
+
+        try:
+            value = self.fetcher(city)
+        except Exception as e:
+            self.fetch_failures += 1
+            with self._lock:
+                del self._inflight[city]
+            future.set_exception(e)
+            return
+
+        with self._lock:
+            self._entries[city] = {"fetched_at": self.clock(), "source": self.source, "value": value}
+            del self._inflight[city]
+
+        self._save()
+        future.set_result(value)
+
+    def _load(self) -> None:
+        """Loads the persisted entries, if any. A missing or broken file just
+        means a cold start, and entries of another source are left out."""
+        if self.path is None:
+            return
+
+        try:
+            with open(self.path, "r") as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+
+        if isinstance(entries, dict):
+            self._entries = {city: entry for city, entry in entries.items()
+                             if isinstance(entry, dict) and "fetched_at" in entry and "value" in entry
+                             and entry.get("source") == self.source}
+
+    def _save(self) -> None:
+        """Writes the entries to disk, atomically (see atomic_write_json)."""
+        if self.path is None:
+            return
+
+        with self._lock:
+            entries = dict(self._entries)
+
+        try:
+            with self._save_lock:
+                atomic_write_json(self.path, entries)
+        except OSError as e:
+            print(f"Warning: could not save weather cache: {e}")
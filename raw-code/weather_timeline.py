@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+
+from weather_cache import WeatherError
+
+# OpenWeather's forecast comes in 3 hour steps. 16 of them cover the next two
+# days, which is far longer than a timeline is ever kept for.
+FORECAST_URL = "https://api.openweathermap.org/data/2.5/forecast"
+FORECAST_STEP = 3 * 3600
+FORECAST_POINTS = 16
+
+
+def parse_forecast(response: dict) -> dict:
+    """Returns the timeline in an OpenWeather forecast response: every point
+    in the same shape as the current weather (see fetch_current_weather),
+    plus its time ("dt", in epoch seconds). Plain JSON, so the weather cache
+    can persist it as-is."""
+    try:
+        points = [
+            {
+                "dt": point["dt"],
+                "temp": {
+                    "feels_like": point["main"]["feels_like"],
+                    "temp_min": point["main"]["temp_min"],
+                    "temp_nax": point["main"]["temp_max"],
+                    "temp": point["main"]["temp"]
+                },
+                "weather": {
+                    "description": point["weather"][0]["description"],
+                    "main": point["weather"][0]["main"]
+                }
+            }
+            for point in response["list"]
+        ]
+
+        timeline = {
+            "points": sorted(points, key=lambda point: point["dt"]),
+            "meta": {
+                "city": response["city"]["name"],
+                "country": response["city"]["country"]
+            }
+        }
+    except (KeyError, IndexError, TypeError) as e:
+        raise WeatherError(f"Unexpected forecast from OpenWeather: {e!r}") from e
+
+    if not points:
+        raise WeatherError("Empty forecast from OpenWeather")
+
+    return timeline
+
+
+class WeatherTimeline:
+    """Serves the weather at any moment from a fetched forecast, without
+    touching the network.
+
+    Temperatures are interpolated linearly between the two forecast points
+    either side of the moment; the conditions (description) are those of the
+    nearer one. Before the first point (up to one step away, as the forecast
+    starts at the next step) the first point is used as-is.
+    """
+
+    points: list[dict]
+    times: list[float]
+    meta: dict
+
+    def __init__(self, timeline: dict) -> None:
+        """Wraps a timeline, as returned by parse_forecast."""
+        self.points = timeline["points"]
+        self.times = [point["dt"] for point in self.points]
+        self.meta = timeline["meta"]
+
+    @property
+    def ends_at(self) -> float:
+        """When the timeline runs out, in epoch seconds."""
+        return self.times[-1] + FORECAST_STEP
+
+    def covers(self, at: float) -> bool:
+        return self.times[0] - FORECAST_STEP <= at <= self.ends_at
+
+    def at(self, at: float) -> dict | None:
+        """Returns the weather at the given moment (epoch seconds), in the
+        same shape as the current weather, or None if the timeline doesn't
+        cover it."""
+        if not self.covers(at):
+            return None
+
+        index = bisect_right(self.times, at)
+        if index == 0:
+            return self._weather(self.points[0], self.points[0], 0.0)
+        if index == len(self.points):
+            return self._weather(self.points[-1], self.points[-1], 0.0)
+
+        before, after = self.points[index - 1], self.points[index]
+        weight = (at - before["dt"]) / (after["dt"] - before["dt"])
+
+        return self._weather(before, after, weight)
+
+    def _weather(self, before: dict, after: dict, weight: float) -> dict:
+        temp = {key: before["temp"][key] + (after["temp"][key] - before["temp"][key]) * weight
+                for key in before["temp"]}
+
+        return {
+            "temp": temp,
+            "weather": (before if weight < 0.5 else after)["weather"],
+            "meta": self.meta
+        }
+
+
+# The timeline last asked for, so that it isn't rebuilt on every render
+_last_timeline: tuple[dict, WeatherTimeline] | None = None
+
+
+def weather_at(value: dict | None, at: float) -> dict | None:
+    """Returns the weather at the given moment from a weather cache value:
+    looked up in the timeline if it is a forecast, returned as-is if it is
+    the current weather (or None)."""
+    global _last_timeline
+
+    if value is None or "points" not in value:
+        return value
+
+    last = _last_timeline
+    if last is None or last[0] is not value:
+        last = _last_timeline = (value, WeatherTimeline(value))
+
+    return last[1].at(at)